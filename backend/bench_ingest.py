@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Ingest format benchmark for RootGuard Bot
+
+Compares the JSON ingest body (what /api/sensors/ingest parses and
+validates) with binary frames (services.binary_ingest), each plain and
+gzipped, on the same generated readings: bytes per reading on the wire and
+readings decoded per second into ingest rows.
+
+Usage: python bench_ingest.py [--readings 100000] [--batch 100] [--repeat 5]
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from schemas.sensor_schemas import SensorReadingIngest
+from services.binary_ingest import decode_frames, encode_frame
+
+
+def generate(count: int, seed: int = 42) -> List[Dict]:
+    """A random walk like the simulator's, one reading every 5 minutes"""
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1)
+    values = {"water_level": 70.0, "flow_rate": 12.0, "turbidity": 85.0, "soil_moisture": 45.0}
+    limits = {"water_level": 100, "flow_rate": 20, "turbidity": 100, "soil_moisture": 100}
+    readings = []
+    for n in range(count):
+        reading = {"device_id": "borewell-1"}
+        for name, value in values.items():
+            values[name] = round(min(limits[name], max(0.0, value + rng.uniform(-2, 2))), 1)
+            reading[name] = values[name]
+        reading["vibration_status"] = "high" if rng.random() < 0.05 else "low"
+        reading["timestamp"] = start + timedelta(seconds=300 * n)
+        readings.append(reading)
+    return readings
+
+
+def json_body(batch: List[Dict]) -> bytes:
+    return json.dumps(
+        [dict(r, timestamp=r["timestamp"].isoformat()) for r in batch], separators=(",", ":")
+    ).encode()
+
+
+def decode_json(body: bytes) -> List[Dict]:
+    # What the endpoint does: parse, then validate every reading
+    return [SensorReadingIngest.model_validate(r).model_dump() for r in json.loads(body)]
+
+
+def measure(bodies: List[bytes], decode: Callable, repeat: int) -> float:
+    """Best decode rate in readings per second"""
+    best = float("inf")
+    total = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        total = sum(len(decode(body)) for body in bodies)
+        best = min(best, time.perf_counter() - started)
+    return total / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare JSON and binary ingest payloads")
+    parser.add_argument("--readings", type=int, default=100_000)
+    parser.add_argument("--batch", type=int, default=100, help="Readings per request or datagram")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    readings = generate(args.readings)
+    batches = [readings[i:i + args.batch] for i in range(0, len(readings), args.batch)]
+
+    json_bodies = [json_body(batch) for batch in batches]
+    binary_bodies = [encode_frame(batch, "borewell-1") for batch in batches]
+    formats = [
+        ("json", json_bodies, decode_json),
+        ("json+gzip", [gzip.compress(b) for b in json_bodies], lambda b: decode_json(gzip.decompress(b))),
+        ("binary", binary_bodies, decode_frames),
+        ("binary+gzip", [gzip.compress(b) for b in binary_bodies], lambda b: decode_frames(gzip.decompress(b))),
+    ]
+
+    # Same rows either way (binary keeps the stored precision of one decimal)
+    assert decode_frames(binary_bodies[0]) == [dict(r) for r in batches[0]]
+
+    print(f"{args.readings} readings in batches of {args.batch}")
+    print(f"  {'format':<12} {'bytes/reading':>14} {'vs json':>8} {'readings/s':>12} {'vs json':>8}")
+    baseline_size = baseline_rate = None
+    for name, bodies, decode in formats:
+        per_reading = sum(len(b) for b in bodies) / args.readings
+        rate = measure(bodies, decode, args.repeat)
+        baseline_size = baseline_size or per_reading
+        baseline_rate = baseline_rate or rate
+        print(f"  {name:<12} {per_reading:>14.1f} {per_reading / baseline_size:>7.2f}x "
+              f"{rate:>12,.0f} {rate / baseline_rate:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Reading storage benchmark for RootGuard Bot
+
+Builds two throwaway SQLite databases holding the same generated readings:
+one in the layout used up to schema version 9 (REAL columns, 'low'/'high'
+text, ISO datetime text) and one in the compact layout of models.sensor
+(tenths, a vibration flag, epoch milliseconds). Reports bytes per reading
+for the table and its indexes, and how fast each scans: an SQL aggregate
+over every row, and a time-window fetch decoded into Python values (what
+analytics and the history endpoint do).
+
+Usage: python bench_storage.py [--readings 500000] [--devices 4] [--repeat 3]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import timedelta
+from typing import Callable, Dict, List
+
+from sqlalchemy import (
+    Column, DateTime, Float, Index, Integer, MetaData, String, Table, create_engine, select, text,
+)
+
+from bench_ingest import generate
+from models.sensor import SensorReading
+
+# sensor_readings as it was before schema version 10
+legacy_metadata = MetaData()
+legacy_readings = Table(
+    "sensor_readings",
+    legacy_metadata,
+    Column("id", Integer, primary_key=True, index=True),
+    Column("device_id", String(50), nullable=False),
+    Column("water_level", Float, nullable=False),
+    Column("flow_rate", Float, nullable=False),
+    Column("turbidity", Float, nullable=False),
+    Column("vibration_status", String(10), nullable=False),
+    Column("soil_moisture", Float, nullable=False),
+    Column("timestamp", DateTime(timezone=True)),
+    Column("change_seq", Integer, nullable=True),
+    Index("ix_sensor_readings_device_timestamp", "device_id", "timestamp"),
+    Index("ix_sensor_readings_change_seq", "change_seq"),
+)
+
+compact_metadata = MetaData()
+compact_readings = SensorReading.__table__.to_metadata(compact_metadata)
+
+
+def build(path: str, table: Table, readings: List[Dict]):
+    engine = create_engine(f"sqlite:///{path}")
+    table.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text("PRAGMA synchronous = OFF"))
+        for start in range(0, len(readings), 50_000):
+            connection.execute(table.insert(), readings[start:start + 50_000])
+    with engine.connect() as connection:
+        connection.execute(text("VACUUM"))
+    return engine
+
+
+def sizes(path: str) -> Dict[str, int]:
+    """Bytes used by the readings table and each of its indexes"""
+    connection = sqlite3.connect(path)
+    try:
+        rows = connection.execute(
+            "SELECT name, SUM(pgsize) FROM dbstat WHERE name LIKE '%sensor_readings%' GROUP BY name"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        # SQLite built without dbstat: whole file only
+        rows = [("database", os.path.getsize(path))]
+    finally:
+        connection.close()
+    return dict(rows)
+
+
+def best_rate(run: Callable[[], int], repeat: int) -> float:
+    """Best rows per second over `repeat` runs"""
+    best = float("inf")
+    rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = run()
+        best = min(best, time.perf_counter() - started)
+    return rows / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the legacy and compact reading layouts")
+    parser.add_argument("--readings", type=int, default=500_000)
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    per_device = args.readings // args.devices
+    readings = []
+    for n in range(args.devices):
+        for reading in generate(per_device, seed=n):
+            reading["device_id"] = f"borewell-{n + 1}"
+            readings.append(reading)
+    for reading_id, reading in enumerate(readings, start=1):
+        reading["id"] = reading_id
+    # A window like the last week of a 5-minute-rate device
+    window_start = readings[per_device - 1]["timestamp"] - timedelta(days=7)
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {}
+        for name, table in (("legacy", legacy_readings), ("compact", compact_readings)):
+            path = os.path.join(directory, f"{name}.db")
+            engine = build(path, table, readings)
+
+            def aggregate():
+                with engine.connect() as connection:
+                    connection.execute(text(
+                        "SELECT AVG(water_level), AVG(flow_rate), AVG(turbidity), AVG(soil_moisture), "
+                        "SUM(vibration_status = 'high' OR vibration_status = 1) FROM sensor_readings"
+                    )).one()
+                return len(readings)
+
+            def window():
+                with engine.connect() as connection:
+                    return len(connection.execute(
+                        select(table.c.timestamp, table.c.water_level, table.c.flow_rate,
+                               table.c.soil_moisture, table.c.vibration_status)
+                        .where(table.c.device_id == "borewell-1", table.c.timestamp >= window_start)
+                        .order_by(table.c.timestamp)
+                    ).all())
+
+            # Same values either way
+            with engine.connect() as connection:
+                row = connection.execute(select(table).where(table.c.id == len(readings))).mappings().one()
+            assert {k: row[k] for k in readings[-1]} == readings[-1], row
+
+            results[name] = {
+                "sizes": sizes(path),
+                "file": os.path.getsize(path),
+                "aggregate": best_rate(aggregate, args.repeat),
+                "window": best_rate(window, args.repeat),
+            }
+            engine.dispose()
+
+    print(f"{len(readings)} readings, {args.devices} device(s)")
+    legacy, compact = results["legacy"], results["compact"]
+    print(f"  {'bytes/reading':<40} {'legacy':>10} {'compact':>10} {'ratio':>7}")
+    for name in sorted(legacy["sizes"]):
+        before = legacy["sizes"][name] / len(readings)
+        after = compact["sizes"].get(name, 0) / len(readings)
+        print(f"  {name:<40} {before:>10.1f} {after:>10.1f} {before / after if after else 0:>6.2f}x")
+    before, after = legacy["file"] / len(readings), compact["file"] / len(readings)
+    print(f"  {'whole file':<40} {before:>10.1f} {after:>10.1f} {before / after:>6.2f}x")
+    print(f"  {'rows/s':<40} {'legacy':>10} {'compact':>10} {'ratio':>7}")
+    for name in ("aggregate", "window"):
+        print(f"  {name:<40} {legacy[name]:>10,.0f} {compact[name]:>10,.0f} {compact[name] / legacy[name]:>6.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Startup budget check for RootGuard Bot
+
+Measures, each in a fresh interpreter, how long it takes to import the API
+module and to run the startup schema check against a new and an existing
+database. Exits non-zero if any measurement exceeds its budget so cold-start
+regressions on edge hardware are caught before deployment.
+
+Usage: python check_startup.py [--import-budget 1.15] [--startup-budget 0.25]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter()
+import main
+print(time.perf_counter() - start)
+"""
+
+STARTUP_SNIPPET = """
+import time
+from models.migrations import init_db
+start = time.perf_counter()
+init_db()
+print(time.perf_counter() - start)
+"""
+
+
+def measure(snippet: str, database_url: str, runs: int) -> float:
+    """Run a snippet in fresh interpreters and return the best timing"""
+    env = dict(os.environ, DATABASE_URL=database_url)
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", snippet],
+            cwd=backend_dir, env=env, capture_output=True, text=True, check=True
+        )
+        timings.append(float(result.stdout.strip().splitlines()[-1]))
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check cold-start time against a budget")
+    parser.add_argument("--import-budget", type=float, default=1.15,
+                        help="Seconds allowed to import main (about 15%% over its measured ~1 s)")
+    parser.add_argument("--startup-budget", type=float, default=0.25, help="Seconds allowed for the warm schema check")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per measurement (best is kept)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database_url = f"sqlite:///{os.path.join(tmp, 'startup_check.db')}"
+
+        import_time = measure(IMPORT_SNIPPET, database_url, args.runs)
+        create_time = measure(STARTUP_SNIPPET, database_url, 1)
+        warm_time = measure(STARTUP_SNIPPET, database_url, args.runs)
+
+    checks = [
+        ("import main", import_time, args.import_budget),
+        ("schema check (warm)", warm_time, args.startup_budget),
+    ]
+
+    print(f"schema create (fresh db): {create_time * 1000:.1f} ms")
+    failed = False
+    for name, elapsed, budget in checks:
+        ok = elapsed <= budget
+        failed = failed or not ok
+        print(f"{'✓' if ok else '✗'} {name}: {elapsed * 1000:.1f} ms (budget {budget * 1000:.0f} ms)")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
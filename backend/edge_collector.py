@@ -0,0 +1,385 @@
+#!/usr/bin/env python3
+"""
+Edge collector for RootGuard Bot
+
+Runs on the Raspberry Pi at the borewell (Settings.pi_ip / pi_port). Every
+reading is first written to a bounded local SQLite store, so sampling never
+depends on the uplink. A sync loop drains the store to the central backend's
+/api/sensors/ingest in gzip-compressed batches and checkpoints each batch
+only after the backend accepted it. When the link drops for hours, readings
+pile up locally and the oldest are discarded once the store is full. When
+it returns, sync resumes from the checkpoint, backing off while the server
+fails and halving the batch if a request is rejected as too large.
+
+Every reading carries a device_seq (the store's row number, prefixed with
+the store's creation time so a fresh store never reuses one). A crash or a
+lost response between the backend accepting a batch and the checkpoint being
+written re-sends that batch; the backend recognises the sequence numbers and
+ignores the repeat.
+
+The collector only needs the standard library, not the backend's packages.
+
+Usage:
+    python edge_collector.py --server http://central:8000 --device-id borewell-1
+    python edge_collector.py --self-test     # end-to-end run against a flaky local stand-in server
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+INGEST_PATH = "/api/sensors/ingest"
+
+
+class EdgeStore:
+    """Bounded FIFO of readings with a sync checkpoint, in one SQLite file"""
+
+    def __init__(self, path: str, max_rows: int = 500_000):
+        self.max_rows = max_rows
+        # Sampling and sync run on different threads
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS readings (seq INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS sync_state ("
+            "id INTEGER PRIMARY KEY CHECK (id = 1), last_synced_seq INTEGER NOT NULL, "
+            "synced_rows INTEGER NOT NULL, dropped_rows INTEGER NOT NULL, synced_at TEXT)"
+        )
+        self.db.execute("INSERT OR IGNORE INTO sync_state VALUES (1, 0, 0, 0, NULL)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS store_info (id INTEGER PRIMARY KEY CHECK (id = 1), epoch INTEGER NOT NULL)")
+        self.db.execute("INSERT OR IGNORE INTO store_info VALUES (1, ?)", (int(time.time()),))
+        self.db.commit()
+        # High bits of every device_seq from this store
+        self.epoch = self.db.execute("SELECT epoch FROM store_info").fetchone()[0]
+        self.depth = self.db.execute("SELECT COUNT(*) FROM readings").fetchone()[0]
+
+    def append(self, reading: Dict) -> int:
+        """Store one reading; drops the oldest unsynced rows beyond max_rows"""
+        with self.lock, self.db:
+            seq = self.db.execute("INSERT INTO readings (payload) VALUES (?)", (json.dumps(reading),)).lastrowid
+            self.depth += 1
+            overflow = self.depth - self.max_rows
+            if overflow > 0:
+                self.db.execute(
+                    "DELETE FROM readings WHERE seq IN (SELECT seq FROM readings ORDER BY seq LIMIT ?)", (overflow,)
+                )
+                self.db.execute("UPDATE sync_state SET dropped_rows = dropped_rows + ?", (overflow,))
+                self.depth -= overflow
+        return seq
+
+    def pending(self, limit: int) -> List[Tuple[int, Dict]]:
+        """Oldest unsynced readings, in order, each tagged with its device_seq"""
+        with self.lock:
+            rows = self.db.execute("SELECT seq, payload FROM readings ORDER BY seq LIMIT ?", (limit,)).fetchall()
+        return [(seq, dict(json.loads(payload), device_seq=self.epoch << 32 | seq)) for seq, payload in rows]
+
+    def ack(self, upto_seq: int, count: int):
+        """Checkpoint a batch the server accepted and free its rows"""
+        with self.lock, self.db:
+            deleted = self.db.execute("DELETE FROM readings WHERE seq <= ?", (upto_seq,)).rowcount
+            self.db.execute(
+                "UPDATE sync_state SET last_synced_seq = ?, synced_rows = synced_rows + ?, synced_at = ?",
+                (upto_seq, count, datetime.utcnow().isoformat())
+            )
+            self.depth -= deleted
+
+    def stats(self) -> Dict:
+        with self.lock:
+            last_synced_seq, synced_rows, dropped_rows, synced_at = self.db.execute(
+                "SELECT last_synced_seq, synced_rows, dropped_rows, synced_at FROM sync_state"
+            ).fetchone()
+        return {
+            "depth": self.depth,
+            "last_synced_seq": last_synced_seq,
+            "synced_rows": synced_rows,
+            "dropped_rows": dropped_rows,
+            "synced_at": synced_at,
+        }
+
+    def close(self):
+        self.db.close()
+
+
+class SyncClient:
+    """Uploads the store's backlog in compressed, checkpointed batches"""
+
+    MIN_BATCH = 10
+
+    def __init__(self, store: EdgeStore, server: str, batch_size: int = 1000, timeout: float = 30,
+                 min_backoff: float = 1.0, max_backoff: float = 300.0, verbose: bool = True):
+        self.store = store
+        self.url = server.rstrip("/") + INGEST_PATH
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.verbose = verbose
+
+        self.batches = 0
+        self.failures = 0
+        self.bytes_raw = 0
+        self.bytes_sent = 0
+        self.online = False
+
+    def sync_once(self) -> int:
+        """Upload one batch; return how many readings were checkpointed (0 when caught up)"""
+        batch = self.store.pending(self.batch_size)
+        if not batch:
+            return 0
+
+        raw = json.dumps([reading for _, reading in batch], separators=(",", ":")).encode()
+        body = gzip.compress(raw, compresslevel=6)
+        request = urllib.request.Request(self.url, data=body, method="POST", headers={
+            "Content-Type": "application/json",
+            "Content-Encoding": "gzip",
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+        except urllib.error.HTTPError as e:
+            if e.code == 413 and self.batch_size > self.MIN_BATCH:
+                self.batch_size = max(self.MIN_BATCH, self.batch_size // 2)
+            raise
+
+        self.store.ack(batch[-1][0], len(batch))
+        self.batches += 1
+        self.bytes_raw += len(raw)
+        self.bytes_sent += len(body)
+        return len(batch)
+
+    async def run(self, stop: asyncio.Event, interval: float):
+        """Drain the backlog whenever the link is up; back off while it is not"""
+        backoff = self.min_backoff
+        while not stop.is_set():
+            try:
+                synced = await asyncio.to_thread(self.sync_once)
+            except (OSError, urllib.error.URLError) as e:
+                # Link down or server failing: keep everything, retry later
+                if self.online and self.verbose:
+                    print(f"Sync paused ({e}); {self.store.depth} readings buffered")
+                self.online = False
+                self.failures += 1
+                await _wait(stop, backoff * random.uniform(0.5, 1.0))
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            if not self.online and self.verbose:
+                print(f"Sync online; {self.store.depth} readings to catch up")
+            self.online = True
+            backoff = self.min_backoff
+            if synced == 0:
+                await _wait(stop, interval)
+
+
+class Sampler:
+    """Produces a reading every interval; replace `read` with the real sensor drivers"""
+
+    def __init__(self, device_id: str, rng: random.Random):
+        self.device_id = device_id
+        self.rng = rng
+        self.values = {"water_level": 70.0, "flow_rate": 12.0, "turbidity": 85.0, "soil_moisture": 45.0}
+        self.limits = {"water_level": (0, 100), "flow_rate": (0, 20), "turbidity": (0, 100), "soil_moisture": (0, 100)}
+        self.steps = {"water_level": 2.0, "flow_rate": 1.0, "turbidity": 1.5, "soil_moisture": 3.0}
+
+    def read(self) -> Dict:
+        reading = {"device_id": self.device_id, "timestamp": datetime.utcnow().isoformat()}
+        for name, value in self.values.items():
+            low, high = self.limits[name]
+            value = min(high, max(low, value + self.rng.uniform(-self.steps[name], self.steps[name])))
+            self.values[name] = value
+            reading[name] = round(value, 1)
+        reading["vibration_status"] = "high" if self.rng.random() < 0.05 else "low"
+        return reading
+
+
+async def sample_loop(store: EdgeStore, sampler: Sampler, stop: asyncio.Event, interval: float,
+                      limit: Optional[int] = None):
+    produced = 0
+    while not stop.is_set() and (limit is None or produced < limit):
+        store.append(sampler.read())
+        produced += 1
+        await _wait(stop, interval)
+    return produced
+
+
+async def _wait(stop: asyncio.Event, timeout: float) -> bool:
+    """Sleep up to `timeout` seconds; return True if `stop` was set"""
+    try:
+        await asyncio.wait_for(stop.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+# Local stand-in for the central backend
+
+class StandInServer:
+    """Minimal ingest endpoint that can go offline, fail, and lose acknowledgements"""
+
+    def __init__(self, fail_rate: float = 0.0, lost_ack_rate: float = 0.0, max_body: int = 0, seed: int = 1):
+        self.received: List[Dict] = []
+        self.requests = 0
+        self.offline = False
+        self.fail_rate = fail_rate
+        self.lost_ack_rate = lost_ack_rate
+        self.max_body = max_body
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                with server.lock:
+                    server.requests += 1
+                    roll = server.rng.random()
+                    if server.offline:
+                        # Like a dead uplink: no response at all
+                        self.close_connection = True
+                        return
+                    if server.max_body and len(body) > server.max_body:
+                        return self._reply(413)
+                    if roll < server.fail_rate:
+                        return self._reply(503)
+                    if self.headers.get("Content-Encoding") == "gzip":
+                        body = gzip.decompress(body)
+                    server.received.extend(json.loads(body))
+                    if roll < server.fail_rate + server.lost_ack_rate:
+                        # Accepted, but the connection drops before the client hears about it
+                        self.close_connection = True
+                        return
+                self._reply(202)
+
+            def _reply(self, status: int):
+                self.send_response(status)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.httpd.shutdown()
+
+
+async def self_test(readings: int, max_rows: int) -> bool:
+    """Sample through outages, failures and lost acks; verify what reached the server"""
+    server = StandInServer(fail_rate=0.1, lost_ack_rate=0.05, max_body=4_000)
+    server.start()
+    with tempfile.TemporaryDirectory() as tmp:
+        store = EdgeStore(os.path.join(tmp, "edge.db"), max_rows=max_rows)
+        sync = SyncClient(store, server.url, batch_size=500, timeout=2, min_backoff=0.05, max_backoff=0.5,
+                          verbose=False)
+        stop = asyncio.Event()
+        sync_task = asyncio.create_task(sync.run(stop, interval=0.05))
+
+        async def outages():
+            # Two long outages while sampling continues
+            for _ in range(2):
+                await asyncio.sleep(0.5)
+                server.offline = True
+                await asyncio.sleep(1.5)
+                server.offline = False
+
+        outage_task = asyncio.create_task(outages())
+        produced = await sample_loop(store, Sampler("edge-test", random.Random(7)), asyncio.Event(), 0.001, readings)
+        await outage_task
+        while store.depth:
+            await asyncio.sleep(0.05)
+        stop.set()
+        await sync_task
+
+        stats = store.stats()
+        store.close()
+    server.stop()
+
+    unique = {r["device_seq"] for r in server.received}
+    ordered = all(a["timestamp"] <= b["timestamp"] for a, b in zip(server.received, server.received[1:]))
+    expected = produced - stats["dropped_rows"]
+    ratio = sync.bytes_raw / sync.bytes_sent if sync.bytes_sent else 0
+    print(f"produced {produced}, dropped (store full) {stats['dropped_rows']}, "
+          f"received {len(server.received)} ({len(unique)} unique, {len(server.received) - len(unique)} re-sent)")
+    print(f"{server.requests} requests, {sync.batches} batches, {sync.failures} failed attempts, "
+          f"final batch size {sync.batch_size}, compression {ratio:.1f}x")
+
+    # A batch whose ack was lost may be dropped from a full store before it is re-sent,
+    # so the server can hold a few more unique readings than were kept
+    ok = expected <= len(unique) <= produced and stats["last_synced_seq"] == produced
+    # Re-sent batches arrive out of order; first deliveries must not
+    ok = ok and (ordered or len(server.received) > len(unique))
+    print("✓ every stored reading reached the server" if ok else "✗ readings missing")
+    return ok
+
+
+async def run_collector(args):
+    store = EdgeStore(args.store, max_rows=args.max_rows)
+    sync = SyncClient(store, args.server, batch_size=args.batch_size)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    try:
+        import signal
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+    except (ImportError, NotImplementedError):
+        pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+
+    print(f"Edge collector for {args.device_id}: sampling every {args.interval}s into {args.store}, "
+          f"syncing to {sync.url} ({store.depth} readings buffered)")
+    try:
+        await asyncio.gather(
+            sample_loop(store, Sampler(args.device_id, random.Random()), stop, args.interval),
+            sync.run(stop, args.sync_interval),
+        )
+    finally:
+        print(f"Stopped: {store.stats()}")
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Collect readings at the borewell and sync them to the backend")
+    parser.add_argument("--server", default="http://localhost:8000", help="Central backend URL")
+    parser.add_argument("--device-id", default="borewell-1", help="Device id sent with every reading")
+    parser.add_argument("--store", default="./edge_store.db", help="Local SQLite buffer")
+    parser.add_argument("--max-rows", type=int, default=500_000, help="Readings kept while offline (oldest dropped)")
+    parser.add_argument("--interval", type=float, default=5.0, help="Seconds between readings")
+    parser.add_argument("--sync-interval", type=float, default=10.0, help="Seconds between syncs when caught up")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Readings per upload")
+    parser.add_argument("--self-test", action="store_true", help="Run end-to-end against a local stand-in server")
+    parser.add_argument("--self-test-readings", type=int, default=3000)
+    args = parser.parse_args()
+
+    if args.self_test:
+        ok = asyncio.run(self_test(args.self_test_readings, max_rows=args.self_test_readings // 4))
+        sys.exit(0 if ok else 1)
+
+    try:
+        asyncio.run(run_collector(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
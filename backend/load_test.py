@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+Dashboard load test for RootGuard Bot
+
+Answers "how many open dashboards can one backend serve?" by simulating K
+browser clients that poll the API the way the frontend does (see
+POLL_GROUPS) while the sensor tick runs, at increasing K. Reports
+throughput, per-route p50/p95/p99 latency and error rates for each step.
+
+By default it seeds a throwaway database, starts the API with uvicorn in a
+child process (embedded tick worker included) and tears it down afterwards;
+pass --url to load an already running server instead. The HTTP client is a
+minimal keep-alive HTTP/1.1 client on asyncio streams, so nothing beyond the
+backend's own requirements is needed.
+
+Usage:
+    python load_test.py                                   # K = 1, 10, 50, 100; 60 s each
+    python load_test.py --clients 25,100,200 --duration 30
+    python load_test.py --url http://127.0.0.1:8000 --clients 10
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# Matches the frontend's polling (useRealSensorData, Analytics, ROIDashboard);
+# every group is also fetched once when a dashboard opens
+DASHBOARD_INTERVAL = 10.0  # REFRESH_INTERVAL
+POLL_GROUPS = [
+    (DASHBOARD_INTERVAL, [
+        "/api/sensors/latest",
+        "/api/health-score",
+        "/api/irrigation/status",
+        "/api/alerts?limit=10",
+    ]),
+    (30.0, [
+        "/api/sensors/history?limit=100",
+        "/api/irrigation/history?limit=50",
+        "/api/analytics/water-usage?days=7",
+        "/api/analytics/efficiency?days=7",
+    ]),
+    (60.0, [
+        "/api/analytics/cost-savings?days=7",
+    ]),
+]
+
+REQUEST_TIMEOUT = 30.0
+
+
+class HttpConnection:
+    """One keep-alive HTTP/1.1 connection that issues GET requests"""
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def get(self, path: str) -> int:
+        """Send a GET and read the whole response; return the status code"""
+        reused = self.writer is not None
+        try:
+            return await self._request(path)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            if not reused:
+                raise
+            # The server closed the idle connection (keep-alive timeout); browsers
+            # retry on a fresh connection, so do the same
+            return await self._request(path)
+
+    async def _request(self, path: str) -> int:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        try:
+            self.writer.write(
+                f"GET {path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                f"Accept: application/json\r\n\r\n".encode()
+            )
+            await self.writer.drain()
+            return await self._read_response()
+        except BaseException:
+            # Unknown state after a failure or cancellation; reconnect next time
+            self.close()
+            raise
+
+    async def _read_response(self) -> int:
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await self.reader.readexactly(int(headers.get("content-length", 0)))
+
+        if headers.get("connection", "").lower() == "close":
+            self.close()
+        return status
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+            self.reader = None
+
+
+class Stats:
+    """Latency samples and errors per route"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.error_kinds: Dict[str, int] = defaultdict(int)
+
+    def record(self, route: str, seconds: float, error: Optional[str] = None):
+        self.latencies[route].append(seconds)
+        if error:
+            self.errors[route] += 1
+            self.error_kinds[error] += 1
+
+
+class DashboardClient:
+    """One open dashboard: a small connection pool and a poll loop per group"""
+
+    def __init__(self, host: str, port: int, connections: int, stats: Stats, rng: random.Random):
+        self.stats = stats
+        self.rng = rng
+        self.pool: asyncio.Queue = asyncio.Queue()
+        self.connections = [HttpConnection(host, port) for _ in range(connections)]
+        for connection in self.connections:
+            self.pool.put_nowait(connection)
+
+    async def run(self, stop_at: float):
+        # Dashboards are opened at random moments, not in lockstep
+        await asyncio.sleep(self.rng.uniform(0, DASHBOARD_INTERVAL))
+        try:
+            await asyncio.gather(*(self._poll(interval, paths, stop_at) for interval, paths in POLL_GROUPS))
+        finally:
+            for connection in self.connections:
+                connection.close()
+
+    async def _poll(self, interval: float, paths: List[str], stop_at: float):
+        next_at = time.monotonic()
+        while next_at < stop_at:
+            await asyncio.gather(*(self._fetch(path) for path in paths))
+            # Like react-query, the next poll is scheduled after the previous one finished
+            next_at = max(next_at + interval, time.monotonic())
+            await asyncio.sleep(max(0.0, min(next_at, stop_at) - time.monotonic()))
+
+    async def _fetch(self, path: str):
+        route = path.split("?")[0]
+        connection = await self.pool.get()
+        started = time.perf_counter()
+        error = None
+        try:
+            status = await asyncio.wait_for(connection.get(path), REQUEST_TIMEOUT)
+            if status >= 400:
+                error = f"HTTP {status}"
+        except asyncio.TimeoutError:
+            error = "timeout"
+        except (OSError, ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            error = type(e).__name__
+        finally:
+            self.pool.put_nowait(connection)
+        self.stats.record(route, time.perf_counter() - started, error)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_step(host: str, port: int, clients: int, duration: float, connections: int, seed: int) -> Stats:
+    """Simulate `clients` dashboards for `duration` seconds"""
+    stats = Stats()
+    rng = random.Random(seed)
+    stop_at = time.monotonic() + duration
+    dashboards = [
+        DashboardClient(host, port, connections, stats, random.Random(rng.random()))
+        for _ in range(clients)
+    ]
+    await asyncio.gather(*(d.run(stop_at) for d in dashboards))
+    return stats
+
+
+def report(clients: int, duration: float, stats: Stats):
+    total = sum(len(v) for v in stats.latencies.values())
+    errors = sum(stats.errors.values())
+    print(f"\nK={clients}: {total} requests in {duration:.0f}s, {total / duration:.1f} req/s, "
+          f"errors {errors} ({errors / total * 100 if total else 0:.2f}%)")
+    print(f"  {'route':<34} {'count':>6} {'err%':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    for route in sorted(stats.latencies):
+        samples = stats.latencies[route]
+        print(f"  {route:<34} {len(samples):>6} {stats.errors[route] / len(samples) * 100:>6.2f} "
+              f"{percentile(samples, 50) * 1000:>8.1f} {percentile(samples, 95) * 1000:>8.1f} "
+              f"{percentile(samples, 99) * 1000:>8.1f}")
+    if stats.error_kinds:
+        print("  errors: " + ", ".join(f"{kind} x{count}" for kind, count in sorted(stats.error_kinds.items())))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_local_server(tmp: str, seed_days: float) -> Tuple[subprocess.Popen, int]:
+    """Seed a throwaway database and start the API against it"""
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'load_test.db')}",
+        INGEST_LOG_PATH=os.path.join(tmp, "ingest_buffer.log"),
+        SENSOR_WORKER_LOCK=os.path.join(tmp, "sensor_worker.lock"),
+        CONTROL_LOCK_PATH=os.path.join(tmp, "irrigation_control.lock"),
+        SENSOR_WORKER="embedded",
+        RATE_LIMIT_ENABLED="0",  # Every simulated client comes from 127.0.0.1
+    )
+    if seed_days > 0:
+        print(f"Seeding {seed_days:g} days of data...")
+        subprocess.run([sys.executable, "seed_database.py", "--days", str(seed_days)],
+                       cwd=backend_dir, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=backend_dir, env=env
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("API server exited during startup")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return server, port
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("API server did not start within 30s")
+
+
+def raise_fd_limit(needed: int):
+    """Each simulated client keeps its own connections open"""
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < needed:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(needed, hard), hard))
+
+
+async def run_all(host: str, port: int, steps: List[int], duration: float, connections: int, seed: int):
+    # Warm up imports, caches and the first analytics queries before measuring
+    await run_step(host, port, 1, 2, connections, seed)
+    for clients in steps:
+        stats = await run_step(host, port, clients, duration, connections, seed + clients)
+        report(clients, duration, stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate K polling dashboards against the API")
+    parser.add_argument("--clients", default="1,10,50,100", help="Comma-separated K values to run in turn")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds per step")
+    parser.add_argument("--connections", type=int, default=4, help="Keep-alive connections per client")
+    parser.add_argument("--url", help="Load an already running server instead of starting one")
+    parser.add_argument("--seed-days", type=float, default=7, help="Days of history to seed the local server with")
+    parser.add_argument("--seed", type=int, default=42, help="RNG seed for client start offsets")
+    args = parser.parse_args()
+
+    steps = [int(k) for k in args.clients.split(",") if k.strip()]
+    raise_fd_limit(max(steps) * args.connections + 256)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        server = None
+        if args.url:
+            target = urlsplit(args.url)
+            host, port = target.hostname, target.port or 80
+        else:
+            server, port = start_local_server(tmp, args.seed_days)
+            host = "127.0.0.1"
+        print(f"Target http://{host}:{port}, {args.duration:.0f}s per step")
+
+        try:
+            asyncio.run(run_all(host, port, steps, args.duration, args.connections, args.seed))
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if server:
+                server.terminate()
+                server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,67 +1,104 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Request
+from fastapi.routing import APIRoute
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
-import uvicorn
-from datetime import datetime
+from datetime import datetime, timedelta
 import asyncio
-from typing import List
+import os
+import secrets
+import zlib
+from typing import List, Optional
 
 from sqlalchemy.orm import Session
-from models.database import engine, Base, SessionLocal, get_db
-from models.sensor import SensorData, SensorReading, IrrigationControl, Alert, IrrigationSession
+from models.database import get_db
+from models.migrations import init_db
 from services.sensor_service import SensorService
+from services.alert_service import AlertService
 from services.irrigation_service import IrrigationService
-from services.analytics_service import AnalyticsService
+from services.process_lock import ProcessLock
+from services.ingest_buffer import IngestBacklogFull, get_ingest_buffer
+from services.settings_service import SettingsService, get_rules
+from services.notification_service import get_notification_dispatcher
+from services.control_queue import ControlConflict, get_control_queue
+from services.sync_service import SyncService
+from services.scheduler import get_scheduler
+from services.binary_ingest import get_binary_listener
+from services.recent_readings import get_recent_readings
+from services.profiler import ProfilerBusy, get_profiler
+from services.tracing import KIND_SERVER, get_tracer
+from services.event_bus import get_event_bus
+from services.reading_feed import get_reading_feed
+from services.analytics_pool import AnalyticsTimeout, get_analytics_pool
+from services.rate_limit import (
+    RATE_LIMIT_CLIENT_HEADER, Overloaded, RateLimited, get_analytics_limiter, get_rate_limiter, retry_after_header
+)
+from worker import get_worker_mode, run_as_leader, LOCK_PATH
 from schemas.sensor_schemas import (
     SensorDataResponse, 
     HealthScoreResponse, 
     IrrigationControlRequest,
     IrrigationStatusResponse,
     IrrigationSessionResponse,
-    AlertResponse
+    AlertResponse,
+    AlertCountResponse,
+    AlertDismissRequest,
+    SensorReadingIngest,
+    SettingsResponse,
+    SettingsUpdateRequest,
+    SyncResponse,
+    ProfileRequest
 )
 
-# Create database tables
+SHUTDOWN_TIMEOUT_SECONDS = 10
+MAX_REQUEST_BODY_BYTES = 10 * 1024 * 1024  # After decompression
+INGEST_RETRY_AFTER_SECONDS = 5  # When the ingest backlog is full (database unavailable)
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")  # Unset: admin endpoints are disabled
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
-    Base.metadata.create_all(bind=engine)
+    # Startup: only creates or migrates tables when the schema version changed
+    init_db()
+    
+    # Recent readings in memory for history and short-window analytics
+    get_recent_readings().warm()
+    
+    # Replays readings left in the ingest log by a crash, then starts group commits
+    buffer = get_ingest_buffer()
+    await buffer.start()
+    
+    # Push/SMS delivery of new alerts, off the request and tick paths
+    dispatcher = get_notification_dispatcher()
+    await dispatcher.start()
     
-    # Start background sensor simulation
-    async def simulate_sensors():
-        while True:
-            try:
-                # Create a new session for each iteration to ensure proper cleanup
-                db = SessionLocal()
-                try:
-                    sensor_service = SensorService(db)
-                    irrigation_service = IrrigationService(db)
-                    
-                    # Generate and store sensor data
-                    sensor_data = await sensor_service.generate_sensor_reading()
-                    
-                    # Check irrigation needs
-                    await irrigation_service.check_auto_irrigation(sensor_data)
-                    
-                    # Check for alerts
-                    await sensor_service.check_and_create_alerts(sensor_data)
-                finally:
-                    # Always close the session
-                    db.close()
-                
-            except Exception as e:
-                print(f"Sensor simulation error: {e}")
-            
-            await asyncio.sleep(5)  # Update every 5 seconds
+    # Single writer for irrigation control state
+    control_queue = get_control_queue()
+    await control_queue.start()
     
-    # Start background task
-    task = asyncio.create_task(simulate_sensors())
+    # Binary frames over UDP from field collectors (INGEST_UDP_PORT; first worker to bind wins)
+    listener = get_binary_listener()
+    await listener.start()
+    
+    # Start background sensor simulation; only the worker holding the lock ticks
+    stop = asyncio.Event()
+    task = None
+    if get_worker_mode() == "embedded":
+        task = asyncio.create_task(run_as_leader(ProcessLock(LOCK_PATH), stop))
     
     yield
     
-    # Shutdown
-    task.cancel()
+    # Shutdown: let running scheduled jobs finish, then drain buffered readings
+    stop.set()
+    if task:
+        try:
+            await asyncio.wait_for(task, SHUTDOWN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            print("Sensor tick did not finish in time; cancelled")
+    await listener.stop()
+    await control_queue.stop()
+    await buffer.stop()
+    await dispatcher.stop()
+    get_analytics_pool().shutdown()
+    get_tracer().exporter.close()
 
 app = FastAPI(
     title="RootGuard Bot API",
@@ -89,14 +126,110 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class GzipRequest(Request):
+    """Request whose body is transparently gunzipped when sent with Content-Encoding: gzip"""
+    
+    async def body(self) -> bytes:
+        if not hasattr(self, "_body"):
+            body = await super().body()
+            if "gzip" in self.headers.getlist("Content-Encoding"):
+                body = _gunzip(body)
+            self._body = body
+        return self._body
+
+def _gunzip(body: bytes) -> bytes:
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        data = decompressor.decompress(body, MAX_REQUEST_BODY_BYTES + 1)
+    except zlib.error:
+        raise HTTPException(status_code=400, detail="Invalid gzip body")
+    if len(data) > MAX_REQUEST_BODY_BYTES or decompressor.unconsumed_tail:
+        raise HTTPException(status_code=413, detail="Decompressed body too large")
+    return data
+
+class GzipRoute(APIRoute):
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        profiler = get_profiler()
+        tracer = get_tracer()
+        
+        async def gzip_route_handler(request: Request):
+            # Both are no-ops unless this request is sampled or a profile is watching this route
+            with tracer.trace(f"{request.method} {self.path}", KIND_SERVER, {
+                "http.request.method": request.method,
+                "http.route": self.path,
+                "url.path": request.url.path,
+            }, request.headers.get("traceparent")) as span:
+                async with profiler.watch("route", self.path):
+                    try:
+                        response = await handler(GzipRequest(request.scope, request.receive))
+                    except HTTPException as e:
+                        if span is not None:
+                            span.set("http.response.status_code", e.status_code)
+                        raise
+                if span is not None:
+                    span.set("http.response.status_code", response.status_code)
+                return response
+        
+        return gzip_route_handler
+
+# Edge collectors upload compressed batches
+app.router.route_class = GzipRoute
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """Admin endpoints need the X-Admin-Token header to match ADMIN_TOKEN"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_TOKEN is not set)")
+    if not x_admin_token or not secrets.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+def client_address(request: Request) -> str:
+    if RATE_LIMIT_CLIENT_HEADER:
+        forwarded = request.headers.get(RATE_LIMIT_CLIENT_HEADER)
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+def check_rate_limit(route_class: str, request: Request, reserved: bool = False):
+    try:
+        get_rate_limiter().check(route_class, client_address(request), reserved)
+    except RateLimited as e:
+        raise HTTPException(status_code=429, detail=str(e), headers=retry_after_header(e.retry_after))
+
+def rate_limit(route_class: str):
+    """Dependency taking one token from the client's and the route class's buckets"""
+    async def dependency(request: Request):
+        check_rate_limit(route_class, request)
+    return dependency
+
+async def analytics_slot(request: Request):
+    """Dependency: rate-limit, then hold one of the analytics slots for the request"""
+    check_rate_limit("analytics", request)
+    try:
+        async with get_analytics_limiter().slot():
+            yield
+    except Overloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=retry_after_header(e.retry_after))
+
 # Dependency injection
 def get_sensor_service(db: Session = Depends(get_db)):
     return SensorService(db)
 
+def get_alert_service(db: Session = Depends(get_db)):
+    return AlertService(db)
+
 def get_irrigation_service(db: Session = Depends(get_db)):
     return IrrigationService(db)
 
+def get_settings_service(db: Session = Depends(get_db)):
+    return SettingsService(db)
+
+def get_sync_service(db: Session = Depends(get_db)):
+    return SyncService(db)
+
 def get_analytics_service(db: Session = Depends(get_db)):
+    # Analytics is rarely hit, so keep it off the cold-start import path
+    from services.analytics_service import AnalyticsService
     return AnalyticsService(db)
 
 # Health check endpoint
@@ -130,6 +263,38 @@ async def get_sensor_history(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/sensors/ingest", status_code=202, dependencies=[Depends(rate_limit("ingest"))])
+async def ingest_sensor_readings(
+    readings: List[SensorReadingIngest],
+    sensor_service: SensorService = Depends(get_sensor_service)
+):
+    """Accept a batch of readings from field devices (group-committed in the background)"""
+    try:
+        accepted = await sensor_service.ingest_readings(readings)
+        return {"accepted": accepted}
+    except IngestBacklogFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=retry_after_header(INGEST_RETRY_AFTER_SECONDS))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/sensors/ingest/binary", status_code=202, dependencies=[Depends(rate_limit("ingest"))])
+async def ingest_binary_readings(
+    request: Request,
+    sensor_service: SensorService = Depends(get_sensor_service)
+):
+    """Accept readings as compact binary frames (application/octet-stream, optionally gzipped)"""
+    try:
+        accepted = await sensor_service.ingest_binary(await request.body())
+        return {"accepted": accepted}
+    except HTTPException:
+        raise
+    except IngestBacklogFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers=retry_after_header(INGEST_RETRY_AFTER_SECONDS))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/api/health-score", response_model=HealthScoreResponse)
 async def get_health_score(
     sensor_service: SensorService = Depends(get_sensor_service)
@@ -156,14 +321,17 @@ async def get_irrigation_status(
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/api/irrigation/control", response_model=IrrigationStatusResponse)
-async def control_irrigation(
-    control_request: IrrigationControlRequest,
-    irrigation_service: IrrigationService = Depends(get_irrigation_service)
-):
+async def control_irrigation(control_request: IrrigationControlRequest, request: Request):
     """Control irrigation system (mode change, start/stop)"""
+    # Stopping the pump may use the capacity other commands are kept out of
+    check_rate_limit("control", request, reserved=control_request.stops_pump)
     try:
-        status = await irrigation_service.update_control(control_request)
+        status = await get_control_queue().submit(
+            lambda db: IrrigationService(db).update_control(control_request)
+        )
         return status
+    except ControlConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -183,34 +351,90 @@ async def get_irrigation_history(
 @app.get("/api/alerts", response_model=List[AlertResponse])
 async def get_active_alerts(
     limit: int = 10,
-    sensor_service: SensorService = Depends(get_sensor_service)
+    key: Optional[str] = None,
+    alert_type: Optional[str] = None,
+    days: Optional[int] = None,
+    include_dismissed: bool = False,
+    alert_service: AlertService = Depends(get_alert_service)
 ):
-    """Get active system alerts"""
+    """Get active system alerts, optionally filtered by key, severity and age in days
+    
+    include_dismissed adds dismissed and resolved alerts, archived ones too.
+    """
     try:
-        alerts = await sensor_service.get_active_alerts(limit)
+        since = datetime.utcnow() - timedelta(days=days) if days else None
+        alerts = await alert_service.get_active_alerts(limit, key, alert_type, since, include_dismissed)
         return alerts
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/alerts/counts", response_model=List[AlertCountResponse])
+async def get_alert_counts(
+    days: Optional[int] = None,
+    alert_type: Optional[str] = None,
+    alert_service: AlertService = Depends(get_alert_service)
+):
+    """Get alert counts per key and severity"""
+    try:
+        since = datetime.utcnow() - timedelta(days=days) if days else None
+        return await alert_service.get_alert_counts(since, alert_type)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.delete("/api/alerts/{alert_id}")
 async def dismiss_alert(
     alert_id: int,
-    sensor_service: SensorService = Depends(get_sensor_service)
+    alert_service: AlertService = Depends(get_alert_service)
 ):
     """Dismiss a specific alert"""
     try:
-        success = await sensor_service.dismiss_alert(alert_id)
+        success = await alert_service.dismiss_alert(alert_id)
         if not success:
             raise HTTPException(status_code=404, detail="Alert not found")
         return {"message": "Alert dismissed successfully"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/alerts/dismiss")
+async def dismiss_alerts(
+    dismiss_request: AlertDismissRequest,
+    alert_service: AlertService = Depends(get_alert_service)
+):
+    """Dismiss all active alerts matching ids, key, severity and/or a created_at range in one update"""
+    try:
+        dismissed = await alert_service.dismiss(
+            dismiss_request.ids,
+            dismiss_request.alert_key,
+            dismiss_request.alert_type,
+            dismiss_request.since,
+            dismiss_request.until
+        )
+        return {"dismissed": dismissed}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Offline sync endpoint
+@app.get("/api/sync", response_model=SyncResponse)
+async def sync_changes(
+    since: Optional[int] = None,
+    limit: int = 500,
+    sync_service: SyncService = Depends(get_sync_service)
+):
+    """Get readings, alerts and sessions changed since a previous sync token"""
+    try:
+        return await sync_service.get_changes(since, limit)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # Analytics endpoints
-@app.get("/api/analytics/water-usage")
+@app.get("/api/analytics/water-usage", dependencies=[Depends(analytics_slot)])
 async def get_water_usage(
     days: int = 7,
-    analytics_service: AnalyticsService = Depends(get_analytics_service)
+    analytics_service = Depends(get_analytics_service)
 ):
     """Get water usage statistics for specified period"""
     try:
@@ -219,10 +443,10 @@ async def get_water_usage(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/analytics/cost-savings")
+@app.get("/api/analytics/cost-savings", dependencies=[Depends(analytics_slot)])
 async def get_cost_savings(
     days: int = 7,
-    analytics_service: AnalyticsService = Depends(get_analytics_service)
+    analytics_service = Depends(get_analytics_service)
 ):
     """Get cost savings and ROI calculations"""
     try:
@@ -231,31 +455,113 @@ async def get_cost_savings(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/analytics/efficiency")
+@app.get("/api/analytics/efficiency", dependencies=[Depends(analytics_slot)])
 async def get_efficiency_metrics(
     days: int = 7,
-    analytics_service: AnalyticsService = Depends(get_analytics_service)
+    analytics_service = Depends(get_analytics_service)
 ):
     """Get irrigation efficiency metrics"""
     try:
         metrics = await analytics_service.get_efficiency_metrics(days)
         return metrics
+    except AnalyticsTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/analytics/comprehensive")
+@app.get("/api/analytics/comprehensive", dependencies=[Depends(analytics_slot)])
 async def get_comprehensive_analytics(
     days: int = 7,
-    analytics_service: AnalyticsService = Depends(get_analytics_service)
+    analytics_service = Depends(get_analytics_service)
 ):
     """Get all analytics data in one call"""
     try:
         analytics = await analytics_service.get_comprehensive_analytics(days)
         return analytics
+    except AnalyticsTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Settings endpoints
+@app.get("/api/settings", response_model=SettingsResponse)
+async def get_settings(
+    settings_service: SettingsService = Depends(get_settings_service)
+):
+    """Get farm settings and irrigation/alert thresholds"""
+    try:
+        return await settings_service.get_settings()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.put("/api/settings", response_model=SettingsResponse)
+async def update_settings(
+    settings_request: SettingsUpdateRequest,
+    settings_service: SettingsService = Depends(get_settings_service)
+):
+    """Update settings; new thresholds apply from the next sensor tick"""
+    try:
+        return await settings_service.update_settings(settings_request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Runtime metrics
+@app.get("/api/metrics")
+async def get_metrics():
+    """Get runtime metrics for this API process"""
+    return {
+        "pid": os.getpid(),
+        "ingest": get_ingest_buffer().stats(),
+        "rules_version": get_rules().version,
+        "notifications": get_notification_dispatcher().stats(),
+        "control_queue": get_control_queue().stats(),
+        "scheduler": get_scheduler().stats(),
+        "binary_ingest_udp": get_binary_listener().stats(),
+        "recent_readings": get_recent_readings().stats(),
+        "profiler": get_profiler().stats(),
+        "tracing": get_tracer().stats(),
+        "event_bus": get_event_bus().stats(),
+        "reading_feed": get_reading_feed().stats(),
+        "analytics_pool": get_analytics_pool().stats(),
+        "rate_limits": get_rate_limiter().stats(),
+        "analytics_limiter": get_analytics_limiter().stats()
+    }
+
+# Admin
+@app.post("/api/admin/profile", dependencies=[Depends(require_admin)])
+async def run_profile(profile_request: ProfileRequest):
+    """Sample this process's stacks for N seconds, or around the next requests to a route or runs of a scheduled task
+    
+    Returns collapsed stacks (flamegraph.pl, speedscope) or a speedscope file in "profile".
+    """
+    if profile_request.route and not any(getattr(r, "path", None) == profile_request.route for r in app.routes):
+        raise HTTPException(status_code=400, detail=f"Unknown route: {profile_request.route}")
+    scheduler = get_scheduler()
+    if profile_request.task and not (profile_request.task in scheduler.tasks and scheduler.running):
+        # The tick runs in whichever process holds the worker lock
+        raise HTTPException(status_code=409, detail=f"Task {profile_request.task} is not running in this process (pid {os.getpid()})")
+    try:
+        return await get_profiler().profile(
+            seconds=profile_request.seconds,
+            route=profile_request.route,
+            task=profile_request.task,
+            count=profile_request.count,
+            interval_ms=profile_request.interval_ms,
+            timeout=profile_request.timeout_seconds,
+            allocations_top=profile_request.allocations_top,
+            fmt=profile_request.format
+        )
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 if __name__ == "__main__":
+    import uvicorn
     uvicorn.run(
         "main:app", 
         host="0.0.0.0", 
@@ -0,0 +1,358 @@
+"""
+Schema versioning for RootGuard Bot
+
+The schema version is stored in a one-row `schema_version` table so that a
+normal boot only costs a single SELECT. Tables are created or migrated only
+when the stored version differs from SCHEMA_VERSION.
+"""
+
+import json
+import re
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+from sqlalchemy import Table, Column, Integer, inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+from .database import engine, Base
+
+# Bump this and register a step in MIGRATIONS whenever the models change
+SCHEMA_VERSION = 12
+
+schema_version_table = Table(
+    "schema_version",
+    Base.metadata,
+    Column("version", Integer, nullable=False),
+)
+
+
+def _add_reading_device_id(connection):
+    """v2: tag readings with the device that produced them"""
+    connection.execute(text(
+        "ALTER TABLE sensor_readings ADD COLUMN device_id VARCHAR(50) NOT NULL DEFAULT 'borewell-1'"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_sensor_readings_device_timestamp "
+        "ON sensor_readings (device_id, timestamp)"
+    ))
+
+
+def _add_settings_thresholds(connection):
+    """v3: make every irrigation and alert threshold configurable"""
+    columns = {
+        "survival_dry_level": 20,
+        "survival_target_level": 35,
+        "normal_min_water_level": 30,
+        "survival_min_water_level": 50,
+        "pump_cutoff_water_level": 25,
+        "survival_switch_water_level": 30,
+        "critical_water_level": 20,
+        "low_water_level": 35,
+        "poor_turbidity_level": 50,
+        "low_moisture_alert_level": 25,
+    }
+    for name, default in columns.items():
+        connection.execute(text(f"ALTER TABLE settings ADD COLUMN {name} FLOAT DEFAULT {default}"))
+    connection.execute(text("ALTER TABLE settings ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+
+def _new_tables_only(connection):
+    """Versions that only add tables; create_all has already created them"""
+
+
+def _add_session_flow_accumulator(connection):
+    """v5: integrate measured flow into irrigation sessions"""
+    connection.execute(text(
+        "ALTER TABLE irrigation_sessions ADD COLUMN flow_volume_liters FLOAT NOT NULL DEFAULT 0"
+    ))
+    connection.execute(text("ALTER TABLE irrigation_sessions ADD COLUMN last_flow_rate FLOAT"))
+    connection.execute(text("ALTER TABLE irrigation_sessions ADD COLUMN last_flow_at DATETIME"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_irrigation_sessions_ended_at ON irrigation_sessions (ended_at)"
+    ))
+
+
+# Plain-text messages written by the original seed scripts, before alerts used i18n keys
+LEGACY_ALERT_MESSAGES = (
+    (re.compile(r"Critical water level: ([\d.]+)%"), "alert_critical_water", "level"),
+    (re.compile(r"Low water level: ([\d.]+)%"), "alert_low_water", "level"),
+    (re.compile(r"Poor water quality: ([\d.]+)% clarity"), "alert_poor_water", "turbidity"),
+    (re.compile(r"High vibration detected"), "alert_high_vibration", None),
+    (re.compile(r"Low soil moisture: ([\d.]+)%"), "alert_low_moisture", "moisture"),
+)
+ALERT_BACKFILL_CHUNK = 5000
+
+
+def parse_alert_message(message: str):
+    """Split a stored alert message into (key, params)"""
+    try:
+        data = json.loads(message)
+        if isinstance(data, dict) and data.get("key"):
+            return data["key"], data.get("params") or {}
+    except json.JSONDecodeError:
+        pass
+    for pattern, key, param in LEGACY_ALERT_MESSAGES:
+        match = pattern.match(message)
+        if match:
+            return key, {param: float(match.group(1))} if param else {}
+    # Anything else is shown verbatim
+    return "alert_legacy", {"text": message}
+
+
+def _structure_alerts(connection):
+    """v6: store alert key and params in their own columns instead of a JSON message"""
+    connection.execute(text("ALTER TABLE alerts ADD COLUMN alert_key VARCHAR(64) NOT NULL DEFAULT ''"))
+    connection.execute(text("ALTER TABLE alerts ADD COLUMN params TEXT NOT NULL DEFAULT '{}'"))
+
+    last_id = 0
+    while True:
+        rows = connection.execute(text(
+            "SELECT id, message FROM alerts WHERE id > :last_id ORDER BY id LIMIT :limit"
+        ), {"last_id": last_id, "limit": ALERT_BACKFILL_CHUNK}).all()
+        if not rows:
+            break
+        updates = []
+        for row_id, message in rows:
+            key, params = parse_alert_message(message or "")
+            updates.append({
+                "id": row_id,
+                "alert_key": key,
+                "params": json.dumps(params, separators=(",", ":"), sort_keys=True),
+            })
+        connection.execute(text("UPDATE alerts SET alert_key = :alert_key, params = :params WHERE id = :id"), updates)
+        last_id = rows[-1][0]
+
+    connection.execute(text("ALTER TABLE alerts DROP COLUMN message"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_alerts_key_created ON alerts (alert_key, created_at)"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_alerts_type_created ON alerts (alert_type, created_at)"
+    ))
+
+
+def _version_irrigation_control(connection):
+    """v7: versioned control row and at most one open irrigation session"""
+    connection.execute(text("ALTER TABLE irrigation_control ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+
+    # Close duplicate open sessions left by racing writers, each when the next one started
+    open_sessions = connection.execute(text(
+        "SELECT id, started_at, flow_volume_liters FROM irrigation_sessions "
+        "WHERE ended_at IS NULL ORDER BY started_at, id"
+    )).all()
+    for (row_id, started_at, volume), following in zip(open_sessions, open_sessions[1:]):
+        ended_at = following[1]
+        minutes = 0
+        if started_at and ended_at:
+            start = datetime.fromisoformat(str(started_at))
+            end = datetime.fromisoformat(str(ended_at))
+            minutes = max(int((end - start).total_seconds() / 60), 0)
+        connection.execute(text(
+            "UPDATE irrigation_sessions SET ended_at = :ended_at, duration_minutes = :minutes, "
+            "estimated_volume_liters = :volume WHERE id = :id"
+        ), {"ended_at": ended_at, "minutes": minutes, "volume": round(volume or 0.0, 1), "id": row_id})
+
+    connection.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_irrigation_sessions_open "
+        "ON irrigation_sessions ((ended_at IS NULL)) WHERE ended_at IS NULL"
+    ))
+
+
+def _add_change_seq(connection):
+    """v8: change sequence for delta sync; existing rows stay unsequenced"""
+    for table in ("sensor_readings", "alerts", "irrigation_sessions"):
+        connection.execute(text(f"ALTER TABLE {table} ADD COLUMN change_seq INTEGER"))
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS ix_{table}_change_seq ON {table} (change_seq)"))
+
+
+LEDGER_DEFAULT_TIMEZONE = "Asia/Kolkata"  # Settings' default when v9 was written
+
+
+def _add_water_ledger(connection):
+    """v9: farm timezone setting and the daily water ledger, totalled from closed sessions
+
+    Sessions count towards the farm-local day they started on (naive
+    timestamps are UTC), as the ledger service does for new sessions.
+    """
+    connection.execute(text(
+        f"ALTER TABLE settings ADD COLUMN timezone VARCHAR(64) DEFAULT '{LEDGER_DEFAULT_TIMEZONE}'"
+    ))
+    name = connection.execute(text("SELECT timezone FROM settings ORDER BY id LIMIT 1")).scalar()
+    zone = ZoneInfo(name or LEDGER_DEFAULT_TIMEZONE)
+
+    days = {}
+    rows = connection.execute(text(
+        "SELECT started_at, mode, estimated_volume_liters, duration_minutes FROM irrigation_sessions "
+        "WHERE ended_at IS NOT NULL AND started_at IS NOT NULL"
+    ))
+    for started_at, mode, liters, minutes in rows:
+        started_at = _parse_timestamp(started_at)
+        if started_at.tzinfo is None:
+            started_at = started_at.replace(tzinfo=timezone.utc)
+        ledger = days.setdefault(started_at.astimezone(zone).date(), {
+            "water_liters": 0.0, "sessions": 0, "duration_minutes": 0, "by_mode": {}
+        })
+        totals = ledger["by_mode"].setdefault(mode, {"water_liters": 0.0, "sessions": 0, "duration_minutes": 0})
+        for entry in (ledger, totals):
+            entry["sessions"] += 1
+            entry["duration_minutes"] += minutes or 0
+        ledger["water_liters"] += liters or 0.0
+        totals["water_liters"] = round(totals["water_liters"] + (liters or 0.0), 1)
+
+    connection.execute(text("DELETE FROM water_usage_daily"))
+    if days:
+        connection.execute(text(
+            "INSERT INTO water_usage_daily (day, water_liters, sessions, duration_minutes, by_mode) "
+            "VALUES (:day, :water_liters, :sessions, :duration_minutes, :by_mode)"
+        ), [
+            {
+                "day": day.isoformat(),
+                "water_liters": ledger["water_liters"],
+                "sessions": ledger["sessions"],
+                "duration_minutes": ledger["duration_minutes"],
+                "by_mode": json.dumps(ledger["by_mode"], separators=(",", ":"), sort_keys=True),
+            }
+            for day, ledger in days.items()
+        ])
+
+
+READING_COPY_CHUNK = 20000
+
+
+def _compact_readings(connection):
+    """v10: store readings as tenths, a vibration flag and epoch milliseconds
+
+    SQLite cannot change column types in place, so the table is rebuilt the
+    documented way (foreign keys are off during migrations): create the new
+    layout under a temporary name, copy in id order, drop the old table and
+    rename. Ids are kept, so alert and summary references hold.
+    """
+    from sqlalchemy import MetaData
+    from models.sensor import SensorReading
+
+    for index in inspect(connection).get_indexes("sensor_readings"):
+        connection.execute(text(f"DROP INDEX IF EXISTS {index['name']}"))
+    compact = SensorReading.__table__.to_metadata(MetaData(), name="sensor_readings_compact")
+    compact.indexes.clear()  # Built once the rows are in, under their usual names
+    compact.create(connection)
+
+    last_id = 0
+    while True:
+        rows = connection.execute(text(
+            "SELECT id, device_id, water_level, flow_rate, turbidity, vibration_status, soil_moisture, "
+            "timestamp, change_seq FROM sensor_readings WHERE id > :last_id ORDER BY id LIMIT :limit"
+        ), {"last_id": last_id, "limit": READING_COPY_CHUNK}).mappings().all()
+        if not rows:
+            break
+        connection.execute(compact.insert(), [
+            dict(row, timestamp=_parse_timestamp(row["timestamp"])) for row in rows
+        ])
+        last_id = rows[-1]["id"]
+
+    connection.execute(text("DROP TABLE sensor_readings"))
+    connection.execute(text("ALTER TABLE sensor_readings_compact RENAME TO sensor_readings"))
+    for index in SensorReading.__table__.indexes:
+        index.create(connection)
+
+
+def _parse_timestamp(value):
+    if value is None or isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value))
+
+
+def _add_device_seq(connection):
+    """v11: per-device sequence numbers so retried uploads are recognised"""
+    # The v10 rebuild creates the table from the current model, which may already have it
+    if "device_seq" not in {column["name"] for column in inspect(connection).get_columns("sensor_readings")}:
+        connection.execute(text("ALTER TABLE sensor_readings ADD COLUMN device_seq BIGINT"))
+    connection.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ux_sensor_readings_device_seq "
+        "ON sensor_readings (device_id, device_seq)"
+    ))
+
+
+def _add_alert_resolution(connection):
+    """v12: alerts resolve when their condition clears; finished ones move to alerts_archive"""
+    connection.execute(text("ALTER TABLE alerts ADD COLUMN resolved_at DATETIME"))
+
+
+# version -> callable(connection) upgrading the schema from version - 1
+MIGRATIONS = {
+    2: _add_reading_device_id,
+    3: _add_settings_thresholds,
+    4: _new_tables_only,  # detector_state
+    5: _add_session_flow_accumulator,
+    6: _structure_alerts,
+    7: _version_irrigation_control,
+    8: _add_change_seq,  # and change_sequence
+    9: _add_water_ledger,  # and water_usage_daily
+    10: _compact_readings,
+    11: _add_device_seq,
+    12: _add_alert_resolution,  # and alerts_archive
+}
+
+
+def get_stored_version(connection):
+    """Return the stored schema version, or None if it was never stamped"""
+    try:
+        return connection.execute(text("SELECT version FROM schema_version")).scalar()
+    except (OperationalError, ProgrammingError):
+        connection.rollback()
+        return None
+
+
+def _stamp_version(connection, version: int):
+    connection.execute(schema_version_table.delete())
+    connection.execute(schema_version_table.insert().values(version=version))
+
+
+def init_db(bind=None) -> int:
+    """Create or migrate the database schema if the stored version is stale"""
+    bind = bind or engine
+
+    with bind.connect() as connection:
+        current = get_stored_version(connection)
+    if current == SCHEMA_VERSION:
+        return current
+
+    # Register every model on the metadata before touching the schema
+    import models.sensor  # noqa: F401
+
+    with bind.connect() as connection:
+        sqlite = connection.dialect.name == "sqlite"
+        if sqlite:
+            # Table rebuilds must not trip foreign keys; SQLite only accepts this outside a transaction
+            connection.execute(text("PRAGMA foreign_keys = OFF"))
+            connection.commit()
+        try:
+            with connection.begin():
+                if inspect(connection).has_table("schema_version"):
+                    # Take the write lock first so concurrent API workers migrate one at a time
+                    connection.execute(text("UPDATE schema_version SET version = version"))
+                    current = connection.execute(text("SELECT version FROM schema_version")).scalar()
+                    if current == SCHEMA_VERSION:
+                        return current
+
+                if current is None and inspect(connection).has_table("sensor_readings"):
+                    # Database created by create_all before versioning existed
+                    current = 1
+
+                Base.metadata.create_all(bind=connection)
+
+                if current is not None:
+                    for version in range(current + 1, SCHEMA_VERSION + 1):
+                        print(f"Migrating database schema to version {version}")
+                        MIGRATIONS[version](connection)
+
+                # The change counter is a single row that writers increment
+                connection.execute(text(
+                    "INSERT INTO change_sequence (id, value) SELECT 1, 0 "
+                    "WHERE NOT EXISTS (SELECT 1 FROM change_sequence)"
+                ))
+                _stamp_version(connection, SCHEMA_VERSION)
+        finally:
+            if sqlite:
+                connection.execute(text("PRAGMA foreign_keys = ON"))
+                connection.commit()
+
+    return SCHEMA_VERSION
@@ -1,31 +1,52 @@
-from sqlalchemy import Column, Integer, Float, String, DateTime, Boolean, Text, ForeignKey
+import json
+from datetime import datetime
+from sqlalchemy import BigInteger, Column, Integer, Float, String, Date, DateTime, Boolean, Text, ForeignKey, Index, event, text
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
-from .database import Base
+from .database import Base, SessionLocal
+from .types import CompactJSON, EpochMillis, HighLow, Tenths
+
+# Device id used for readings from the single on-site simulator/collector
+DEFAULT_DEVICE_ID = "borewell-1"
+
+# Farm-local calendar days (water ledger) use this unless settings say otherwise
+DEFAULT_TIMEZONE = "Asia/Kolkata"
 
 class SensorReading(Base):
     __tablename__ = "sensor_readings"
     
     id = Column(Integer, primary_key=True, index=True)
-    water_level = Column(Float, nullable=False)  # 0-100%
-    flow_rate = Column(Float, nullable=False)    # L/min
-    turbidity = Column(Float, nullable=False)    # 0-100% clarity
-    vibration_status = Column(String(10), nullable=False)  # 'low' or 'high'
-    soil_moisture = Column(Float, nullable=False)  # 0-100%
-    timestamp = Column(DateTime(timezone=True), server_default=func.now())
+    device_id = Column(String(50), nullable=False, default=DEFAULT_DEVICE_ID, server_default=DEFAULT_DEVICE_ID)
+    # Compact storage (see models.types); the attributes keep their API types
+    water_level = Column(Tenths, nullable=False)  # 0-100%
+    flow_rate = Column(Tenths, nullable=False)    # L/min
+    turbidity = Column(Tenths, nullable=False)    # 0-100% clarity
+    vibration_status = Column(HighLow, nullable=False)  # 'low' or 'high'
+    soil_moisture = Column(Tenths, nullable=False)  # 0-100%
+    timestamp = Column(EpochMillis, default=datetime.utcnow)  # Naive UTC
+    change_seq = Column(Integer, nullable=True)  # Set on write, see ChangeSequence
+    device_seq = Column(BigInteger, nullable=True)  # Sender's own counter; a repeat is a retried upload
     
     # Relationships
     alerts = relationship("Alert", back_populates="sensor_reading")
     
+    __table_args__ = (
+        Index("ix_sensor_readings_device_timestamp", "device_id", "timestamp"),
+        Index("ix_sensor_readings_change_seq", "change_seq"),
+        Index("ux_sensor_readings_device_seq", "device_id", "device_seq", unique=True),
+    )
+    
     def to_dict(self):
         return {
             "id": self.id,
+            "device_id": self.device_id,
             "water_level": self.water_level,
             "flow_rate": self.flow_rate,
             "turbidity": self.turbidity,
             "vibration_status": self.vibration_status,
             "soil_moisture": self.soil_moisture,
-            "timestamp": self.timestamp
+            "timestamp": self.timestamp,
+            "device_seq": self.device_seq
         }
 
 class SensorData(Base):
@@ -50,6 +71,12 @@ class IrrigationControl(Base):
     auto_mode = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    # Optimistic concurrency: every UPDATE checks and bumps this, so a writer
+    # working from a stale read fails instead of overwriting
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    
+    __mapper_args__ = {"version_id_col": version}
 
 class IrrigationSession(Base):
     __tablename__ = "irrigation_sessions"
@@ -59,14 +86,30 @@ class IrrigationSession(Base):
     started_at = Column(DateTime(timezone=True), server_default=func.now())
     ended_at = Column(DateTime(timezone=True), nullable=True)
     duration_minutes = Column(Integer, nullable=True)  # Calculated when session ends
-    estimated_volume_liters = Column(Float, nullable=True)  # Estimated water volume used
+    estimated_volume_liters = Column(Float, nullable=True)  # Water volume used (integrated from flow readings)
     trigger_reason = Column(Text, nullable=True)  # Why this session started
     sensor_reading_id = Column(Integer, ForeignKey("sensor_readings.id"), nullable=True)
     
+    # Running flow integral while the session is open
+    flow_volume_liters = Column(Float, nullable=False, default=0.0, server_default="0")
+    last_flow_rate = Column(Float, nullable=True)  # L/min at last_flow_at
+    last_flow_at = Column(DateTime(timezone=True), nullable=True)
+    change_seq = Column(Integer, nullable=True)  # Set on write, see ChangeSequence
+    
     # Relationships
     sensor_reading = relationship("SensorReading")
     alerts = relationship("Alert", back_populates="irrigation_session")
     
+    __table_args__ = (
+        Index("ix_irrigation_sessions_ended_at", "ended_at"),
+        Index("ix_irrigation_sessions_change_seq", "change_seq"),
+        # At most one open session: the expression is the same for every open row
+        Index(
+            "ux_irrigation_sessions_open", text("(ended_at IS NULL)"), unique=True,
+            sqlite_where=text("ended_at IS NULL"), postgresql_where=text("ended_at IS NULL")
+        ),
+    )
+    
     def to_dict(self):
         return {
             "id": self.id,
@@ -79,33 +122,77 @@ class IrrigationSession(Base):
             "sensor_reading_id": self.sensor_reading_id
         }
 
-class Alert(Base):
+class AlertFields:
+    """What the API shows of an alert, live or archived"""
+    
+    @property
+    def message(self) -> str:
+        """The key/params JSON the frontend translates"""
+        return json.dumps({"key": self.alert_key, "params": self.params or {}})
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "alert_type": self.alert_type,
+            "alert_key": self.alert_key,
+            "params": self.params,
+            "message": self.message,
+            "is_dismissed": self.is_dismissed,
+            "sensor_reading_id": self.sensor_reading_id,
+            "irrigation_session_id": self.irrigation_session_id,
+            "created_at": self.created_at,
+            "dismissed_at": self.dismissed_at,
+            "resolved_at": self.resolved_at
+        }
+
+class Alert(AlertFields, Base):
+    """Active alerts; dismissed and resolved ones move to alerts_archive (see AlertService.archive)"""
     __tablename__ = "alerts"
     
     id = Column(Integer, primary_key=True, index=True)
-    alert_type = Column(String(20), nullable=False)  # 'critical', 'warning', 'info'
-    message = Column(Text, nullable=False)
+    alert_type = Column(String(20), nullable=False)  # Severity: 'critical', 'warning', 'info'
+    alert_key = Column(String(64), nullable=False)  # i18n key, e.g. 'alert_high_vibration'
+    params = Column(CompactJSON, nullable=False, default=dict)  # i18n parameters
     is_dismissed = Column(Boolean, default=False)
     sensor_reading_id = Column(Integer, ForeignKey("sensor_readings.id"), nullable=True)
     irrigation_session_id = Column(Integer, ForeignKey("irrigation_sessions.id"), nullable=True)  # Link to irrigation session if applicable
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     dismissed_at = Column(DateTime(timezone=True), nullable=True)
+    resolved_at = Column(DateTime(timezone=True), nullable=True)  # The condition cleared
+    change_seq = Column(Integer, nullable=True)  # Set on write, see ChangeSequence
     
     # Relationships
     sensor_reading = relationship("SensorReading", back_populates="alerts")
     irrigation_session = relationship("IrrigationSession", back_populates="alerts")
     
-    def to_dict(self):
-        return {
-            "id": self.id,
-            "alert_type": self.alert_type,
-            "message": self.message,
-            "is_dismissed": self.is_dismissed,
-            "sensor_reading_id": self.sensor_reading_id,
-            "irrigation_session_id": self.irrigation_session_id,
-            "created_at": self.created_at,
-            "dismissed_at": self.dismissed_at
-        }
+    __table_args__ = (
+        Index("ix_alerts_key_created", "alert_key", "created_at"),
+        Index("ix_alerts_type_created", "alert_type", "created_at"),
+        Index("ix_alerts_change_seq", "change_seq"),
+    )
+
+class AlertArchive(AlertFields, Base):
+    """Dismissed and resolved alerts, moved here unchanged (same id and change_seq)"""
+    __tablename__ = "alerts_archive"
+    
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    alert_type = Column(String(20), nullable=False)
+    alert_key = Column(String(64), nullable=False)
+    params = Column(CompactJSON, nullable=False, default=dict)
+    is_dismissed = Column(Boolean, default=False)
+    sensor_reading_id = Column(Integer, nullable=True)  # No foreign keys: archived rows outlive what they point at
+    irrigation_session_id = Column(Integer, nullable=True)
+    created_at = Column(DateTime(timezone=True))
+    dismissed_at = Column(DateTime(timezone=True), nullable=True)
+    resolved_at = Column(DateTime(timezone=True), nullable=True)
+    change_seq = Column(Integer, nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+    
+    __table_args__ = (
+        Index("ix_alerts_archive_key_created", "alert_key", "created_at"),
+        Index("ix_alerts_archive_type_created", "alert_type", "created_at"),
+        Index("ix_alerts_archive_change_seq", "change_seq"),
+    )
 
 class Settings(Base):
     __tablename__ = "settings"
@@ -125,13 +212,29 @@ class Settings(Base):
     push_enabled = Column(Boolean, default=True)
     
     # Thresholds
-    dry_level = Column(Float, default=40.0)
-    optimal_level = Column(Float, default=65.0)
+    dry_level = Column(Float, default=40.0)  # Normal mode irrigates below this soil moisture
+    optimal_level = Column(Float, default=65.0)  # Normal mode stops irrigating above this
+    survival_dry_level = Column(Float, default=20.0, server_default="20")
+    survival_target_level = Column(Float, default=35.0, server_default="35")
+    normal_min_water_level = Column(Float, default=30.0, server_default="30")  # Water needed to irrigate in normal mode
+    survival_min_water_level = Column(Float, default=50.0, server_default="50")  # Water needed to irrigate in survival mode
+    pump_cutoff_water_level = Column(Float, default=25.0, server_default="25")  # Never irrigate below this
+    survival_switch_water_level = Column(Float, default=30.0, server_default="30")  # Auto-switch to survival below this
+    critical_water_level = Column(Float, default=20.0, server_default="20")
+    low_water_level = Column(Float, default=35.0, server_default="35")
+    poor_turbidity_level = Column(Float, default=50.0, server_default="50")
+    low_moisture_alert_level = Column(Float, default=25.0, server_default="25")
+    
+    # Bumped on every update so cached rule tables can tell they are stale
+    version = Column(Integer, nullable=False, default=1, server_default="1")
     
     # Pi Settings
     pi_ip = Column(String(50), default="192.168.1.100")
     pi_port = Column(Integer, default=8000)
     
+    # IANA zone that defines the farm's calendar days
+    timezone = Column(String(64), default=DEFAULT_TIMEZONE, server_default=DEFAULT_TIMEZONE)
+    
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     def to_dict(self):
@@ -147,7 +250,76 @@ class Settings(Base):
             "push_enabled": self.push_enabled,
             "dry_level": self.dry_level,
             "optimal_level": self.optimal_level,
+            "survival_dry_level": self.survival_dry_level,
+            "survival_target_level": self.survival_target_level,
+            "normal_min_water_level": self.normal_min_water_level,
+            "survival_min_water_level": self.survival_min_water_level,
+            "pump_cutoff_water_level": self.pump_cutoff_water_level,
+            "survival_switch_water_level": self.survival_switch_water_level,
+            "critical_water_level": self.critical_water_level,
+            "low_water_level": self.low_water_level,
+            "poor_turbidity_level": self.poor_turbidity_level,
+            "low_moisture_alert_level": self.low_moisture_alert_level,
+            "version": self.version,
             "pi_ip": self.pi_ip,
             "pi_port": self.pi_port,
+            "timezone": self.timezone,
             "updated_at": self.updated_at
-        }
\ No newline at end of file
+        }
+class DetectorState(Base):
+    __tablename__ = "detector_state"
+    
+    name = Column(String(50), primary_key=True)  # e.g. 'anomaly'
+    state = Column(Text, nullable=False)  # JSON checkpoint of in-memory detector state
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class DailyWaterUsage(Base):
+    """Water ledger: closed irrigation sessions totalled per farm-local day (by start time)"""
+    __tablename__ = "water_usage_daily"
+    
+    day = Column(Date, primary_key=True)
+    water_liters = Column(Float, nullable=False, default=0.0)
+    sessions = Column(Integer, nullable=False, default=0)
+    duration_minutes = Column(Integer, nullable=False, default=0)
+    by_mode = Column(CompactJSON, nullable=False, default=dict)  # mode -> the same three totals
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def to_dict(self):
+        return {
+            "water_liters": round(self.water_liters, 1),
+            "sessions": self.sessions,
+            "duration_minutes": self.duration_minutes,
+            "by_mode": self.by_mode
+        }
+
+class ChangeSequence(Base):
+    """Monotonic counter stamped on every synced row that is inserted or changed
+
+    Allocating a value updates this single row, so the writer holds its lock
+    until commit. Transactions therefore commit in sequence order, and once a
+    reader sees the counter at N every change up to N is visible.
+    """
+    __tablename__ = "change_sequence"
+    
+    id = Column(Integer, primary_key=True)
+    value = Column(Integer, nullable=False, default=0, server_default="0")
+
+# Rows offline clients sync by change_seq (see /api/sync)
+SYNCED_MODELS = (SensorReading, Alert, IrrigationSession)
+
+@event.listens_for(SessionLocal, "before_flush")
+def _stamp_change_seq(session, flush_context, instances):
+    changed = [obj for obj in session.new if isinstance(obj, SYNCED_MODELS)]
+    changed.extend(
+        obj for obj in session.dirty
+        if isinstance(obj, SYNCED_MODELS) and session.is_modified(obj, include_collections=False)
+    )
+    if not changed:
+        return
+    
+    session.execute(
+        text("UPDATE change_sequence SET value = value + :n WHERE id = 1"), {"n": len(changed)}
+    )
+    last = session.execute(text("SELECT value FROM change_sequence WHERE id = 1")).scalar()
+    for seq, obj in enumerate(changed, start=last - len(changed) + 1):
+        obj.change_seq = seq
@@ -0,0 +1,114 @@
+import json
+import math
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import case, literal_column, type_coerce
+from sqlalchemy.types import BigInteger, Boolean, Integer, Text, TypeDecorator
+
+
+class CompactJSON(TypeDecorator):
+    """Dict stored as minimal, key-sorted JSON text
+
+    The encoding is canonical, so equal dicts store identical strings and
+    can be compared (and deduplicated) in SQL without parsing.
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return json.dumps(value, separators=(",", ":"), sort_keys=True)
+
+    def process_result_value(self, value, dialect):
+        if value is None:
+            return None
+        return json.loads(value)
+
+
+EPOCH = datetime(1970, 1, 1)
+MILLISECOND = timedelta(milliseconds=1)
+
+
+def to_epoch_ms(moment: datetime) -> int:
+    """Milliseconds since the Unix epoch; naive values are UTC"""
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(timezone.utc).replace(tzinfo=None)
+    return (moment - EPOCH) // MILLISECOND
+
+
+def from_epoch_ms(value: int) -> datetime:
+    """Naive UTC datetime for milliseconds since the Unix epoch"""
+    return EPOCH + value * MILLISECOND
+
+
+INTEGER_MIN, INTEGER_MAX = -2 ** 63, 2 ** 63 - 1  # SQLite INTEGER
+
+
+def _epoch_ms_result(value):
+    return EPOCH + value * MILLISECOND if value is not None else None
+
+
+class Tenths(TypeDecorator):
+    """Float with one decimal stored as an integer count of tenths
+
+    Readings are rounded to 0.1 anyway; 0-100% becomes 0-1000, which SQLite
+    stores in two bytes instead of an eight-byte REAL. Selected values are
+    scaled back in SQL; aggregates written against the raw column see tenths.
+    """
+
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        if not math.isfinite(value) or not INTEGER_MIN <= value * 10 <= INTEGER_MAX:
+            raise ValueError(f"{value} is out of range for a tenths column")
+        return int(round(value * 10))
+
+    def column_expression(self, column):
+        # Scaled back in SQL: the driver hands over floats with no per-value Python call
+        return column / literal_column("10.0")
+
+    def result_processor(self, dialect, coltype):
+        return None
+
+
+class HighLow(TypeDecorator):
+    """'high'/'low' stored as a boolean (no payload bytes at all in SQLite)"""
+
+    impl = Boolean
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return value == "high"
+
+    def column_expression(self, column):
+        return case((type_coerce(column, Boolean), literal_column("'high'")), else_=literal_column("'low'"))
+
+    def result_processor(self, dialect, coltype):
+        return None
+
+
+class EpochMillis(TypeDecorator):
+    """Naive UTC datetime stored as integer milliseconds since the epoch
+
+    Six bytes in SQLite instead of a 26-character ISO string, and compared as
+    plain integers in indexes. Sub-millisecond precision is dropped.
+    """
+
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return to_epoch_ms(value)
+
+    def result_processor(self, dialect, coltype):
+        # Runs once per value fetched; skip TypeDecorator's wrapper
+        return _epoch_ms_result
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Recompute irrigation session water volumes from stored flow readings
+
+Corrects sessions whose volume was estimated before flow integration
+existed (a flat 15 L/min guess) or after readings were back-filled.
+
+Usage: python recompute_volumes.py [--days 30]
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from models.database import SessionLocal
+from models.migrations import init_db
+from services.irrigation_service import IrrigationService
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Recompute session volumes from flow readings")
+    parser.add_argument("--days", type=float, default=None, help="Only sessions started in the last N days (default: all)")
+    args = parser.parse_args()
+
+    init_db()
+    since = datetime.utcnow() - timedelta(days=args.days) if args.days else None
+
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        count = await IrrigationService(db).recompute_session_volumes(since)
+        print(f"✓ Recomputed {count} irrigation sessions in {time.perf_counter() - started:.1f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,6 +1,8 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import Optional, List, Literal
+from typing import Any, Dict, Optional, List, Literal
+
+MAX_FLOW_RATE = 1000  # L/min; far above any borewell pump, well inside the stored integer range
 
 class SensorDataResponse(BaseModel):
     water_level: float = Field(..., ge=0, le=100, description="Water level percentage")
@@ -13,6 +15,24 @@ class SensorDataResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class SensorReadingResponse(SensorDataResponse):
+    id: int
+    device_id: str
+    device_seq: Optional[int] = None
+
+class SensorReadingIngest(BaseModel):
+    device_id: Optional[str] = Field(None, max_length=50, description="Reporting device (defaults to the on-site unit)")
+    water_level: float = Field(..., ge=0, le=100, description="Water level percentage")
+    flow_rate: float = Field(..., ge=0, le=MAX_FLOW_RATE, description="Flow rate in L/min")
+    turbidity: float = Field(..., ge=0, le=100, description="Water clarity percentage")
+    vibration_status: Literal["low", "high"] = Field(..., description="Vibration status")
+    soil_moisture: float = Field(..., ge=0, le=100, description="Soil moisture percentage")
+    timestamp: Optional[datetime] = Field(None, description="Reading timestamp (defaults to arrival time)")
+    device_seq: Optional[int] = Field(None, ge=0, lt=2**63, description="Device's reading counter; a repeat of a stored one is ignored")
+
+    class Config:
+        allow_inf_nan = False
+
 class HealthScoreResponse(BaseModel):
     score: int = Field(..., ge=0, le=100, description="Health score 0-100")
     status: Literal["normal", "warning", "critical"] = Field(..., description="Health status")
@@ -25,12 +45,19 @@ class IrrigationControlRequest(BaseModel):
     mode: Optional[Literal["normal", "survival", "manual", "off"]] = None
     is_irrigating: Optional[bool] = None
     auto_mode: Optional[bool] = None
+    expected_version: Optional[int] = Field(None, description="Reject with 409 unless the control is still at this version")
+
+    @property
+    def stops_pump(self) -> bool:
+        """Switches irrigation off (these always keep reserved rate-limit capacity)"""
+        return self.mode == "off" or self.is_irrigating is False
 
 class IrrigationStatusResponse(BaseModel):
     mode: str = Field(..., description="Current irrigation mode")
     is_irrigating: bool = Field(..., description="Whether system is currently irrigating")
     auto_mode: bool = Field(..., description="Whether auto mode is enabled")
     last_updated: datetime = Field(..., description="Last update timestamp")
+    version: int = Field(0, description="Control state version, for expected_version")
 
     class Config:
         from_attributes = True
@@ -38,9 +65,13 @@ class IrrigationStatusResponse(BaseModel):
 class AlertResponse(BaseModel):
     id: int
     alert_type: Literal["critical", "warning", "info"]
-    message: str
+    alert_key: str
+    params: Dict[str, Any] = {}
+    message: str  # {"key": ..., "params": ...} JSON, kept for existing clients
     created_at: datetime
     is_dismissed: bool = False
+    dismissed_at: Optional[datetime] = None
+    resolved_at: Optional[datetime] = None  # Set when the condition cleared
 
     class Config:
         from_attributes = True
@@ -57,8 +88,74 @@ class IrrigationSessionResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class SyncResponse(BaseModel):
+    token: int = Field(..., description="Pass as `since` on the next sync")
+    full: bool = Field(..., description="True when this is a snapshot that replaces the client's cache")
+    has_more: bool = Field(False, description="More changes are waiting; sync again right away")
+    readings: List[SensorReadingResponse] = []
+    alerts: List[AlertResponse] = []  # Dismissed and resolved alerts included, so clients can drop them
+    sessions: List[IrrigationSessionResponse] = []
+
+class AlertCountResponse(BaseModel):
+    alert_key: str
+    alert_type: Literal["critical", "warning", "info"]
+    count: int
+    active: int
+    last_created_at: Optional[datetime] = None
+
+class AlertDismissRequest(BaseModel):
+    ids: Optional[List[int]] = Field(None, max_length=1000)
+    alert_key: Optional[str] = None
+    alert_type: Optional[Literal["critical", "warning", "info"]] = None
+    since: Optional[datetime] = Field(None, description="Created at or after this time")
+    until: Optional[datetime] = Field(None, description="Created before this time")
+
 class AlertCreate(BaseModel):
     alert_type: Literal["critical", "warning", "info"]
-    message: str
+    alert_key: str
+    params: Dict[str, Any] = {}
     sensor_reading_id: Optional[int] = None
-    irrigation_session_id: Optional[int] = None
\ No newline at end of file
+    irrigation_session_id: Optional[int] = None
+
+class SettingsUpdateRequest(BaseModel):
+    farm_name: Optional[str] = Field(None, max_length=100)
+    borewell_depth: Optional[float] = Field(None, gt=0)
+    crop_type: Optional[str] = Field(None, max_length=50)
+    location: Optional[str] = Field(None, max_length=100)
+    critical_alert: Optional[bool] = None
+    warning_alert: Optional[bool] = None
+    sms_alert: Optional[bool] = None
+    push_enabled: Optional[bool] = None
+    dry_level: Optional[float] = Field(None, ge=0, le=100, description="Normal mode irrigates below this soil moisture")
+    optimal_level: Optional[float] = Field(None, ge=0, le=100, description="Normal mode stops irrigating above this soil moisture")
+    survival_dry_level: Optional[float] = Field(None, ge=0, le=100)
+    survival_target_level: Optional[float] = Field(None, ge=0, le=100)
+    normal_min_water_level: Optional[float] = Field(None, ge=0, le=100)
+    survival_min_water_level: Optional[float] = Field(None, ge=0, le=100)
+    pump_cutoff_water_level: Optional[float] = Field(None, ge=0, le=100)
+    survival_switch_water_level: Optional[float] = Field(None, ge=0, le=100)
+    critical_water_level: Optional[float] = Field(None, ge=0, le=100)
+    low_water_level: Optional[float] = Field(None, ge=0, le=100)
+    poor_turbidity_level: Optional[float] = Field(None, ge=0, le=100)
+    low_moisture_alert_level: Optional[float] = Field(None, ge=0, le=100)
+    pi_ip: Optional[str] = Field(None, max_length=50)
+    pi_port: Optional[int] = Field(None, ge=1, le=65535)
+    timezone: Optional[str] = Field(None, max_length=64, description="IANA timezone of the farm, e.g. Asia/Kolkata")
+
+class SettingsResponse(SettingsUpdateRequest):
+    id: int
+    version: int = Field(..., description="Incremented on every update")
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+class ProfileRequest(BaseModel):
+    seconds: Optional[float] = Field(None, gt=0, le=300, description="Profile everything for this long")
+    route: Optional[str] = Field(None, description="Or: profile around requests to this route path, e.g. /api/analytics/comprehensive")
+    task: Optional[str] = Field(None, description="Or: profile around runs of this scheduled task, e.g. sensor_tick")
+    count: int = Field(1, ge=1, le=1000, description="Requests or task runs to cover")
+    timeout_seconds: float = Field(120, gt=0, le=600, description="Give up waiting for requests or runs after this long")
+    interval_ms: float = Field(5, ge=1, le=1000, description="Sampling interval")
+    format: Literal["collapsed", "speedscope"] = "collapsed"
+    allocations_top: int = Field(0, ge=0, le=100, description="Also report this many top tracemalloc allocation sites")
@@ -1,270 +1,353 @@
 """
 Database Seeding Script for RootGuard Bot
-Generates realistic mock data for sensors, irrigation sessions, and alerts
+Generates realistic, deterministic mock data for sensors, irrigation sessions,
+and alerts at any scale, from a quick demo dataset up to tens of millions of
+readings for load testing.
+
+Readings are generated in time-ordered chunks across all devices and written
+with Core executemany inside large transactions; primary keys are assigned up
+front so sessions and alerts can reference readings without round trips.
+Dismissed alerts go straight to alerts_archive, where the archive task would
+have moved them. The same --seed and --end always give the same rows.
+
+Usage:
+    python seed_database.py                                  # 1 device, 7 days, 5 min interval
+    python seed_database.py --scale 10 --devices 50 --days 30 --seed 7
 """
 
-from models.database import SessionLocal, engine, Base
-from models.sensor import SensorReading, IrrigationControl, IrrigationSession, Alert
-from datetime import datetime, timedelta
+import argparse
 import random
-import math
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, text
+from models.database import SessionLocal, engine
+from models.migrations import init_db
+from models.sensor import (
+    SensorReading, SensorData, IrrigationControl, IrrigationSession, Alert, AlertArchive, DEFAULT_DEVICE_ID
+)
+from services.irrigation_service import FlowAccumulator
+from services.water_ledger import WaterLedgerService
+
+# Base dataset: one reading every 5 minutes per device; --scale multiplies the rate
+BASE_INTERVAL_SECONDS = 300
+
+# Irrigation durations in minutes by mode (survival sessions are shorter)
+SESSION_DURATIONS = {
+    'normal': (8, 20),
+    'survival': (3, 8),
+    'manual': (5, 15),
+}
+
+
+class DeviceSimulator:
+    """Random-walk sensor model for one borewell with diurnal patterns
+
+    Water level and soil moisture drop while the sun is up and recover at
+    night, flow rate jumps while an irrigation session runs, and irrigation
+    starts mostly when the soil is dry during the day.
+    """
+
+    def __init__(self, device_id: str, rng: random.Random, step_seconds: float):
+        self.device_id = device_id
+        self.rng = rng
+        # Per-step changes were tuned for 5 minute steps
+        self.step_factor = step_seconds / BASE_INTERVAL_SECONDS
+        self.step_seconds = step_seconds
+
+        self.water_level = rng.uniform(60, 85)
+        self.turbidity = rng.uniform(75, 95)
+        self.soil_moisture = rng.uniform(40, 65)
+
+        self.session = None  # open session dict while irrigating
+
+    def step(self, timestamp: datetime, reading_id: int):
+        """Advance one interval; return (reading row, finished session or None)"""
+        rng = self.rng
+        factor = self.step_factor
+        is_daytime = 6 <= timestamp.hour <= 18
+
+        # Water level: drawn down during the day, recharges at night
+        self.water_level += rng.uniform(-2, 1) * factor if is_daytime else rng.uniform(-1, 2) * factor
+        self.water_level = max(15, min(95, self.water_level))
+
+        # Turbidity: generally high, occasional dips that settle back
+        self.turbidity += (rng.uniform(-3, 3) + (85 - self.turbidity) * 0.05) * factor
+        self.turbidity = max(40, min(98, self.turbidity))
+
+        # Soil moisture: decreases during day (6am-6pm), stable at night
+        if is_daytime:
+            self.soil_moisture += rng.uniform(-4, 1) * factor
+        else:
+            self.soil_moisture += rng.uniform(-1, 2) * factor
+
+        finished = None
+        if self.session is None:
+            if self.soil_moisture < 40 and is_daytime and rng.random() < 0.1 * factor:
+                mode = rng.choices(['normal', 'survival', 'manual'], weights=[6, 2, 2])[0]
+                low, high = SESSION_DURATIONS[mode]
+                self.session = {
+                    'mode': mode,
+                    'started_at': timestamp,
+                    'remaining_seconds': rng.randint(low, high) * 60,
+                    'flow': FlowAccumulator(timestamp),
+                    'sensor_reading_id': reading_id,
+                    'trigger_reason': (
+                        "Manual irrigation started by user" if mode == 'manual'
+                        else f"Auto irrigation - Soil moisture below threshold ({round(self.soil_moisture, 1)}%)"
+                    ),
+                }
+
+        # Flow rate: high while irrigating, trickle otherwise (rounded as
+        # stored, so session volumes match a recompute from the readings)
+        if self.session is not None:
+            flow_rate = round(rng.uniform(10, 18), 1)
+            self.soil_moisture += rng.uniform(3, 8) * factor
+            self.session['flow'].add(flow_rate, timestamp)
+            self.session['remaining_seconds'] -= self.step_seconds
+            if self.session['remaining_seconds'] <= 0:
+                finished = self._close_session(timestamp)
+        else:
+            flow_rate = round(rng.uniform(0, 3), 1)
+
+        self.soil_moisture = max(20, min(85, self.soil_moisture))
+
+        reading = {
+            'id': reading_id,
+            'device_id': self.device_id,
+            'water_level': round(self.water_level, 1),
+            'flow_rate': flow_rate,
+            'turbidity': round(self.turbidity, 1),
+            'vibration_status': "high" if rng.random() < 0.03 else "low",
+            'soil_moisture': round(self.soil_moisture, 1),
+            'timestamp': timestamp,
+        }
+        return reading, finished
+
+    def _close_session(self, ended_at: datetime) -> dict:
+        session, self.session = self.session, None
+        duration = (ended_at - session['started_at']).total_seconds() / 60
+        return {
+            'mode': session['mode'],
+            'started_at': session['started_at'],
+            'ended_at': ended_at,
+            'duration_minutes': int(duration),
+            'estimated_volume_liters': round(session['flow'].total(ended_at), 1),
+            'trigger_reason': session['trigger_reason'],
+            'sensor_reading_id': session['sensor_reading_id'],
+        }
+
+
+def alerts_for_reading(reading: dict, rng: random.Random, end: datetime) -> list:
+    """Build alert rows for a reading using the same keys as the live service"""
+    conditions = []
+    if reading['water_level'] < 20:
+        conditions.append(('critical', 'alert_critical_water', {'level': reading['water_level']}))
+    elif reading['water_level'] < 35:
+        conditions.append(('warning', 'alert_low_water', {'level': reading['water_level']}))
+    if reading['turbidity'] < 50:
+        conditions.append(('warning', 'alert_poor_water', {'turbidity': reading['turbidity']}))
+    if reading['vibration_status'] == 'high':
+        conditions.append(('critical', 'alert_high_vibration', {}))
+    if reading['soil_moisture'] < 25:
+        conditions.append(('info', 'alert_low_moisture', {'moisture': reading['soil_moisture']}))
+
+    alerts = []
+    for alert_type, key, params in conditions:
+        # Older alerts are mostly dismissed
+        age_days = (end - reading['timestamp']).days
+        is_dismissed = rng.random() < (0.7 if age_days > 2 else 0.3)
+        dismissed_at = min(reading['timestamp'] + timedelta(hours=rng.randint(1, 12)), end) if is_dismissed else None
+        alerts.append({
+            'alert_type': alert_type,
+            'alert_key': key,
+            'params': params,
+            'is_dismissed': is_dismissed,
+            'sensor_reading_id': reading['id'],
+            'created_at': reading['timestamp'],
+            'dismissed_at': dismissed_at,
+        })
+    return alerts
+
 
 def clear_database():
     """Clear all existing data"""
     db = SessionLocal()
     try:
+        db.query(AlertArchive).delete()
         db.query(Alert).delete()
         db.query(IrrigationSession).delete()
         db.query(IrrigationControl).delete()
+        db.query(SensorData).delete()
         db.query(SensorReading).delete()
         db.commit()
         print("✓ Database cleared")
     finally:
         db.close()
 
-def seed_sensor_readings(db, num_readings=150):
-    """Generate realistic sensor readings over the past 7 days"""
-    print(f"Generating {num_readings} sensor readings...")
-    
-    # Start from 7 days ago
-    start_time = datetime.utcnow() - timedelta(days=7)
-    time_increment = timedelta(minutes=5)  # Reading every 5 minutes
-    
-    # Initial values
-    water_level = 75.0
-    flow_rate = 12.0
-    turbidity = 85.0
-    soil_moisture = 55.0
-    
-    readings = []
-    for i in range(num_readings):
-        timestamp = start_time + (time_increment * i)
-        
-        # Simulate realistic patterns
-        hour = timestamp.hour
-        
-        # Water level: decreases during day, increases after irrigation
-        water_level += random.uniform(-2, 1)
-        water_level = max(15, min(95, water_level))
-        
-        # Flow rate: varies based on irrigation activity
-        if random.random() < 0.1:  # 10% chance of irrigation
-            flow_rate = random.uniform(10, 18)
-        else:
-            flow_rate = random.uniform(0, 3)
-        
-        # Turbidity: generally high, occasional dips
-        turbidity += random.uniform(-3, 2)
-        turbidity = max(40, min(98, turbidity))
-        
-        # Soil moisture: decreases during day (6am-6pm), increases after irrigation
-        if 6 <= hour <= 18:
-            soil_moisture += random.uniform(-4, 1)  # Drying during day
-        else:
-            soil_moisture += random.uniform(-1, 2)  # Stable at night
-        
-        # If irrigation is happening, increase soil moisture
-        if flow_rate > 5:
-            soil_moisture += random.uniform(3, 8)
-        
-        soil_moisture = max(20, min(85, soil_moisture))
-        
-        # Vibration: mostly low, occasionally high
-        vibration_status = "high" if random.random() < 0.03 else "low"
-        
-        reading = SensorReading(
-            water_level=round(water_level, 1),
-            flow_rate=round(flow_rate, 1),
-            turbidity=round(turbidity, 1),
-            vibration_status=vibration_status,
-            soil_moisture=round(soil_moisture, 1),
-            timestamp=timestamp
-        )
-        readings.append(reading)
-    
-    db.bulk_save_objects(readings)
-    db.commit()
-    print(f"✓ Created {num_readings} sensor readings")
-    return readings
-
-def seed_irrigation_sessions(db, sensor_readings):
-    """Generate irrigation sessions based on sensor data"""
-    print("Generating irrigation sessions...")
-    
-    sessions = []
-    modes = ['normal', 'survival', 'manual']
-    
-    # Create 20-30 irrigation sessions over the past week
-    num_sessions = random.randint(20, 30)
-    
-    for i in range(num_sessions):
-        mode = random.choice(modes)
-        
-        # Random start time in the past week
-        days_ago = random.uniform(0, 7)
-        started_at = datetime.utcnow() - timedelta(days=days_ago)
-        
-        # Duration varies by mode
-        if mode == 'survival':
-            duration = random.randint(3, 8)  # Shorter in survival mode
-        elif mode == 'manual':
-            duration = random.randint(5, 15)
-        else:  # normal
-            duration = random.randint(8, 20)
-        
-        ended_at = started_at + timedelta(minutes=duration)
-        
-        # Calculate estimated volume (flow rate * duration)
-        avg_flow_rate = random.uniform(10, 15)
-        estimated_volume = round(avg_flow_rate * duration, 1)
-        
-        # Trigger reason
-        if mode == 'survival':
-            trigger_reason = "Low water level - Survival mode activated"
-        elif mode == 'manual':
-            trigger_reason = "Manual irrigation started by user"
-        else:
-            trigger_reason = f"Auto irrigation - Soil moisture below threshold"
-        
-        session = IrrigationSession(
-            mode=mode,
-            started_at=started_at,
-            ended_at=ended_at,
-            duration_minutes=duration,
-            estimated_volume_liters=estimated_volume,
-            trigger_reason=trigger_reason,
-            sensor_reading_id=random.choice(sensor_readings).id if sensor_readings else None
-        )
-        sessions.append(session)
-    
-    db.bulk_save_objects(sessions)
-    db.commit()
-    print(f"✓ Created {len(sessions)} irrigation sessions")
-    return sessions
-
-def seed_alerts(db, sensor_readings):
-    """Generate alerts based on sensor conditions"""
-    print("Generating alerts...")
-    
-    alerts = []
-    alert_types = ['critical', 'warning', 'info']
-    
-    # Create alerts based on sensor readings
-    for reading in random.sample(sensor_readings, min(30, len(sensor_readings))):
-        alert_messages = []
-        
-        # Critical water level
-        if reading.water_level < 25:
-            alert_messages.append({
-                'type': 'critical',
-                'message': f'Critical water level: {reading.water_level}%'
-            })
-        elif reading.water_level < 40:
-            alert_messages.append({
-                'type': 'warning',
-                'message': f'Low water level: {reading.water_level}%'
-            })
-        
-        # Turbidity issues
-        if reading.turbidity < 60:
-            alert_messages.append({
-                'type': 'warning',
-                'message': f'Poor water quality: {reading.turbidity}% clarity'
-            })
-        
-        # High vibration
-        if reading.vibration_status == 'high':
-            alert_messages.append({
-                'type': 'critical',
-                'message': 'High vibration detected - Check pump motor'
-            })
-        
-        # Low soil moisture
-        if reading.soil_moisture < 30:
-            alert_messages.append({
-                'type': 'info',
-                'message': f'Low soil moisture: {reading.soil_moisture}% - Irrigation recommended'
-            })
-        
-        # High soil moisture (over-irrigation)
-        if reading.soil_moisture > 75:
-            alert_messages.append({
-                'type': 'info',
-                'message': f'High soil moisture: {reading.soil_moisture}% - Optimal hydration'
-            })
-        
-        # Create alerts
-        for alert_msg in alert_messages:
-            # Some alerts are dismissed (70% dismissed for older ones)
-            is_dismissed = random.random() < 0.7 if (datetime.utcnow() - reading.timestamp).days > 2 else random.random() < 0.3
-            
-            alert = Alert(
-                alert_type=alert_msg['type'],
-                message=alert_msg['message'],
-                is_dismissed=is_dismissed,
-                sensor_reading_id=reading.id,
-                created_at=reading.timestamp,
-                dismissed_at=reading.timestamp + timedelta(hours=random.randint(1, 12)) if is_dismissed else None
-            )
-            alerts.append(alert)
-    
-    db.bulk_save_objects(alerts)
-    db.commit()
-    print(f"✓ Created {len(alerts)} alerts")
-    return alerts
 
-def seed_irrigation_control(db):
+def seed_irrigation_control():
     """Set up irrigation control state"""
-    print("Setting up irrigation control...")
-    
-    control = IrrigationControl(
-        mode='normal',
-        is_irrigating=False,
-        auto_mode=True
-    )
-    db.add(control)
-    db.commit()
-    print("✓ Irrigation control initialized")
-    return control
+    db = SessionLocal()
+    try:
+        if not db.query(IrrigationControl).first():
+            db.add(IrrigationControl(mode='normal', is_irrigating=False, auto_mode=True))
+            db.commit()
+        print("✓ Irrigation control initialized")
+    finally:
+        db.close()
+
+
+def rebuild_water_ledger():
+    """Total the bulk-inserted sessions into the daily water ledger"""
+    db = SessionLocal()
+    try:
+        days = WaterLedgerService(db).rebuild()
+        db.commit()
+        print(f"✓ Water ledger rebuilt ({days} days)")
+    finally:
+        db.close()
+
+
+def seed_readings(devices: int, days: float, scale: float, seed: int, end: datetime,
+                  chunk_size: int, alert_rate: float) -> dict:
+    """Generate and bulk-insert readings, sessions and alerts; return row counts"""
+    step_seconds = BASE_INTERVAL_SECONDS / scale
+    total_steps = int(days * 86400 / step_seconds)
+    start = end - timedelta(seconds=step_seconds * total_steps)
+    steps_per_chunk = max(1, chunk_size // devices)
+
+    simulators = [
+        DeviceSimulator(f"borewell-{n + 1}", random.Random(f"{seed}:{n}"), step_seconds)
+        for n in range(devices)
+    ]
+    alert_rng = random.Random(f"{seed}:alerts")
+
+    with engine.connect() as connection:
+        next_id = (connection.execute(select(func.max(SensorReading.id))).scalar() or 0) + 1
+        # Live and archived alerts share one id space
+        next_alert_id = max(
+            connection.execute(select(func.max(Alert.id))).scalar() or 0,
+            connection.execute(select(func.max(AlertArchive.id))).scalar() or 0,
+        ) + 1
+
+    readings_table = SensorReading.__table__
+    counts = {'readings': 0, 'sessions': 0, 'alerts': 0, 'archived_alerts': 0}
+
+    for chunk_start in range(0, total_steps, steps_per_chunk):
+        readings, sessions, alerts = [], [], []
+        for step in range(chunk_start, min(chunk_start + steps_per_chunk, total_steps)):
+            timestamp = start + timedelta(seconds=step_seconds * step)
+            for simulator in simulators:
+                reading, finished = simulator.step(timestamp, next_id)
+                next_id += 1
+                readings.append(reading)
+                # Sessions track the on-site pump only; other borewells just show the flow
+                if finished and simulator.device_id == DEFAULT_DEVICE_ID:
+                    sessions.append(finished)
+                if alert_rng.random() < alert_rate:
+                    alerts.extend(alerts_for_reading(reading, alert_rng, end))
+        for alert in alerts:
+            alert['id'] = next_alert_id
+            next_alert_id += 1
+        archived = [dict(alert, archived_at=alert['dismissed_at']) for alert in alerts if alert['is_dismissed']]
+        live = [alert for alert in alerts if not alert['is_dismissed']]
+
+        # One large transaction per chunk; executemany takes the driver's bulk path
+        with engine.begin() as connection:
+            if engine.dialect.name == "sqlite":
+                connection.execute(text("PRAGMA synchronous = OFF"))
+            connection.execute(readings_table.insert(), readings)
+            if sessions:
+                connection.execute(IrrigationSession.__table__.insert(), sessions)
+            if live:
+                connection.execute(Alert.__table__.insert(), live)
+            if archived:
+                connection.execute(AlertArchive.__table__.insert(), archived)
+
+        counts['readings'] += len(readings)
+        counts['sessions'] += len(sessions)
+        counts['alerts'] += len(alerts)
+        counts['archived_alerts'] += len(archived)
+
+    keep_newest_alert_live()
+    return counts
+
+
+def keep_newest_alert_live():
+    """Move the newest alert back if it was archived
+
+    SQLite hands out max(id) + 1, so the newest id must stay in the live
+    table or the next alert would reuse an archived one (as in AlertService.archive).
+    """
+    with engine.begin() as connection:
+        newest_archived = connection.execute(select(func.max(AlertArchive.id))).scalar()
+        newest_live = connection.execute(select(func.max(Alert.id))).scalar()
+        if newest_archived is None or (newest_live is not None and newest_live > newest_archived):
+            return
+        columns = [column.name for column in Alert.__table__.columns]
+        connection.execute(Alert.__table__.insert().from_select(
+            columns, select(*(AlertArchive.__table__.c[name] for name in columns)).where(AlertArchive.id == newest_archived)
+        ))
+        connection.execute(AlertArchive.__table__.delete().where(AlertArchive.id == newest_archived))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Seed the RootGuard database with realistic data")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Reading rate multiplier (1 = one reading per device every 5 minutes)")
+    parser.add_argument("--devices", type=int, default=1, help="Number of borewell devices")
+    parser.add_argument("--days", type=float, default=7, help="Time span to generate, ending at --end")
+    parser.add_argument("--seed", type=int, default=42, help="RNG seed; same seed and --end give identical data")
+    parser.add_argument("--end", type=datetime.fromisoformat, default=None,
+                        help="Last reading timestamp (ISO format, UTC); defaults to now")
+    parser.add_argument("--chunk-size", type=int, default=100_000, help="Readings per insert transaction")
+    parser.add_argument("--alert-rate", type=float, default=0.2,
+                        help="Fraction of readings checked for alert conditions")
+    parser.add_argument("--append", action="store_true", help="Keep existing data instead of clearing it")
+    return parser.parse_args()
+
 
 def main():
     """Main seeding function"""
+    args = parse_args()
+    end = args.end or datetime.utcnow().replace(second=0, microsecond=0)
+
     print("\n" + "="*50)
     print("RootGuard Bot - Database Seeding")
     print("="*50 + "\n")
-    
-    # Create tables if they don't exist
-    Base.metadata.create_all(bind=engine)
-    
-    # Clear existing data
-    clear_database()
-    
-    # Create database session
-    db = SessionLocal()
-    
-    try:
-        # Seed data in order
-        sensor_readings = seed_sensor_readings(db, num_readings=150)
-        irrigation_sessions = seed_irrigation_sessions(db, sensor_readings)
-        alerts = seed_alerts(db, sensor_readings)
-        irrigation_control = seed_irrigation_control(db)
-        
-        # Print summary
-        print("\n" + "="*50)
-        print("Seeding Complete!")
-        print("="*50)
-        print(f"Sensor Readings: {len(sensor_readings)}")
-        print(f"Irrigation Sessions: {len(irrigation_sessions)}")
-        print(f"Alerts: {len(alerts)}")
-        print(f"Active Alerts: {sum(1 for a in alerts if not a.is_dismissed)}")
-        print("="*50 + "\n")
-        
-    except Exception as e:
-        print(f"\n❌ Error during seeding: {e}")
-        db.rollback()
-        raise
-    finally:
-        db.close()
+
+    # Create or migrate tables if the schema version changed
+    init_db()
+
+    if not args.append:
+        clear_database()
+
+    print(f"Generating {args.days} days for {args.devices} device(s) at {args.scale}x rate (seed {args.seed})...")
+    started = time.perf_counter()
+    counts = seed_readings(
+        devices=args.devices,
+        days=args.days,
+        scale=args.scale,
+        seed=args.seed,
+        end=end,
+        chunk_size=args.chunk_size,
+        alert_rate=args.alert_rate,
+    )
+    elapsed = time.perf_counter() - started
+    seed_irrigation_control()
+    rebuild_water_ledger()
+
+    total_rows = counts['readings'] + counts['sessions'] + counts['alerts']
+    print("\n" + "="*50)
+    print("Seeding Complete!")
+    print("="*50)
+    print(f"Sensor Readings: {counts['readings']}")
+    print(f"Irrigation Sessions: {counts['sessions']}")
+    print(f"Alerts: {counts['alerts']} ({counts['archived_alerts']} dismissed, archived)")
+    print(f"Elapsed: {elapsed:.1f}s ({total_rows / elapsed if elapsed else 0:,.0f} rows/s)")
+    print("="*50 + "\n")
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,178 @@
+from datetime import datetime, timezone
+from typing import Iterable, List, Optional
+
+from sqlalchemy import and_, case, delete, desc, func, insert, or_, select, text, union_all, update
+from sqlalchemy.orm import Session
+from models.sensor import Alert, AlertArchive
+from schemas.sensor_schemas import AlertResponse, AlertCountResponse
+from services.settings_service import get_rules
+from services.tracing import traced_methods
+
+ARCHIVE_BATCH = 1000  # Alerts moved per transaction
+
+
+def _naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Timestamps are stored as naive UTC like datetime.utcnow()"""
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def alert_history(since: Optional[datetime] = None, alert_type: Optional[str] = None):
+    """Live and archived alerts as one subquery, for counts over all of them"""
+    branches = []
+    for model in (Alert, AlertArchive):
+        query = select(model.alert_key, model.alert_type, model.is_dismissed, model.resolved_at, model.created_at)
+        if since:
+            query = query.where(model.created_at >= since)
+        if alert_type:
+            query = query.where(model.alert_type == alert_type)
+        branches.append(query)
+    return union_all(*branches).subquery("alert_history")
+
+
+@traced_methods
+class AlertService:
+    """Active alerts, bulk dismissal, auto-resolution and archiving
+
+    The alerts table only holds what may still need attention. Dismissed
+    and resolved alerts stay there until the archive task moves them to
+    alerts_archive, so the dashboard's active-alert query stays small no
+    matter how long the farm has been running. Bulk changes are single
+    UPDATEs that stamp each row with its own change_seq, so offline clients
+    see them on their next sync like any other change.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    async def get_active_alerts(self, limit: int = 10, alert_key: Optional[str] = None,
+                                alert_type: Optional[str] = None, since: Optional[datetime] = None,
+                                include_dismissed: bool = False) -> List[AlertResponse]:
+        """Get active (not dismissed or resolved) alerts, optionally filtered by key, severity and age"""
+        models = (Alert, AlertArchive) if include_dismissed else (Alert,)
+        alerts = []
+        for model in models:
+            query = self.db.query(model)
+            if not include_dismissed:
+                query = query.filter(*self._active())
+            if alert_key:
+                query = query.filter(model.alert_key == alert_key)
+            if alert_type:
+                query = query.filter(model.alert_type == alert_type)
+            if since:
+                query = query.filter(model.created_at >= since)
+            alerts.extend(query.order_by(desc(model.created_at)).limit(limit).all())
+        if len(models) > 1:
+            alerts = sorted(alerts, key=lambda alert: alert.created_at, reverse=True)[:limit]
+
+        return [AlertResponse.model_validate(alert) for alert in alerts]
+
+    async def get_alert_counts(self, since: Optional[datetime] = None,
+                               alert_type: Optional[str] = None) -> List[AlertCountResponse]:
+        """Count alerts per key and severity with one grouped query (archive included)"""
+        history = alert_history(since, alert_type)
+        active = and_(history.c.is_dismissed == False, history.c.resolved_at.is_(None))
+        rows = self.db.execute(select(
+            history.c.alert_key,
+            history.c.alert_type,
+            func.count(),
+            func.sum(case((active, 1), else_=0)),
+            func.max(history.c.created_at),
+        ).group_by(history.c.alert_key, history.c.alert_type)).all()
+
+        return sorted((
+            AlertCountResponse(
+                alert_key=key,
+                alert_type=severity,
+                count=count,
+                active=active or 0,
+                last_created_at=last_created_at
+            ) for key, severity, count, active, last_created_at in rows
+        ), key=lambda c: c.count, reverse=True)
+
+    async def dismiss(self, ids: Optional[List[int]] = None, alert_key: Optional[str] = None,
+                      alert_type: Optional[str] = None, since: Optional[datetime] = None,
+                      until: Optional[datetime] = None) -> int:
+        """Dismiss every active alert matching all given filters; returns how many"""
+        conditions = []
+        if ids:
+            conditions.append(Alert.id.in_(ids))
+        if alert_key:
+            conditions.append(Alert.alert_key == alert_key)
+        if alert_type:
+            conditions.append(Alert.alert_type == alert_type)
+        if since:
+            conditions.append(Alert.created_at >= _naive_utc(since))
+        if until:
+            conditions.append(Alert.created_at < _naive_utc(until))
+        if not conditions:
+            raise ValueError("Give ids, alert_key, alert_type, since or until")
+
+        dismissed = self._update_active(conditions, is_dismissed=True, dismissed_at=datetime.utcnow())
+        self.db.commit()
+        return dismissed
+
+    async def dismiss_alert(self, alert_id: int) -> bool:
+        """Dismiss a specific alert; False if there is no such alert"""
+        if await self.dismiss(ids=[alert_id]):
+            return True
+        # Already dismissed, resolved or archived still counts as found
+        return any(
+            self.db.query(model.id).filter(model.id == alert_id).first() is not None
+            for model in (Alert, AlertArchive)
+        )
+
+    def resolve_cleared(self, fired_keys: Iterable[str]) -> int:
+        """Resolve active threshold alerts whose rule no longer fires (the caller commits)"""
+        cleared = {rule.key for rule in get_rules().alert_rules} - set(fired_keys)
+        if not cleared:
+            return 0
+        return self._update_active([Alert.alert_key.in_(cleared)], resolved_at=datetime.utcnow())
+
+    def archive(self, batch: int = ARCHIVE_BATCH) -> int:
+        """Move up to `batch` dismissed or resolved alerts to alerts_archive; returns how many"""
+        # The newest alert always stays: SQLite hands out max(id) + 1, so
+        # moving it would let the next alert reuse an archived id
+        newest = select(func.max(Alert.id)).scalar_subquery()
+        ids = [row_id for (row_id,) in self.db.query(Alert.id).filter(
+            or_(Alert.is_dismissed == True, Alert.resolved_at.isnot(None)),
+            Alert.id < newest
+        ).order_by(Alert.id).limit(batch)]
+        if not ids:
+            return 0
+
+        columns = [column.name for column in Alert.__table__.columns]
+        self.db.execute(insert(AlertArchive).from_select(
+            columns, select(*(Alert.__table__.c[name] for name in columns)).where(Alert.id.in_(ids))
+        ))
+        self.db.execute(delete(Alert).where(Alert.id.in_(ids)).execution_options(synchronize_session=False))
+        self.db.commit()
+        return len(ids)
+
+    @staticmethod
+    def _active():
+        return Alert.is_dismissed == False, Alert.resolved_at.is_(None)
+
+    def _update_active(self, conditions: List, **values) -> int:
+        """One UPDATE of the active alerts matching `conditions`, each stamped with its own change_seq"""
+        conditions = [*conditions, *self._active()]
+        count, last_id = self.db.query(func.count(Alert.id), func.max(Alert.id)).filter(*conditions).one()
+        if not count:
+            return 0
+        # Alerts created from here on have higher ids; none can start matching below last_id
+        conditions.append(Alert.id <= last_id)
+
+        # Allocating takes the change counter's row lock until commit (see ChangeSequence)
+        self.db.execute(text("UPDATE change_sequence SET value = value + :n WHERE id = 1"), {"n": count})
+        last_seq = self.db.execute(text("SELECT value FROM change_sequence WHERE id = 1")).scalar()
+        ranked = select(Alert.id, func.row_number().over(order_by=Alert.id).label("rank")).where(
+            *conditions
+        ).subquery()
+        result = self.db.execute(
+            update(Alert)
+            .where(Alert.id == ranked.c.id)
+            .values(change_seq=last_seq - count + ranked.c.rank, **values)
+            .execution_options(synchronize_session=False)
+        )
+        return result.rowcount
@@ -0,0 +1,161 @@
+"""
+Off-loop execution for long-range analytics
+
+Scans over months of readings are CPU-bound Python; run on the event loop
+they stall every other request and the sensor tick. AnalyticsPool runs them
+in worker processes (ANALYTICS_WORKERS; 0 runs them in a thread instead),
+each with its own database connection.
+
+Identical queries in flight (same key) share one computation. Every caller
+waits at most its timeout (ANALYTICS_TIMEOUT_SECONDS) and then gets
+AnalyticsTimeout. A job nobody is waiting for any more is cancelled if it
+has not started; a running one is passed a deadline (time.time()) and
+stops at it, so an abandoned scan never holds a worker for long.
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+ANALYTICS_WORKERS = int(os.getenv("ANALYTICS_WORKERS", "2"))
+ANALYTICS_TIMEOUT_SECONDS = float(os.getenv("ANALYTICS_TIMEOUT_SECONDS", "30"))
+
+
+class AnalyticsTimeout(Exception):
+    """An analytics query did not finish within its timeout"""
+
+
+class _Flight:
+    __slots__ = ("future", "waiters")
+
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.waiters = 0
+
+
+class AnalyticsPool:
+    """Process pool with single-flight, per-call timeouts and cancellation"""
+
+    def __init__(self, workers: int = ANALYTICS_WORKERS, timeout: float = ANALYTICS_TIMEOUT_SECONDS):
+        self.workers = workers
+        self.timeout = timeout
+        self._executor: Optional[Executor] = None
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._running = 0  # Jobs in workers, including abandoned ones still heading for their deadline
+
+        # Metrics
+        self.started = 0
+        self.shared = 0  # Calls that joined a computation already in flight
+        self.completed = 0
+        self.failed = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+
+    async def run(self, key: Hashable, func: Callable[..., Any], *args, timeout: Optional[float] = None):
+        """Return `func(*args, deadline)` computed off the event loop
+
+        `func` must be a module-level function (it is pickled to a worker
+        process) and should raise TimeoutError once time.time() passes
+        `deadline`. Calls with the same `key` while one is running share it.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._start(key, func, args, time.time() + timeout)
+        else:
+            self.shared += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(flight.future), timeout)
+        except (asyncio.TimeoutError, TimeoutError):
+            self.timeouts += 1
+            raise AnalyticsTimeout(f"Analytics query did not finish within {timeout:g}s")
+        finally:
+            flight.waiters -= 1
+            if not flight.waiters and not flight.future.done():
+                # Nobody wants the result: a queued job never starts, a running one stops at its deadline
+                flight.future.cancel()
+                self.cancelled += 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            # Waits for idle workers to exit; a running scan is left to stop at its deadline
+            self._executor.shutdown(wait=not self._running, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "in_flight": len(self._flights),
+            "running": self._running,
+            "started": self.started,
+            "shared": self.shared,
+            "completed": self.completed,
+            "failed": self.failed,
+            "timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "last_ms": round(self.last_ms, 2),
+            "max_ms": round(self.max_ms, 2),
+        }
+
+    def _start(self, key: Hashable, func: Callable[..., Any], args: tuple, deadline: float) -> _Flight:
+        started = time.perf_counter()
+        job = self._get_executor().submit(func, *args, deadline)
+        self._running += 1
+        job.add_done_callback(self._job_done)
+        future = asyncio.wrap_future(job)
+        flight = self._flights[key] = _Flight(future)
+        self.started += 1
+
+        def finished(done: asyncio.Future):
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if done.cancelled():
+                return
+            error = done.exception()
+            if error is None:
+                self.completed += 1
+                self.last_ms = (time.perf_counter() - started) * 1000
+                self.max_ms = max(self.max_ms, self.last_ms)
+            elif not isinstance(error, TimeoutError):
+                self.failed += 1
+                from concurrent.futures.process import BrokenProcessPool
+                if isinstance(error, BrokenProcessPool):
+                    # A worker died (e.g. out of memory); start a fresh pool next time
+                    self.shutdown()
+
+        future.add_done_callback(finished)
+        return flight
+
+    def _job_done(self, job):
+        # Runs in the executor's thread
+        self._running -= 1
+
+    def _get_executor(self) -> Executor:
+        # Executors (and multiprocessing) are imported on first use, not at API startup
+        if self._executor is None:
+            if self.workers <= 0:
+                from concurrent.futures import ThreadPoolExecutor
+                self._executor = ThreadPoolExecutor(1, thread_name_prefix="analytics")
+            else:
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                # Spawned, not forked: the parent has threads and open database connections
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        return self._executor
+
+
+_analytics_pool: Optional[AnalyticsPool] = None
+
+
+def get_analytics_pool() -> AnalyticsPool:
+    """Return this process's analytics pool (workers start on first use)"""
+    global _analytics_pool
+    if _analytics_pool is None:
+        _analytics_pool = AnalyticsPool()
+    return _analytics_pool
@@ -1,47 +1,97 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, func
+from sqlalchemy import and_, desc, func, case, select
 from models.database import SessionLocal
-from models.sensor import SensorReading, IrrigationSession, Alert
+from models.sensor import SensorReading
+from services.alert_service import alert_history
+from services.recent_readings import get_recent_readings
+from services.water_ledger import WaterLedgerService, farm_timezone, get_zone, local_today
+from services.tracing import traced_methods
+from services.analytics_pool import get_analytics_pool
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-import statistics
+from typing import Dict, List, Optional, Sequence
+import math
+import time
 
+EFFICIENCY_COLUMNS = ("soil_moisture", "water_level", "flow_rate")
+SCAN_CHUNK_ROWS = 20000
+
+
+class EfficiencyTotals:
+    """Running sums for the efficiency metrics, fed column chunks"""
+
+    def __init__(self):
+        self.count = 0
+        self.optimal = 0  # Soil moisture in the optimal range (40-70%)
+        self.sums: Dict[str, List[float]] = {name: [] for name in EFFICIENCY_COLUMNS}
+
+    def add(self, columns: Dict[str, Sequence[float]]):
+        self.count += len(columns["soil_moisture"])
+        for name in EFFICIENCY_COLUMNS:
+            self.sums[name].append(math.fsum(columns[name]))
+        self.optimal += sum(1 for value in columns["soil_moisture"] if 40 <= value <= 70)
+
+    def result(self) -> Dict:
+        if not self.count:
+            return {
+                'avg_soil_moisture': 0,
+                'optimal_moisture_percent': 0,
+                'avg_water_level': 0,
+                'avg_flow_rate': 0
+            }
+        averages = {name: math.fsum(self.sums[name]) / self.count for name in EFFICIENCY_COLUMNS}
+        return {
+            'avg_soil_moisture': round(averages["soil_moisture"], 1),
+            'optimal_moisture_percent': round(self.optimal / self.count * 100, 1),
+            'avg_water_level': round(averages["water_level"], 1),
+            'avg_flow_rate': round(averages["flow_rate"], 1),
+            'total_readings': self.count
+        }
+
+
+def scan_efficiency(start_date: datetime, deadline: float) -> Dict:
+    """Efficiency metrics from every reading since `start_date` (runs in an analytics worker)"""
+    totals = EfficiencyTotals()
+    db = SessionLocal()
+    try:
+        result = db.execute(
+            select(SensorReading.soil_moisture, SensorReading.water_level, SensorReading.flow_rate)
+            .where(SensorReading.timestamp >= start_date)
+            .execution_options(yield_per=SCAN_CHUNK_ROWS)
+        )
+        for rows in result.partitions():
+            if time.time() > deadline:
+                raise TimeoutError("Efficiency scan passed its deadline")
+            totals.add(dict(zip(EFFICIENCY_COLUMNS, zip(*rows))))
+    finally:
+        db.close()
+    return totals.result()
+
+@traced_methods
 class AnalyticsService:
     def __init__(self, db: Session):
         self.db = db
     
     async def get_water_usage_stats(self, days: int = 7) -> Dict:
-        """Calculate water usage statistics for the specified period"""
-        start_date = datetime.utcnow() - timedelta(days=days)
+        """Calculate water usage statistics for the last `days` farm-local calendar days"""
+        ledger = WaterLedgerService(self.db)
+        timezone_name = farm_timezone(self.db)
+        end_day = local_today(get_zone(timezone_name))
+        start_day = end_day - timedelta(days=max(days, 1) - 1)
         
-        sessions = self.db.query(IrrigationSession).filter(
-            IrrigationSession.started_at >= start_date
-        ).all()
+        # At most one ledger row per day, maintained as sessions close
+        rows = ledger.get_days(start_day, end_day)
         
-        total_water = sum(s.estimated_volume_liters or 0 for s in sessions)
-        total_sessions = len(sessions)
+        total_water = sum(row.water_liters for row in rows)
+        total_sessions = sum(row.sessions for row in rows)
         avg_per_session = total_water / total_sessions if total_sessions > 0 else 0
         
-        # Calculate daily breakdown
-        daily_usage = {}
-        for session in sessions:
-            date_key = session.started_at.date()
-            if date_key not in daily_usage:
-                daily_usage[date_key] = {
-                    'water_liters': 0,
-                    'sessions': 0,
-                    'duration_minutes': 0
-                }
-            daily_usage[date_key]['water_liters'] += session.estimated_volume_liters or 0
-            daily_usage[date_key]['sessions'] += 1
-            daily_usage[date_key]['duration_minutes'] += session.duration_minutes or 0
-        
         return {
             'total_water_liters': round(total_water, 1),
             'total_sessions': total_sessions,
             'avg_per_session': round(avg_per_session, 1),
-            'daily_breakdown': daily_usage,
-            'period_days': days
+            'daily_breakdown': {row.day: row.to_dict() for row in rows},
+            'period_days': days,
+            'timezone': timezone_name
         }
     
     async def calculate_cost_savings(self, days: int = 7) -> Dict:
@@ -85,56 +135,43 @@ class AnalyticsService:
         """Calculate irrigation efficiency metrics"""
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        # Get sensor readings
-        readings = self.db.query(SensorReading).filter(
-            SensorReading.timestamp >= start_date
-        ).all()
+        # Column slices from the in-memory rings when they cover the period
+        window = get_recent_readings().window_slices(self.db, start_date)
+        if window is None:
+            # Longer ranges scan the table in a worker process; identical requests share the scan
+            return await get_analytics_pool().run(("efficiency", days), scan_efficiency, start_date)
         
-        if not readings:
-            return {
-                'avg_soil_moisture': 0,
-                'optimal_moisture_percent': 0,
-                'avg_water_level': 0,
-                'avg_flow_rate': 0
-            }
-        
-        # Calculate averages
-        avg_soil_moisture = statistics.mean(r.soil_moisture for r in readings)
-        avg_water_level = statistics.mean(r.water_level for r in readings)
-        avg_flow_rate = statistics.mean(r.flow_rate for r in readings)
-        
-        # Calculate how often soil moisture is in optimal range (40-70%)
-        optimal_readings = sum(1 for r in readings if 40 <= r.soil_moisture <= 70)
-        optimal_percent = (optimal_readings / len(readings)) * 100
-        
-        return {
-            'avg_soil_moisture': round(avg_soil_moisture, 1),
-            'optimal_moisture_percent': round(optimal_percent, 1),
-            'avg_water_level': round(avg_water_level, 1),
-            'avg_flow_rate': round(avg_flow_rate, 1),
-            'total_readings': len(readings)
-        }
+        totals = EfficiencyTotals()
+        for parts in zip(*(window[name] for name in EFFICIENCY_COLUMNS)):
+            totals.add(dict(zip(EFFICIENCY_COLUMNS, parts)))
+        return totals.result()
     
     async def get_alert_summary(self, days: int = 7) -> Dict:
-        """Get summary of alerts for the period"""
+        """Get summary of alerts for the period (archived ones included)"""
         start_date = datetime.utcnow() - timedelta(days=days)
         
-        alerts = self.db.query(Alert).filter(
-            Alert.created_at >= start_date
-        ).all()
+        # One grouped query over the (alert_type, created_at) index of both alert tables
+        history = alert_history(start_date)
+        rows = self.db.execute(select(
+            history.c.alert_type,
+            func.count(),
+            func.sum(case((history.c.is_dismissed == True, 1), else_=0)),
+            func.sum(case((and_(history.c.is_dismissed == False, history.c.resolved_at.isnot(None)), 1), else_=0))
+        ).group_by(history.c.alert_type)).all()
         
-        critical_count = sum(1 for a in alerts if a.alert_type == 'critical')
-        warning_count = sum(1 for a in alerts if a.alert_type == 'warning')
-        info_count = sum(1 for a in alerts if a.alert_type == 'info')
-        dismissed_count = sum(1 for a in alerts if a.is_dismissed)
+        counts = {alert_type: count for alert_type, count, _, _ in rows}
+        total = sum(counts.values())
+        dismissed_count = sum(dismissed or 0 for _, _, dismissed, _ in rows)
+        resolved_count = sum(resolved or 0 for _, _, _, resolved in rows)
         
         return {
-            'total_alerts': len(alerts),
-            'critical': critical_count,
-            'warning': warning_count,
-            'info': info_count,
+            'total_alerts': total,
+            'critical': counts.get('critical', 0),
+            'warning': counts.get('warning', 0),
+            'info': counts.get('info', 0),
             'dismissed': dismissed_count,
-            'active': len(alerts) - dismissed_count
+            'resolved': resolved_count,
+            'active': total - dismissed_count - resolved_count
         }
     
     async def get_comprehensive_analytics(self, days: int = 7) -> Dict:
@@ -0,0 +1,258 @@
+from sqlalchemy.orm import Session
+from models.sensor import SensorReading, Alert, DetectorState
+from services.settings_service import metric_value
+from services.tracing import traced_methods
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import json
+import math
+
+CHECKPOINT_NAME = "anomaly"
+CHECKPOINT_EVERY = 60  # readings between checkpoints
+
+
+@dataclass(frozen=True)
+class MetricConfig:
+    """How one reading metric is monitored"""
+    directions: Tuple[str, ...]  # Which drifts raise alerts: 'up' and/or 'down'
+    min_std: float  # Noise floor so a perfectly flat signal doesn't alarm on tiny moves
+    alert_type: str
+    keys: Dict[str, str]  # direction -> alert key
+    binary: bool = False  # 0/1 signal, monitored as an event rate
+
+
+METRICS = {
+    "flow_rate": MetricConfig(("down", "up"), 0.5, "warning", {
+        "down": "alert_anomaly_flow_drop",
+        "up": "alert_anomaly_flow_rise",
+    }),
+    "water_level": MetricConfig(("down", "up"), 1.0, "warning", {
+        "down": "alert_anomaly_water_drop",
+        "up": "alert_anomaly_water_rise",
+    }),
+    # Vibration is 0 (low) / 1 (high); an upward shift means it flickers high more often
+    "vibration_high": MetricConfig(("up",), 0.0, "critical", {
+        "up": "alert_anomaly_vibration",
+    }, binary=True),
+}
+
+
+class StreamingDetector:
+    """EWMA baseline with a two-sided CUSUM on the standardised residual
+
+    Each update is O(1) and the state is six numbers, so detection never
+    scans history. The baseline adapts slowly, so a gradual drift keeps
+    producing same-signed residuals that accumulate in the CUSUM until it
+    crosses THRESHOLD, while isolated spikes decay away.
+    """
+
+    __slots__ = ("mean", "var", "count", "pos", "neg", "cooldown")
+
+    ALPHA = 0.02  # Baseline adaptation rate
+    SLACK = 0.5  # CUSUM allowance in standard deviations
+    THRESHOLD = 8.0  # CUSUM alarm level
+    WARMUP = 30  # Readings before alarms are allowed
+    COOLDOWN = 60  # Readings to stay quiet after an alarm
+
+    def __init__(self, mean: float = 0.0, var: float = 0.0, count: int = 0,
+                 pos: float = 0.0, neg: float = 0.0, cooldown: int = 0):
+        self.mean = mean
+        self.var = var
+        self.count = count
+        self.pos = pos
+        self.neg = neg
+        self.cooldown = cooldown
+
+    def update(self, value: float, min_std: float) -> Optional[str]:
+        """Feed one value; return 'up' or 'down' when a shift is detected"""
+        if self.count == 0:
+            self.mean = value
+            self.count = 1
+            return None
+
+        residual = value - self.mean
+        std = max(math.sqrt(self.var), min_std)
+        z = residual / std
+
+        # Update the baseline after scoring so the shift isn't absorbed first;
+        # plain running averages until enough readings back the EWMA
+        self.count += 1
+        alpha = max(self.ALPHA, 1.0 / self.count)
+        self.mean += alpha * residual
+        self.var = (1 - alpha) * (self.var + alpha * residual * residual)
+
+        if self.count <= self.WARMUP:
+            return None
+
+        self.pos = max(0.0, self.pos + z - self.SLACK)
+        self.neg = max(0.0, self.neg - z - self.SLACK)
+
+        if self.cooldown > 0:
+            self.cooldown -= 1
+            return None
+
+        direction = None
+        if self.pos > self.THRESHOLD:
+            direction = "up"
+        elif self.neg > self.THRESHOLD:
+            direction = "down"
+
+        if direction:
+            self.pos = self.neg = 0.0
+            self.cooldown = self.COOLDOWN
+        return direction
+
+    def to_list(self) -> list:
+        return [self.mean, self.var, self.count, self.pos, self.neg, self.cooldown]
+
+    @classmethod
+    def from_list(cls, values: list) -> "StreamingDetector":
+        return cls(*values)
+
+
+class RateDetector:
+    """Bernoulli CUSUM for how often a 0/1 signal is 1
+
+    Accumulates the log-likelihood ratio of "the rate has tripled" against
+    the slowly adapting baseline rate. Mostly-low streams drift the sum back
+    to zero; a sustained run of extra highs pushes it over THRESHOLD.
+    Same O(1) update and fixed-size state as StreamingDetector.
+    """
+
+    __slots__ = ("mean", "count", "pos", "cooldown")
+
+    ALPHA = 0.01  # Baseline adaptation rate
+    MIN_RATE = 0.01
+    THRESHOLD = 6.0
+    WARMUP = 50
+    COOLDOWN = 120
+
+    def __init__(self, mean: float = 0.0, count: int = 0, pos: float = 0.0, cooldown: int = 0):
+        self.mean = mean
+        self.count = count
+        self.pos = pos
+        self.cooldown = cooldown
+
+    def update(self, value: float, min_std: float = 0.0) -> Optional[str]:
+        """Feed one 0/1 value; return 'up' when the rate has shifted upwards"""
+        baseline = min(max(self.mean, self.MIN_RATE), 0.5)
+        shifted = min(3 * baseline, 0.9)
+
+        self.count += 1
+        alpha = max(self.ALPHA, 1.0 / self.count)
+        self.mean += alpha * (value - self.mean)
+
+        if self.count <= self.WARMUP:
+            return None
+
+        if value:
+            llr = math.log(shifted / baseline)
+        else:
+            llr = math.log((1 - shifted) / (1 - baseline))
+        self.pos = max(0.0, self.pos + llr)
+
+        if self.cooldown > 0:
+            self.cooldown -= 1
+            return None
+
+        if self.pos > self.THRESHOLD:
+            self.pos = 0.0
+            self.cooldown = self.COOLDOWN
+            return "up"
+        return None
+
+    def to_list(self) -> list:
+        return [self.mean, self.count, self.pos, self.cooldown]
+
+    @classmethod
+    def from_list(cls, values: list) -> "RateDetector":
+        return cls(*values)
+
+
+class AnomalyDetector:
+    """Per-device, per-metric streaming detectors with periodic checkpoints"""
+
+    def __init__(self):
+        self.detectors: Dict[str, StreamingDetector] = {}
+        self.loaded = False
+        self.readings_since_checkpoint = 0
+
+    def observe(self, reading: SensorReading) -> List[Tuple[str, str, float, float]]:
+        """Update every metric once; return (metric, direction, value, expected) per alarm"""
+        alarms = []
+        for metric, config in METRICS.items():
+            value = metric_value(reading, metric)
+            key = f"{reading.device_id}:{metric}"
+            detector = self.detectors.get(key)
+            if detector is None:
+                detector = self.detectors[key] = _detector_class(config)()
+
+            expected = detector.mean
+            direction = detector.update(value, config.min_std)
+            if direction in config.directions:
+                alarms.append((metric, direction, value, expected))
+
+        self.readings_since_checkpoint += 1
+        return alarms
+
+    def load(self, db: Session):
+        """Restore detector state from the last checkpoint"""
+        row = db.query(DetectorState).filter(DetectorState.name == CHECKPOINT_NAME).first()
+        if row:
+            self.detectors = {
+                key: _detector_class(METRICS[key.rsplit(":", 1)[1]]).from_list(values)
+                for key, values in json.loads(row.state).items()
+                if key.rsplit(":", 1)[1] in METRICS
+            }
+        self.loaded = True
+
+    def checkpoint(self, db: Session):
+        """Persist detector state (caller commits)"""
+        state = json.dumps({key: d.to_list() for key, d in self.detectors.items()})
+        db.merge(DetectorState(name=CHECKPOINT_NAME, state=state))
+        self.readings_since_checkpoint = 0
+
+
+def _detector_class(config: MetricConfig):
+    return RateDetector if config.binary else StreamingDetector
+
+
+_detector: Optional[AnomalyDetector] = None
+
+
+def get_anomaly_detector() -> AnomalyDetector:
+    """Return this process's anomaly detector"""
+    global _detector
+    if _detector is None:
+        _detector = AnomalyDetector()
+    return _detector
+
+
+@traced_methods
+class AnomalyService:
+    def __init__(self, db: Session):
+        self.db = db
+        self.detector = get_anomaly_detector()
+
+    async def process_reading(self, reading: SensorReading):
+        """Update the streaming detectors and raise alerts for detected shifts"""
+        if not self.detector.loaded:
+            self.detector.load(self.db)
+
+        for metric, direction, value, expected in self.detector.observe(reading):
+            config = METRICS[metric]
+            if metric == "vibration_high":
+                params = {"rate": round(expected * 100)}
+            else:
+                params = {"value": round(value, 1), "expected": round(expected, 1)}
+            self.db.add(Alert(
+                alert_type=config.alert_type,
+                alert_key=config.keys[direction],
+                params=params,
+                sensor_reading_id=reading.id
+            ))
+
+        if self.detector.readings_since_checkpoint >= CHECKPOINT_EVERY:
+            self.detector.checkpoint(self.db)
+
+        self.db.commit()
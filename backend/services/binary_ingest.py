@@ -0,0 +1,232 @@
+"""
+Compact binary ingest format for field devices
+
+A frame carries one device's readings:
+
+    header   <2s B B H q   magic b"RG", version, device id length, record count,
+                           base timestamp (ms since the Unix epoch, UTC)
+             [Q]           version 2 only: device_seq of the first record; the
+                           others follow consecutively
+    device   device id, UTF-8 (empty means the on-site unit)
+    records  <I H H H H B  ms since the previous record (the first: since base),
+                           water level, flow rate, turbidity, soil moisture in
+                           tenths, vibration (0 low, 1 high)
+
+That is 13 bytes per reading plus 14 (22 with sequence numbers) +
+len(device id) per frame, against ~160 bytes of JSON. Sequenced frames make
+UDP retransmits safe: a frame whose ack was lost is re-sent and ignored.
+Tenths are exactly the precision readings are stored at. A payload may hold
+several frames back to back (e.g. several devices). Records are decoded with
+struct.iter_unpack straight from a memoryview of the receive buffer and go
+to the ingest buffer like JSON readings.
+"""
+
+import asyncio
+import os
+import struct
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from models.sensor import DEFAULT_DEVICE_ID
+from schemas.sensor_schemas import MAX_FLOW_RATE
+from services.ingest_buffer import get_ingest_buffer
+
+MAGIC = b"RG"
+VERSION = 1
+VERSION_SEQUENCED = 2
+HEADER = struct.Struct("<2sBBHq")
+FIRST_SEQ = struct.Struct("<Q")  # Follows the header in version 2
+RECORD = struct.Struct("<IHHHHB")
+ACK = struct.Struct("<2sH")  # UDP reply: b"RA", readings accepted
+ACK_MAGIC = b"RA"
+MAX_DEVICE_ID_BYTES = 50
+MAX_RECORDS = 0xFFFF
+
+EPOCH = datetime(1970, 1, 1)
+PERCENT_TENTHS = 1000  # 100.0%
+FLOW_TENTHS = MAX_FLOW_RATE * 10  # Same bound as JSON readings
+
+INGEST_UDP_HOST = os.getenv("INGEST_UDP_HOST", "0.0.0.0")
+INGEST_UDP_PORT = int(os.getenv("INGEST_UDP_PORT", "0"))  # 0: listener off
+
+
+def _tenths(value: float) -> int:
+    return int(round(value * 10))
+
+
+def encode_frame(readings: List[Dict], device_id: Optional[str] = None, first_seq: Optional[int] = None) -> bytes:
+    """Encode readings (dicts shaped like SensorReadingIngest, naive UTC timestamps, in time order)
+
+    With `first_seq` the readings carry device_seq first_seq, first_seq + 1, ...
+    """
+    if len(readings) > MAX_RECORDS:
+        raise ValueError(f"At most {MAX_RECORDS} readings per frame")
+    device = (device_id or "").encode()
+    if len(device) > MAX_DEVICE_ID_BYTES:
+        raise ValueError("device_id too long")
+
+    base_ms = _epoch_ms(readings[0]["timestamp"]) if readings else 0
+    version = VERSION if first_seq is None else VERSION_SEQUENCED
+    parts = [HEADER.pack(MAGIC, version, len(device), len(readings), base_ms)]
+    if first_seq is not None:
+        parts.append(FIRST_SEQ.pack(first_seq))
+    parts.append(device)
+    previous_ms = base_ms
+    for reading in readings:
+        at_ms = _epoch_ms(reading["timestamp"])
+        if at_ms < previous_ms:
+            raise ValueError("Readings must be in time order")
+        parts.append(RECORD.pack(
+            at_ms - previous_ms,
+            _tenths(reading["water_level"]),
+            _tenths(reading["flow_rate"]),
+            _tenths(reading["turbidity"]),
+            _tenths(reading["soil_moisture"]),
+            1 if reading["vibration_status"] == "high" else 0,
+        ))
+        previous_ms = at_ms
+    return b"".join(parts)
+
+
+def decode_frames(payload) -> List[Dict]:
+    """Decode every frame in `payload` into ingest rows; ValueError if malformed"""
+    view = memoryview(payload)
+    rows: List[Dict] = []
+    offset = 0
+    while offset < len(view):
+        device_id, records, base_ms, first_seq, offset = _frame_at(view, offset)
+        rows.extend(_decode_records(device_id, records, base_ms, first_seq))
+    return rows
+
+
+def _frame_at(view: memoryview, offset: int) -> Tuple[str, memoryview, int, Optional[int], int]:
+    """Parse the frame header at `offset`; return device id, records view, base ms, first seq and the next offset"""
+    if len(view) - offset < HEADER.size:
+        raise ValueError("Truncated frame header")
+    magic, version, device_len, count, base_ms = HEADER.unpack_from(view, offset)
+    if magic != MAGIC or version not in (VERSION, VERSION_SEQUENCED):
+        raise ValueError("Not a version 1 or 2 RootGuard frame")
+    if device_len > MAX_DEVICE_ID_BYTES:
+        raise ValueError("device_id too long")
+
+    device_start = offset + HEADER.size
+    first_seq = None
+    if version == VERSION_SEQUENCED:
+        if len(view) - device_start < FIRST_SEQ.size:
+            raise ValueError("Truncated frame header")
+        first_seq, = FIRST_SEQ.unpack_from(view, device_start)
+        if first_seq + count > 2 ** 63:
+            raise ValueError("device_seq out of range")
+        device_start += FIRST_SEQ.size
+    records_start = device_start + device_len
+    records_end = records_start + count * RECORD.size
+    if records_end > len(view):
+        raise ValueError("Truncated frame records")
+    device_id = bytes(view[device_start:records_start]).decode() or DEFAULT_DEVICE_ID
+    return device_id, view[records_start:records_end], base_ms, first_seq, records_end
+
+
+def _decode_records(device_id: str, records: memoryview, base_ms: int, first_seq: Optional[int]) -> List[Dict]:
+    rows = []
+    at_ms = base_ms
+    try:
+        for delta_ms, water, flow, turbidity, moisture, vibration in RECORD.iter_unpack(records):
+            if (water > PERCENT_TENTHS or turbidity > PERCENT_TENTHS or moisture > PERCENT_TENTHS
+                    or flow > FLOW_TENTHS or vibration > 1):
+                raise ValueError("Reading out of range")
+            at_ms += delta_ms
+            rows.append({
+                "device_id": device_id,
+                "water_level": water / 10,
+                "flow_rate": flow / 10,
+                "turbidity": turbidity / 10,
+                "vibration_status": "high" if vibration else "low",
+                "soil_moisture": moisture / 10,
+                "timestamp": EPOCH + timedelta(milliseconds=at_ms),
+            })
+    except OverflowError:
+        # Before year 1 or after 9999
+        raise ValueError("Timestamp out of range") from None
+    if first_seq is not None:
+        for seq, row in enumerate(rows, start=first_seq):
+            row["device_seq"] = seq
+    return rows
+
+
+def _epoch_ms(timestamp: datetime) -> int:
+    return (timestamp - EPOCH) // timedelta(milliseconds=1)
+
+
+class BinaryIngestListener(asyncio.DatagramProtocol):
+    """UDP endpoint for binary frames: one datagram, one or more frames
+
+    Valid datagrams are acknowledged with the number of readings queued;
+    malformed ones are dropped without a reply, so the sender retries.
+    """
+
+    def __init__(self):
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.submit = None
+
+        # Metrics
+        self.datagrams = 0
+        self.readings = 0
+        self.rejected = 0
+        self.bytes_received = 0
+
+    @property
+    def running(self) -> bool:
+        return self.transport is not None
+
+    async def start(self, host: str = INGEST_UDP_HOST, port: int = INGEST_UDP_PORT) -> bool:
+        """Bind the socket; False if the port is taken (another API worker listens)"""
+        if self.running or not port:
+            return self.running
+        self.submit = get_ingest_buffer().submit_many
+        try:
+            await asyncio.get_running_loop().create_datagram_endpoint(lambda: self, local_addr=(host, port))
+        except OSError as e:
+            print(f"Binary ingest UDP port {port} not available: {e}")
+            return False
+        print(f"Binary ingest listening on udp://{host}:{port}")
+        return True
+
+    async def stop(self):
+        if self.transport is not None:
+            self.transport.close()
+            self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data: bytes, addr):
+        self.datagrams += 1
+        self.bytes_received += len(data)
+        try:
+            rows = decode_frames(data)
+            self.submit(rows)
+        except (ValueError, RuntimeError):
+            self.rejected += 1
+            return
+        self.readings += len(rows)
+        self.transport.sendto(ACK.pack(ACK_MAGIC, min(len(rows), 0xFFFF)), addr)
+
+    def stats(self) -> Dict:
+        return {
+            "running": self.running,
+            "datagrams": self.datagrams,
+            "readings": self.readings,
+            "rejected": self.rejected,
+            "bytes_received": self.bytes_received,
+        }
+
+
+_listener: Optional[BinaryIngestListener] = None
+
+
+def get_binary_listener() -> BinaryIngestListener:
+    """Return this process's UDP ingest listener (started only if INGEST_UDP_PORT is set)"""
+    global _listener
+    if _listener is None:
+        _listener = BinaryIngestListener()
+    return _listener
@@ -0,0 +1,211 @@
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.orm.exc import StaleDataError
+from models.database import SessionLocal, DATABASE_URL
+from services.process_lock import ProcessLock
+from services.tracing import current_span, get_tracer, use_span
+
+MAX_ATTEMPTS = 5
+MAX_BATCH = 100  # Commands per transaction
+QUEUE_SIZE = 1000
+CONTROL_LOCK_PATH = os.getenv("CONTROL_LOCK_PATH", "./irrigation_control.lock") if "sqlite" in DATABASE_URL else None
+
+
+class ControlConflict(Exception):
+    """The caller's expected control version is no longer current"""
+
+    def __init__(self, expected: int, current: int):
+        super().__init__(f"Irrigation control changed (expected version {expected}, current {current})")
+        self.expected = expected
+        self.current = current
+
+
+class ControlQueue:
+    """Single writer for irrigation control state
+
+    Every mutation of the control row and irrigation sessions (HTTP commands
+    and the tick's auto-irrigation check) runs as a command on one task, one
+    at a time, so nothing in this process can interleave between reading the
+    control row and writing it. Commands flush; the queue commits.
+
+    Commands waiting together run in one transaction, each inside its own
+    savepoint, so a burst pays for one database lock and one commit. The
+    transaction starts by taking the write lock (behind a file lock on
+    SQLite, whose busy handler polls), so writers in other processes wait
+    their turn instead of failing the version check. If one still slips
+    through (stale version, second open session, busy database) the whole
+    batch is rolled back and re-run on fresh state.
+
+    Commands run in the submitter's trace; the batch's commit is recorded in
+    the trace of its first traced command.
+    """
+
+    def __init__(self, session_factory=SessionLocal, max_size: int = QUEUE_SIZE,
+                 max_batch: int = MAX_BATCH, lock_path: Optional[str] = CONTROL_LOCK_PATH):
+        self.session_factory = session_factory
+        self.max_size = max_size
+        self.max_batch = max_batch
+        # SQLite processes on one host take turns through a file lock first
+        self._file_lock = ProcessLock(lock_path) if lock_path else None
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.executed = 0
+        self.batches = 0
+        self.failed = 0
+        self.retries = 0
+        self.conflicts = 0
+        self.last_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.last_batch_ms = 0.0
+        self.max_batch_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Finish queued commands, then stop"""
+        if not self.running:
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, command: Callable[..., Awaitable]):
+        """Run `command(db)` on the writer task and return its result
+
+        Without a running queue (scripts, one-off tools) the command runs
+        inline with the same transaction and retry handling.
+        """
+        future = asyncio.get_running_loop().create_future()
+        item = (command, future, time.perf_counter(), current_span())
+        if not self.running:
+            await self._execute([item])
+        else:
+            await self._queue.put(item)
+        return await future
+
+    def stats(self) -> Dict:
+        return {
+            "depth": self._queue.qsize() if self._queue else 0,
+            "executed": self.executed,
+            "batches": self.batches,
+            "failed": self.failed,
+            "retries": self.retries,
+            "conflicts": self.conflicts,
+            "last_wait_ms": round(self.last_wait_ms, 2),
+            "max_wait_ms": round(self.max_wait_ms, 2),
+            "last_batch_ms": round(self.last_batch_ms, 2),
+            "max_batch_ms": round(self.max_batch_ms, 2),
+        }
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if None in batch:
+                stopping = True
+                batch = [item for item in batch if item is not None]
+            if batch:
+                await self._execute(batch)
+
+    async def _execute(self, batch: List[Tuple]):
+        started = time.perf_counter()
+        self.last_wait_ms = (started - min(queued_at for _, _, queued_at, _ in batch)) * 1000
+        self.max_wait_ms = max(self.max_wait_ms, self.last_wait_ms)
+
+        if self._file_lock:
+            # Waiters wake as soon as it is released, unlike SQLite's polling busy handler
+            await asyncio.to_thread(self._file_lock.acquire, True)
+        try:
+            outcomes = await self._execute_locked(batch)
+        finally:
+            if self._file_lock:
+                self._file_lock.release()
+
+        for future, result, error in outcomes:
+            if isinstance(error, ControlConflict):
+                self.conflicts += 1
+            elif error is not None:
+                self.failed += 1
+            else:
+                self.executed += 1
+            if future.done():
+                continue
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        self.batches += 1
+        self.last_batch_ms = (time.perf_counter() - started) * 1000
+        self.max_batch_ms = max(self.max_batch_ms, self.last_batch_ms)
+
+    async def _execute_locked(self, batch: List[Tuple]) -> List[Tuple]:
+        started = time.perf_counter()
+        # The batch's own statements (write lock, commit) go in the first traced command's trace
+        batch_span = next((span for *_, span in batch if span is not None), None)
+        for attempt in range(MAX_ATTEMPTS):
+            db = self.session_factory()
+            outcomes = []
+            try:
+                # Take the write lock before reading, as init_db does
+                with use_span(batch_span):
+                    db.execute(text("UPDATE irrigation_control SET version = version"))
+                for command, future, queued_at, span in batch:
+                    savepoint = db.begin_nested()
+                    try:
+                        with use_span(span), get_tracer().span("control_queue.command", {
+                            "rootguard.queue_wait_ms": round((started - queued_at) * 1000, 2),
+                            "rootguard.batch_size": len(batch),
+                            "rootguard.attempt": attempt + 1,
+                        }):
+                            result = await command(db)
+                            savepoint.commit()
+                        outcomes.append((future, result, None))
+                    except (StaleDataError, IntegrityError, OperationalError):
+                        raise
+                    except Exception as e:
+                        # Only this command is undone; the rest of the batch goes ahead
+                        savepoint.rollback()
+                        outcomes.append((future, None, e))
+                with use_span(batch_span):
+                    db.commit()
+                break
+            except (StaleDataError, IntegrityError, OperationalError) as e:
+                # Lost a race with another process (or the database was busy)
+                db.rollback()
+                if attempt == MAX_ATTEMPTS - 1:
+                    outcomes = [(future, None, e) for _, future, _, _ in batch]
+                    break
+                self.retries += 1
+                await asyncio.sleep(0.01 * 2 ** attempt)
+            finally:
+                db.close()
+        return outcomes
+
+
+_control_queue: Optional[ControlQueue] = None
+
+
+def get_control_queue() -> ControlQueue:
+    """Return this process's irrigation control queue"""
+    global _control_queue
+    if _control_queue is None:
+        _control_queue = ControlQueue()
+    return _control_queue
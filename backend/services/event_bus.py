@@ -0,0 +1,243 @@
+"""
+In-process event bus
+
+Publishers hand typed events (dataclasses) to the bus; every subscriber to
+that type has its own bounded queue and consumer task, so subscribers run
+concurrently with each other and with the publisher, and each sees events
+in publish order.
+
+Delivery is in subscriber priority order (lower first). A critical
+subscriber is also awaited: publish() returns once it has handled the
+event and raises its error, so safety-critical work (auto-irrigation)
+finishes before the publisher moves on. When a queue is full the
+subscriber's overflow policy applies: "block" makes the publisher wait for
+room (backpressure), "drop_oldest" discards the oldest waiting event.
+Per-subscriber stats show queue depth, lag from publish to handled, and
+how long the publisher was held up, i.e. which stage is falling behind.
+"""
+
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Type
+
+from models.sensor import SensorReading
+from services.tracing import current_span, get_tracer, use_span
+
+QUEUE_SIZE = 100
+STOP_TIMEOUT_SECONDS = 5
+OVERFLOW_POLICIES = ("block", "drop_oldest")
+
+
+@dataclass
+class ReadingStored:
+    """A reading has been committed (see services.reading_feed)"""
+    reading: SensorReading
+    latest: bool = True  # False if a newer reading of its device was published before or with it
+    published_at: float = field(default_factory=time.monotonic)
+
+
+class Subscriber:
+    """One consumer of an event type, with its own queue, task and metrics"""
+
+    def __init__(self, name: str, handler: Callable[..., Awaitable], priority: int = 100,
+                 critical: bool = False, queue_size: int = QUEUE_SIZE, overflow: str = "block"):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}")
+        self.name = name
+        self.handler = handler
+        self.priority = priority
+        self.critical = critical
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+
+        # Metrics
+        self.delivered = 0
+        self.handled = 0
+        self.failed = 0
+        self.dropped = 0
+        self.max_depth = 0
+        self.blocked_ms = 0.0  # Publisher time spent waiting for room in this queue
+        self.last_lag_ms = 0.0  # Publish to handled
+        self.max_lag_ms = 0.0
+        self.last_error: Optional[str] = None
+        self._total_handle_ms = 0.0
+
+    def stats(self) -> Dict:
+        return {
+            "priority": self.priority,
+            "critical": self.critical,
+            "overflow": self.overflow,
+            "depth": self.queue.qsize() if self.queue else 0,
+            "max_depth": self.max_depth,
+            "delivered": self.delivered,
+            "handled": self.handled,
+            "failed": self.failed,
+            "dropped": self.dropped,
+            "blocked_ms": round(self.blocked_ms, 2),
+            "last_lag_ms": round(self.last_lag_ms, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+            "avg_handle_ms": round(self._total_handle_ms / self.handled, 2) if self.handled else 0,
+            "last_error": self.last_error,
+        }
+
+
+class EventBus:
+    """Typed publish/subscribe with bounded per-subscriber queues"""
+
+    def __init__(self):
+        self.subscribers: Dict[Type, List[Subscriber]] = {}
+        self._running = False
+
+        # Metrics
+        self.published = 0
+
+    @property
+    def running(self) -> bool:
+        return self._running
+
+    def subscribe(self, event_type: Type, name: str, handler: Callable[..., Awaitable], priority: int = 100,
+                  critical: bool = False, queue_size: int = QUEUE_SIZE, overflow: str = "block") -> Subscriber:
+        """Call `await handler(event)` for every published `event_type`, in publish order"""
+        if any(s.name == name for subscribers in self.subscribers.values() for s in subscribers):
+            raise ValueError(f"Subscriber {name} already exists")
+        subscriber = Subscriber(name, handler, priority, critical, queue_size, overflow)
+        subscribers = self.subscribers.setdefault(event_type, [])
+        subscribers.append(subscriber)
+        subscribers.sort(key=lambda s: s.priority)
+        if self._running:
+            self._start_subscriber(subscriber)
+        return subscriber
+
+    async def start(self):
+        if self._running:
+            return
+        self._running = True
+        for subscribers in self.subscribers.values():
+            for subscriber in subscribers:
+                self._start_subscriber(subscriber)
+
+    async def stop(self, timeout: float = STOP_TIMEOUT_SECONDS):
+        """Handle what is queued, then stop (consumers still busy after `timeout` are cancelled)"""
+        if not self._running:
+            return
+        self._running = False
+        subscribers = [s for group in self.subscribers.values() for s in group if s.task is not None]
+        # The stop marker queues behind waiting events (and waits for room like a publisher)
+        markers = [asyncio.create_task(s.queue.put(None)) for s in subscribers]
+        if subscribers:
+            _, pending = await asyncio.wait([s.task for s in subscribers], timeout=timeout)
+            for task in pending:
+                print(f"Event subscriber {task.get_name()} did not finish in time; cancelled")
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+        for marker in markers:
+            marker.cancel()
+        for subscriber in subscribers:
+            # Publishers still waiting on a critical subscriber get an error instead of hanging
+            while not subscriber.queue.empty():
+                item = subscriber.queue.get_nowait()
+                if item is not None and item[2] is not None and not item[2].done():
+                    item[2].set_exception(RuntimeError("Event bus stopped"))
+            subscriber.task = None
+            subscriber.queue = None
+
+    async def publish(self, event):
+        """Deliver `event` to its subscribers; returns once critical subscribers have handled it"""
+        if not self._running:
+            raise RuntimeError("Event bus is not running")
+        self.published += 1
+        span = current_span()
+        waits = []
+        for subscriber in self.subscribers.get(type(event), ()):
+            done = asyncio.get_running_loop().create_future() if subscriber.critical else None
+            await self._put(subscriber, (event, span, done))
+            if done is not None:
+                waits.append(done)
+        for done in waits:
+            await done
+
+    def stats(self) -> Dict:
+        return {
+            "running": self._running,
+            "published": self.published,
+            "subscribers": {
+                subscriber.name: subscriber.stats()
+                for subscribers in self.subscribers.values()
+                for subscriber in subscribers
+            },
+        }
+
+    def _start_subscriber(self, subscriber: Subscriber):
+        subscriber.queue = asyncio.Queue(maxsize=subscriber.queue_size)
+        subscriber.task = asyncio.create_task(self._consume(subscriber), name=subscriber.name)
+
+    async def _put(self, subscriber: Subscriber, item):
+        queue = subscriber.queue
+        if queue.full():
+            if subscriber.overflow == "drop_oldest":
+                _, _, dropped_done = queue.get_nowait()
+                if dropped_done is not None and not dropped_done.done():
+                    dropped_done.set_result(None)
+                subscriber.dropped += 1
+            else:
+                started = time.perf_counter()
+                await queue.put(item)
+                subscriber.blocked_ms += (time.perf_counter() - started) * 1000
+                self._delivered(subscriber)
+                return
+        queue.put_nowait(item)
+        self._delivered(subscriber)
+
+    @staticmethod
+    def _delivered(subscriber: Subscriber):
+        subscriber.delivered += 1
+        subscriber.max_depth = max(subscriber.max_depth, subscriber.queue.qsize())
+
+    async def _consume(self, subscriber: Subscriber):
+        tracer = get_tracer()
+        while True:
+            item = await subscriber.queue.get()
+            if item is None:
+                return
+            event, span, done = item
+            started = time.perf_counter()
+            error: Optional[BaseException] = None
+            try:
+                with use_span(span), tracer.span(f"subscriber {subscriber.name}"):
+                    await subscriber.handler(event)
+            except Exception as e:
+                error = e
+                subscriber.failed += 1
+                subscriber.last_error = f"{type(e).__name__}: {e}"
+                if done is None:
+                    print(f"Event subscriber {subscriber.name} failed: {e}")
+            except asyncio.CancelledError:
+                error = RuntimeError("Event bus stopped")
+                raise
+            finally:
+                subscriber.handled += 1
+                subscriber._total_handle_ms += (time.perf_counter() - started) * 1000
+                published_at = getattr(event, "published_at", None)
+                if published_at is not None:
+                    subscriber.last_lag_ms = (time.monotonic() - published_at) * 1000
+                    subscriber.max_lag_ms = max(subscriber.max_lag_ms, subscriber.last_lag_ms)
+                if done is not None and not done.done():
+                    if error is not None:
+                        done.set_exception(error)
+                    else:
+                        done.set_result(None)
+
+
+_event_bus: Optional[EventBus] = None
+
+
+def get_event_bus() -> EventBus:
+    """Return this process's event bus"""
+    global _event_bus
+    if _event_bus is None:
+        _event_bus = EventBus()
+    return _event_bus
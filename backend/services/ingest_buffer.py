@@ -0,0 +1,502 @@
+import asyncio
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import func, text
+from sqlalchemy.exc import IntegrityError, OperationalError
+from models.database import SessionLocal
+from models.sensor import SensorReading, DEFAULT_DEVICE_ID
+from services.control_queue import get_control_queue
+from services.irrigation_service import IrrigationService
+from services.process_lock import ProcessLock
+from services.recent_readings import get_recent_readings
+
+INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "500"))
+INGEST_FLUSH_MS = int(os.getenv("INGEST_FLUSH_MS", "200"))
+INGEST_LOG_PATH = os.getenv("INGEST_LOG_PATH", "./ingest_buffer.log")
+INGEST_LOG_FSYNC = os.getenv("INGEST_LOG_FSYNC", "0") == "1"
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "100000"))  # Rows held while the database is unavailable
+WRITE_ATTEMPTS = 3  # Should another writer store the same device_seq first, re-check
+SEQ_LOOKUP_CHUNK = 500
+REINTEGRATE_RETRY_SECONDS = 30  # After a failed session re-integration
+
+
+class IngestBacklogFull(RuntimeError):
+    """The buffer already holds INGEST_MAX_PENDING uncommitted rows"""
+
+
+class IngestBuffer:
+    """Write-behind buffer that group-commits sensor readings
+
+    Readings are appended to a local log and kept in memory until the buffer
+    holds `max_rows` rows or `max_delay_ms` has passed, then written in one
+    transaction. After each successful commit the flushed log segment is
+    deleted, so whatever is left in the log on startup was accepted but never
+    committed and is replayed.
+
+    Each process claims its own log file (ingest_buffer.log,
+    ingest_buffer.1.log, ...) through a file lock, so several API workers can
+    buffer side by side.
+
+    Readings carrying a device_seq already stored for their device (a retried
+    upload) are skipped and resolve to the stored row's id. Readings older
+    than their device's newest stored one are late and are inserted all the
+    same. The irrigation sessions that committed on-site readings fall into
+    are re-integrated from the stored readings, so a session's volume does
+    not depend on the order its readings arrived in. A re-integration that
+    fails is retried every REINTEGRATE_RETRY_SECONDS; its time range is kept
+    in <log>.reintegrate until it succeeds, so a restart retries it too.
+
+    A batch that fails because the database is unavailable (OperationalError)
+    is kept and retried; new readings are refused with IngestBacklogFull once
+    `max_pending` rows are waiting. Any other failure means a row the
+    database will never take, so the batch is retried one row at a time and
+    rows that still fail go to the dead-letter log (<log>.dead) instead of
+    blocking everything behind them.
+    """
+
+    def __init__(self, log_path: str = INGEST_LOG_PATH, max_rows: int = INGEST_FLUSH_ROWS,
+                 max_delay_ms: int = INGEST_FLUSH_MS, fsync: bool = INGEST_LOG_FSYNC,
+                 max_pending: int = INGEST_MAX_PENDING, session_factory=SessionLocal):
+        self.base_log_path = log_path
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self.fsync = fsync
+        self.max_pending = max_pending
+        self.session_factory = session_factory
+
+        self.log_path: Optional[str] = None
+        self._lock: Optional[ProcessLock] = None
+        self._log_fd: Optional[int] = None
+        self._pending: List[Dict] = []
+        self._waiters: List[asyncio.Future] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self._corrections: set = set()
+        self._failed_range: Optional[Tuple[datetime, datetime]] = None  # Still to re-integrate
+        self._retry_at = 0.0
+
+        # Metrics
+        self.flushed_rows = 0
+        self.duplicate_rows = 0
+        self.late_rows = 0
+        self.session_reintegrations = 0
+        self.reintegration_failures = 0
+        self.write_retries = 0
+        self.flush_count = 0
+        self.failed_flushes = 0
+        self.dead_letter_rows = 0
+        self.rejected_rows = 0  # Refused because the backlog was full
+        self.replayed_rows = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    @property
+    def depth(self) -> int:
+        return len(self._pending)
+
+    async def start(self):
+        """Claim a log file, replay anything left from a crash and start flushing"""
+        if self.running:
+            return
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._closing = False
+
+        self._claim_log()
+        leftover = self._read_log(self._segment_path()) + self._read_log(self.log_path)
+        if leftover:
+            print(f"Replaying {len(leftover)} buffered readings from {self.log_path}")
+            # Merge both files into one log atomically before dropping the segment
+            replay_path = self.log_path + ".replay"
+            with open(replay_path, "w") as f:
+                f.writelines(_encode_row(row) for row in leftover)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(replay_path, self.log_path)
+            if os.path.exists(self._segment_path()):
+                os.remove(self._segment_path())
+
+            self.replayed_rows += len(leftover)
+            self._pending.extend(leftover)
+            self._waiters.extend(None for _ in leftover)
+        self._open_log()
+        self._failed_range = self._read_failed_range()
+        self._retry_at = 0.0
+
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Drain the buffer, then stop the flush loop and release the log"""
+        if not self.running:
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        if self._corrections:
+            await asyncio.gather(*self._corrections)
+        if self._failed_range:
+            print(f"Irrigation sessions from {self._failed_range[0]} to {self._failed_range[1]} "
+                  f"still need re-integrating; retried on restart")
+        self._close_log()
+        if self._lock:
+            self._lock.release()
+            self._lock = None
+
+    def submit_many(self, rows: List[Dict]) -> List[asyncio.Future]:
+        """Queue readings; each future resolves to the committed row id"""
+        if not self.running or self._closing:
+            raise RuntimeError("Ingest buffer is not running")
+        if len(self._pending) + len(rows) > self.max_pending:
+            self.rejected_rows += len(rows)
+            raise IngestBacklogFull(f"Ingest backlog is full ({len(self._pending)} of {self.max_pending} readings waiting)")
+
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in rows]
+        self._append_log(rows)
+        self._pending.extend(rows)
+        self._waiters.extend(futures)
+        if len(self._pending) >= self.max_rows:
+            self._wakeup.set()
+        return futures
+
+    async def submit(self, row: Dict) -> int:
+        """Queue one reading and wait until it is committed; return its id"""
+        return await self.submit_many([row])[0]
+
+    async def flush(self):
+        """Write everything currently buffered in one transaction"""
+        async with self._flush_lock:
+            if not self._pending:
+                return
+
+            rows, waiters = self._pending, self._waiters
+            self._pending, self._waiters = [], []
+            self._rotate_log()
+
+            started = time.perf_counter()
+            try:
+                result = await asyncio.to_thread(self._write_batch, rows)
+            except OperationalError as e:
+                # Database unavailable: keep the rows (and their log lines) for the next attempt
+                print(f"Ingest flush error: {e}")
+                self.failed_flushes += 1
+                self._requeue(rows, waiters)
+                os.remove(self._segment_path())
+                return
+            except Exception as e:
+                # Some row cannot be stored; find it instead of retrying the batch forever
+                print(f"Ingest flush error, writing rows one at a time: {e}")
+                self.failed_flushes += 1
+                await self._write_singly(rows, waiters)
+                os.remove(self._segment_path())
+                return
+
+            os.remove(self._segment_path())
+            self._committed(rows, waiters, result, started)
+
+    async def _write_singly(self, rows: List[Dict], waiters: List[Optional[asyncio.Future]]):
+        for position, (row, waiter) in enumerate(zip(rows, waiters)):
+            started = time.perf_counter()
+            try:
+                result = await asyncio.to_thread(self._write_batch, [row])
+            except OperationalError as e:
+                print(f"Ingest flush error: {e}")
+                self._requeue(rows[position:], waiters[position:])
+                return
+            except Exception as e:
+                self._dead_letter(row, waiter, e)
+                continue
+            self._committed([row], [waiter], result, started)
+
+    def _committed(self, rows: List[Dict], waiters: List[Optional[asyncio.Future]], result, started: float):
+        ids, inserted, seqs, late = result
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flush_count += 1
+        self.flushed_rows += len(inserted)
+        self.duplicate_rows += len(rows) - len(inserted)
+        self.late_rows += len(late)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+
+        get_recent_readings().add([rows[i] for i in inserted], [ids[i] for i in inserted], seqs)
+        for waiter, row_id in zip(waiters, ids):
+            if waiter is not None and not waiter.done():
+                waiter.set_result(row_id)
+
+        on_site = [rows[i]["timestamp"] for i in inserted if rows[i]["device_id"] == DEFAULT_DEVICE_ID]
+        if on_site:
+            self._start_reintegration(min(on_site), max(on_site))
+
+    def _start_reintegration(self, first: datetime, last: datetime, retry: bool = False):
+        # In the background: the control queue may be busy, ingest must not wait for it
+        task = asyncio.create_task(self._reintegrate_sessions(first, last, retry))
+        self._corrections.add(task)
+        task.add_done_callback(self._corrections.discard)
+
+    def _requeue(self, rows: List[Dict], waiters: List[Optional[asyncio.Future]]):
+        self._pending[:0] = rows
+        self._waiters[:0] = waiters
+        self._append_log(rows)
+
+    def _dead_letter(self, row: Dict, waiter: Optional[asyncio.Future], error: Exception):
+        print(f"Ingest dropped a reading from {row.get('device_id')}: {error}")
+        self.dead_letter_rows += 1
+        with open(self.log_path + ".dead", "a") as f:
+            f.write(json.dumps({"error": str(error), "row": row}, default=_encode_value) + "\n")
+        if waiter is not None and not waiter.done():
+            waiter.set_exception(ValueError(f"Reading could not be stored: {error}"))
+            waiter.exception()  # Logged above; HTTP ingest never awaits its futures
+
+    def stats(self) -> Dict:
+        return {
+            "depth": self.depth,
+            "flushed_rows": self.flushed_rows,
+            "duplicate_rows": self.duplicate_rows,
+            "late_rows": self.late_rows,
+            "session_reintegrations": self.session_reintegrations,
+            "reintegration_failures": self.reintegration_failures,
+            "reintegration_pending": self._failed_range is not None,
+            "write_retries": self.write_retries,
+            "flush_count": self.flush_count,
+            "failed_flushes": self.failed_flushes,
+            "dead_letter_rows": self.dead_letter_rows,
+            "rejected_rows": self.rejected_rows,
+            "max_pending": self.max_pending,
+            "replayed_rows": self.replayed_rows,
+            "last_flush_ms": round(self.last_flush_ms, 2),
+            "avg_flush_ms": round(self._total_flush_ms / self.flush_count, 2) if self.flush_count else 0,
+            "max_flush_ms": round(self.max_flush_ms, 2),
+            "max_rows": self.max_rows,
+            "max_delay_ms": int(self.max_delay * 1000),
+            "log_path": self.log_path,
+        }
+
+    async def _run(self):
+        shutdown_attempts = 0
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+
+            await self.flush()
+
+            if self._failed_range and time.monotonic() >= self._retry_at:
+                self._retry_at = time.monotonic() + REINTEGRATE_RETRY_SECONDS
+                self._start_reintegration(*self._failed_range, retry=True)
+
+            if self._closing:
+                shutdown_attempts += 1
+                # Anything still pending stays in the log and is replayed on restart
+                if not self._pending or shutdown_attempts >= 3:
+                    return
+
+    def _write_batch(self, rows: List[Dict]) -> Tuple[List[int], List[int], List[Optional[int]], List[Dict]]:
+        """Insert the batch in one transaction
+
+        Returns every row's id (the stored row's for a duplicate), the
+        positions of the rows actually inserted, their change_seqs, and the
+        inserted rows that are late.
+        """
+        for attempt in range(WRITE_ATTEMPTS):
+            db = self.session_factory()
+            try:
+                # Take the write lock before checking for duplicates, as init_db does; writers
+                # bump this counter on flush anyway, so it serializes nothing new
+                db.execute(text("UPDATE change_sequence SET value = value WHERE id = 1"))
+                stored = self._stored_ids(db, rows)
+                ids: List[Optional[int]] = [None] * len(rows)
+                inserted: List[int] = []
+                first: Dict[Tuple[str, int], int] = {}
+                for index, row in enumerate(rows):
+                    key = (row["device_id"], row.get("device_seq"))
+                    if key[1] is not None:
+                        if key in stored:
+                            ids[index] = stored[key]
+                            continue
+                        if key in first:
+                            continue  # Repeated within the batch; takes the first one's id below
+                        first[key] = index
+                    inserted.append(index)
+
+                late = self._late_rows(db, [rows[i] for i in inserted])
+                readings = [SensorReading(**rows[i]) for i in inserted]
+                db.add_all(readings)
+                db.flush()
+                for index, reading in zip(inserted, readings):
+                    ids[index] = reading.id
+                seqs = [reading.change_seq for reading in readings]
+                db.commit()
+            except IntegrityError:
+                # Another process stored one of these device_seqs first
+                db.rollback()
+                if attempt == WRITE_ATTEMPTS - 1:
+                    raise
+                self.write_retries += 1
+                continue
+            finally:
+                db.close()
+
+            for index, row in enumerate(rows):
+                if ids[index] is None:
+                    ids[index] = ids[first[(row["device_id"], row["device_seq"])]]
+            return ids, inserted, seqs, late
+
+    @staticmethod
+    def _stored_ids(db, rows: List[Dict]) -> Dict[Tuple[str, int], int]:
+        """(device_id, device_seq) -> id for the batch's sequence numbers already stored"""
+        by_device: Dict[str, set] = {}
+        for row in rows:
+            if row.get("device_seq") is not None:
+                by_device.setdefault(row["device_id"], set()).add(row["device_seq"])
+
+        stored = {}
+        for device_id, seqs in by_device.items():
+            seqs = sorted(seqs)
+            for start in range(0, len(seqs), SEQ_LOOKUP_CHUNK):
+                for seq, row_id in db.query(SensorReading.device_seq, SensorReading.id).filter(
+                    SensorReading.device_id == device_id,
+                    SensorReading.device_seq.in_(seqs[start:start + SEQ_LOOKUP_CHUNK])
+                ):
+                    stored[(device_id, seq)] = row_id
+        return stored
+
+    @staticmethod
+    def _late_rows(db, rows: List[Dict]) -> List[Dict]:
+        """Rows older than their device's newest stored reading (one index lookup per device)"""
+        late = []
+        for device_id in {row["device_id"] for row in rows}:
+            newest = db.query(func.max(SensorReading.timestamp)).filter(
+                SensorReading.device_id == device_id
+            ).scalar()
+            if newest is not None:
+                late.extend(row for row in rows if row["device_id"] == device_id and row["timestamp"] < newest)
+        return late
+
+    async def _reintegrate_sessions(self, first: datetime, last: datetime, retry: bool = False):
+        """Re-integrate irrigation sessions that on-site readings from first to last fall into"""
+        try:
+            reintegrated = await get_control_queue().submit(
+                lambda db: IrrigationService(db).reintegrate_sessions(first, last)
+            )
+        except Exception as e:
+            print(f"Session reintegration error, retrying in {REINTEGRATE_RETRY_SECONDS}s: {e}")
+            self.reintegration_failures += 1
+            if self._failed_range:
+                first, last = min(first, self._failed_range[0]), max(last, self._failed_range[1])
+            else:
+                self._retry_at = time.monotonic() + REINTEGRATE_RETRY_SECONDS
+            self._failed_range = (first, last)
+            self._write_failed_range()
+            return
+        self.session_reintegrations += reintegrated
+        if retry and self._failed_range == (first, last):
+            self._failed_range = None
+            self._write_failed_range()
+
+    def _write_failed_range(self):
+        path = self.log_path + ".reintegrate"
+        if self._failed_range is None:
+            if os.path.exists(path):
+                os.remove(path)
+            return
+        first, last = self._failed_range
+        with open(path + ".tmp", "w") as f:
+            json.dump({"first": first.isoformat(), "last": last.isoformat()}, f)
+        os.replace(path + ".tmp", path)
+
+    def _read_failed_range(self) -> Optional[Tuple[datetime, datetime]]:
+        path = self.log_path + ".reintegrate"
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            saved = json.load(f)
+        return datetime.fromisoformat(saved["first"]), datetime.fromisoformat(saved["last"])
+
+    # Append-only log
+
+    def _claim_log(self):
+        root, ext = os.path.splitext(self.base_log_path)
+        slot = 0
+        while True:
+            path = self.base_log_path if slot == 0 else f"{root}.{slot}{ext}"
+            lock = ProcessLock(path + ".lock")
+            if lock.acquire():
+                self.log_path, self._lock = path, lock
+                return
+            slot += 1
+
+    def _segment_path(self) -> str:
+        return self.log_path + ".flushing"
+
+    def _open_log(self):
+        self._log_fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+
+    def _close_log(self):
+        if self._log_fd is not None:
+            os.close(self._log_fd)
+            self._log_fd = None
+
+    def _rotate_log(self):
+        """Move the current log aside as the segment being flushed"""
+        self._close_log()
+        os.replace(self.log_path, self._segment_path())
+        self._open_log()
+
+    def _append_log(self, rows: List[Dict]):
+        lines = "".join(_encode_row(row) for row in rows)
+        os.write(self._log_fd, lines.encode())
+        if self.fsync:
+            os.fsync(self._log_fd)
+
+    @staticmethod
+    def _read_log(path: str) -> List[Dict]:
+        if not path or not os.path.exists(path):
+            return []
+        rows = []
+        with open(path) as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    # Torn final line from a crash mid-write
+                    continue
+                if row.get("timestamp"):
+                    row["timestamp"] = datetime.fromisoformat(row["timestamp"])
+                rows.append(row)
+        return rows
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Cannot encode {type(value).__name__} in ingest log")
+
+
+def _encode_row(row: Dict) -> str:
+    return json.dumps(row, default=_encode_value) + "\n"
+
+
+_ingest_buffer: Optional[IngestBuffer] = None
+
+
+def get_ingest_buffer() -> IngestBuffer:
+    """Return this process's ingest buffer"""
+    global _ingest_buffer
+    if _ingest_buffer is None:
+        _ingest_buffer = IngestBuffer()
+    return _ingest_buffer
@@ -1,49 +1,111 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import desc
+from sqlalchemy import desc, or_
 from models.database import SessionLocal
-from models.sensor import IrrigationControl, SensorReading, Alert, IrrigationSession
+from models.sensor import IrrigationControl, SensorReading, Alert, IrrigationSession, DEFAULT_DEVICE_ID
 from schemas.sensor_schemas import IrrigationControlRequest, IrrigationStatusResponse, IrrigationSessionResponse
+from services.settings_service import get_rules
+from services.control_queue import ControlConflict
+from services.water_ledger import WaterLedgerService, farm_timezone, get_zone, local_day
+from services.tracing import traced_methods
 from datetime import datetime
-import json
 from typing import Optional, List
 
+# Flow samples further apart than this are bridged with the lower of the two rates
+MAX_FLOW_GAP_SECONDS = 600
+# Only used for sessions that never saw a flow reading
+NOMINAL_FLOW_RATE = 15.0  # L/min
+
+def integrate_flow(prev_rate: float, prev_at: datetime, rate: float, at: datetime) -> float:
+    """Liters delivered between two flow samples (trapezoidal rule)"""
+    seconds = (at - prev_at).total_seconds()
+    if seconds <= 0:
+        return 0.0
+    if seconds > MAX_FLOW_GAP_SECONDS:
+        # Sensor was silent; don't assume the flow ramped between the samples
+        mean_rate = min(prev_rate, rate)
+    else:
+        mean_rate = (prev_rate + rate) / 2
+    return mean_rate * seconds / 60
+
+class FlowAccumulator:
+    """Running flow integral for one session"""
+    
+    def __init__(self, started_at: datetime, volume: float = 0.0,
+                 last_rate: Optional[float] = None, last_at: Optional[datetime] = None):
+        self.started_at = started_at
+        self.volume = volume
+        self.last_rate = last_rate
+        self.last_at = last_at
+    
+    def add(self, rate: float, at: datetime) -> bool:
+        """Integrate one reading; returns False for readings older than the last one"""
+        if self.last_at is None:
+            # Hold the first measured rate back to when the session started
+            self.volume += integrate_flow(rate, self.started_at, rate, at)
+        elif at > self.last_at:
+            self.volume += integrate_flow(self.last_rate, self.last_at, rate, at)
+        else:
+            return False
+        self.last_rate = rate
+        self.last_at = at
+        return True
+    
+    def total(self, ended_at: datetime) -> float:
+        """Volume for the whole session, holding the last rate until it ended"""
+        if self.last_at is None:
+            minutes = max((ended_at - self.started_at).total_seconds(), 0) / 60
+            return minutes * NOMINAL_FLOW_RATE
+        return self.volume + integrate_flow(self.last_rate, self.last_at, self.last_rate, ended_at)
+
+@traced_methods
 class IrrigationService:
     def __init__(self, db: Session):
         self.db = db
     
-    async def get_current_status(self) -> IrrigationStatusResponse:
-        """Get current irrigation system status"""
-        control = self.db.query(IrrigationControl).order_by(desc(IrrigationControl.updated_at)).first()
-        
-        if not control:
-            # Create default control settings
-            control = IrrigationControl(
-                mode="normal",
-                is_irrigating=False,
-                auto_mode=True
-            )
-            self.db.add(control)
-            self.db.commit()
-            self.db.refresh(control)
-        
+    def _get_control(self) -> Optional[IrrigationControl]:
+        return self.db.query(IrrigationControl).order_by(desc(IrrigationControl.updated_at)).first()
+    
+    def _add_default_control(self) -> IrrigationControl:
+        """Add the control row with default settings (control queue only)"""
+        control = IrrigationControl(
+            mode="normal",
+            is_irrigating=False,
+            auto_mode=True
+        )
+        self.db.add(control)
+        return control
+    
+    @staticmethod
+    def _status(control: IrrigationControl) -> IrrigationStatusResponse:
         return IrrigationStatusResponse(
             mode=control.mode,
             is_irrigating=control.is_irrigating,
             auto_mode=control.auto_mode,
-            last_updated=control.updated_at
+            last_updated=control.updated_at or datetime.utcnow(),
+            version=control.version or 0
         )
     
+    async def get_current_status(self) -> IrrigationStatusResponse:
+        """Get current irrigation system status"""
+        control = self._get_control()
+        
+        if not control:
+            # Default control settings; the row is created by the first command or tick
+            control = IrrigationControl(mode="normal", is_irrigating=False, auto_mode=True, version=0)
+        
+        return self._status(control)
+    
     async def update_control(self, request: IrrigationControlRequest) -> IrrigationStatusResponse:
-        """Update irrigation control settings"""
-        control = self.db.query(IrrigationControl).order_by(desc(IrrigationControl.updated_at)).first()
+        """Update irrigation control settings (run through the control queue, which commits)"""
+        control = self._get_control()
+        
+        if request.expected_version is not None:
+            current_version = control.version if control else 0
+            if request.expected_version != current_version:
+                raise ControlConflict(request.expected_version, current_version)
         
         if not control:
-            control = IrrigationControl(
-                mode="normal",
-                is_irrigating=False,
-                auto_mode=True
-            )
-            self.db.add(control)
+            control = self._add_default_control()
         
         # Track irrigation status changes for session management
         was_irrigating = control.is_irrigating
@@ -79,14 +141,12 @@ class IrrigationService:
         elif was_irrigating and not new_irrigating:
             session_id = await self._end_session()
         
-        self.db.commit()
-        self.db.refresh(control)
-        
         # Create alerts with session linking
         if request.mode is not None:
             alert = Alert(
                 alert_type="info",
-                message=json.dumps({"key": "alert_mode_changed", "params": {"mode": control.mode.upper()}}),
+                alert_key="alert_mode_changed",
+                params={"mode": control.mode.upper()},
                 irrigation_session_id=session_id
             )
             self.db.add(alert)
@@ -95,19 +155,16 @@ class IrrigationService:
             status_text = "started" if control.is_irrigating else "stopped"
             alert = Alert(
                 alert_type="info",
-                message=json.dumps({"key": "alert_irrigation_status", "params": {"status": status_text, "mode": control.mode}}),
+                alert_key="alert_irrigation_status",
+                params={"status": status_text, "mode": control.mode},
                 irrigation_session_id=session_id
             )
             self.db.add(alert)
         
-        self.db.commit()
+        # Control row, session and alerts are committed together by the control queue
+        self.db.flush()
         
-        return IrrigationStatusResponse(
-            mode=control.mode,
-            is_irrigating=control.is_irrigating,
-            auto_mode=control.auto_mode,
-            last_updated=control.updated_at
-        )
+        return self._status(control)
     
     async def get_irrigation_history(self, limit: int = 10) -> List[IrrigationSessionResponse]:
         """Get recent irrigation sessions"""
@@ -128,44 +185,43 @@ class IrrigationService:
         ]
     
     async def check_auto_irrigation(self, sensor_reading: SensorReading):
-        """Check if automatic irrigation should be triggered"""
-        control = self.db.query(IrrigationControl).order_by(desc(IrrigationControl.updated_at)).first()
+        """Check if automatic irrigation should be triggered (run through the control queue, which commits)"""
+        # A fresh database has no control row until the first command; auto
+        # mode is the default, so the first tick creates it
+        control = self._get_control() or self._add_default_control()
+        
+        # Integrate measured flow into the open session, whatever the mode
+        if control.is_irrigating:
+            self._accumulate_flow(sensor_reading)
         
-        if not control or not control.auto_mode or control.mode == "off":
+        if not control.auto_mode or control.mode == "off":
+            self.db.flush()
             return
         
+        rules = get_rules()
+        rule = rules.irrigation_rules.get(control.mode)
+        
         should_irrigate = False
         reason = ""
         reason_key = ""
         reason_params = {}
         
-        # Auto irrigation logic based on mode and sensor data
-        if control.mode == "normal":
-            # Normal mode: irrigate if soil moisture < 40% and water level > 30%
-            if sensor_reading.soil_moisture < 40 and sensor_reading.water_level > 30:
-                should_irrigate = True
-                reason = f"Low soil moisture: {sensor_reading.soil_moisture}%"
-                reason_key = "reason_low_moisture"
-                reason_params = {"moisture": sensor_reading.soil_moisture}
-        
-        elif control.mode == "survival":
-            # Survival mode: conserve water, only irrigate if critically low
-            if sensor_reading.soil_moisture < 20 and sensor_reading.water_level > 50:
-                should_irrigate = True
-                reason = f"Critical soil moisture in survival mode: {sensor_reading.soil_moisture}%"
-                reason_key = "reason_critical_moisture_survival"
-                reason_params = {"moisture": sensor_reading.soil_moisture}
+        # Auto irrigation logic based on mode and the configured thresholds
+        # (normal mode irrigates when dry; survival mode conserves water and
+        # only irrigates when critically low)
+        if rule and sensor_reading.soil_moisture < rule.start_below and sensor_reading.water_level > rule.min_water_level:
+            should_irrigate = True
+            reason = rule.reason.format(moisture=sensor_reading.soil_moisture)
+            reason_key = rule.reason_key
+            reason_params = {"moisture": sensor_reading.soil_moisture}
         
         # Don't irrigate if water level is too low
-        if should_irrigate and sensor_reading.water_level < 25:
+        if should_irrigate and sensor_reading.water_level < rules.pump_cutoff_water_level:
             should_irrigate = False
-            # reason = f"Insufficient water level: {sensor_reading.water_level}%" 
-            # Not needed as we just don't start
         
         # Don't irrigate if high vibration (pump issues)
         if should_irrigate and sensor_reading.vibration_status == "high":
             should_irrigate = False
-            # reason = "High vibration detected - pump safety stop"
         
         # Update irrigation status if needed
         if should_irrigate and not control.is_irrigating:
@@ -177,10 +233,8 @@ class IrrigationService:
             
             alert = Alert(
                 alert_type="info",
-                message=json.dumps({
-                    "key": "alert_auto_irrigation_started", 
-                    "params": {"reason_key": reason_key, "reason_params": reason_params}
-                }),
+                alert_key="alert_auto_irrigation_started",
+                params={"reason_key": reason_key, "reason_params": reason_params},
                 sensor_reading_id=sensor_reading.id,
                 irrigation_session_id=session_id
             )
@@ -188,17 +242,8 @@ class IrrigationService:
         
         elif not should_irrigate and control.is_irrigating and control.mode != "manual":
             # Stop irrigation if conditions no longer require it (except manual mode)
-            should_stop = False
-            if control.mode == "normal" and sensor_reading.soil_moisture > 60:
-                should_stop = True
-                stop_alert_key = "alert_auto_irrigation_stopped"
-                stop_reason_key = "reason_moisture_sufficient"
+            should_stop = rule is not None and sensor_reading.soil_moisture > rule.stop_above
             
-            elif control.mode == "survival" and sensor_reading.soil_moisture > 35:
-                should_stop = True
-                stop_alert_key = "alert_survival_irrigation_stopped"
-                stop_reason_key = "reason_target_reached"
-
             if should_stop:
                 control.is_irrigating = False
                 control.updated_at = datetime.utcnow()
@@ -208,56 +253,147 @@ class IrrigationService:
                 
                 alert = Alert(
                     alert_type="info",
-                    message=json.dumps({
-                        "key": stop_alert_key, 
-                        "params": {
-                            "reason_key": stop_reason_key, 
-                            "reason_params": {"moisture": sensor_reading.soil_moisture}
-                        }
-                    }),
+                    alert_key=rule.stop_alert_key,
+                    params={
+                        "reason_key": rule.stop_reason_key,
+                        "reason_params": {"moisture": sensor_reading.soil_moisture}
+                    },
                     sensor_reading_id=sensor_reading.id,
                     irrigation_session_id=session_id
                 )
                 self.db.add(alert)
         
         # Auto-switch to survival mode if health score is critical
-        if sensor_reading.water_level < 30 and control.mode == "normal":
+        if sensor_reading.water_level < rules.survival_switch_water_level and control.mode == "normal":
             control.mode = "survival"
             control.updated_at = datetime.utcnow()
             
             alert = Alert(
                 alert_type="critical",
-                message=json.dumps({"key": "alert_survival_mode_switch", "params": {}}),
+                alert_key="alert_survival_mode_switch",
                 sensor_reading_id=sensor_reading.id
             )
             self.db.add(alert)
         
-        self.db.commit()
+        self.db.flush()
 
     async def _start_session(self, mode: str, reason: str = None) -> int:
-        """Helper to start an irrigation session"""
+        """Helper to start an irrigation session (or keep the one already open)"""
+        current_session = self._current_session()
+        if current_session:
+            return current_session.id
+        
         if not reason:
             reason = "Manual start" if mode == "manual" else f"Auto start ({mode} mode)"
             
         session = IrrigationSession(
             mode=mode,
+            started_at=datetime.utcnow(),  # Same clock and precision as ended_at
             trigger_reason=reason
         )
         self.db.add(session)
         self.db.flush()
         return session.id
 
-    async def _end_session(self) -> Optional[int]:
-        """Helper to end the current active irrigation session"""
-        current_session = self.db.query(IrrigationSession).filter(
+    def _current_session(self) -> Optional[IrrigationSession]:
+        return self.db.query(IrrigationSession).filter(
             IrrigationSession.ended_at.is_(None)
         ).order_by(desc(IrrigationSession.started_at)).first()
+
+    def _accumulate_flow(self, sensor_reading: SensorReading):
+        """Add the reading's flow to the open session's running integral"""
+        session = self._current_session()
+        if not session:
+            return
+        
+        accumulator = FlowAccumulator(
+            session.started_at, session.flow_volume_liters or 0.0,
+            session.last_flow_rate, session.last_flow_at
+        )
+        if accumulator.add(sensor_reading.flow_rate, sensor_reading.timestamp):
+            session.flow_volume_liters = accumulator.volume
+            session.last_flow_rate = accumulator.last_rate
+            session.last_flow_at = accumulator.last_at
+
+    async def _end_session(self) -> Optional[int]:
+        """Helper to end the current active irrigation session"""
+        current_session = self._current_session()
         
         if current_session:
             current_session.ended_at = datetime.utcnow()
             duration = (current_session.ended_at - current_session.started_at).total_seconds() / 60
             current_session.duration_minutes = int(duration)
-            # Estimate water volume (rough calculation: 15L/min average flow)
-            current_session.estimated_volume_liters = round(duration * 15, 1)
+            # Water volume from the flow integral accumulated while the session was open
+            accumulator = FlowAccumulator(
+                current_session.started_at, current_session.flow_volume_liters or 0.0,
+                current_session.last_flow_rate, current_session.last_flow_at
+            )
+            current_session.estimated_volume_liters = round(accumulator.total(current_session.ended_at), 1)
+            WaterLedgerService(self.db).record_session(current_session)
             return current_session.id
-        return None
\ No newline at end of file
+        return None
+
+    async def recompute_session_volumes(self, since: Optional[datetime] = None) -> int:
+        """Recompute closed sessions' volumes from stored flow readings
+        
+        Sessions and readings are both walked in time order (one pass over
+        each), so correcting years of history stays linear.
+        """
+        query = self.db.query(IrrigationSession).filter(IrrigationSession.ended_at.isnot(None))
+        if since:
+            query = query.filter(IrrigationSession.started_at >= since)
+        sessions = query.order_by(IrrigationSession.started_at).all()
+        self._reintegrate(sessions)
+        self.db.commit()
+        return len(sessions)
+
+    async def reintegrate_sessions(self, first: datetime, last: datetime) -> int:
+        """Re-integrate only the sessions (open or closed) overlapping new readings from first to last"""
+        sessions = self.db.query(IrrigationSession).filter(
+            IrrigationSession.started_at <= last,
+            or_(IrrigationSession.ended_at.is_(None), IrrigationSession.ended_at >= first)
+        ).order_by(IrrigationSession.started_at).all()
+        self._reintegrate(sessions)
+        self.db.flush()
+        return len(sessions)
+
+    def _reintegrate(self, sessions: List[IrrigationSession]):
+        """Rebuild the flow integral of `sessions` (in start order) and their ledger days"""
+        if not sessions:
+            return
+        now = datetime.utcnow()
+        
+        readings = self.db.query(SensorReading.timestamp, SensorReading.flow_rate).filter(
+            SensorReading.device_id == DEFAULT_DEVICE_ID,
+            SensorReading.timestamp >= sessions[0].started_at,
+            SensorReading.timestamp <= max(s.ended_at or now for s in sessions)
+        ).order_by(SensorReading.timestamp).yield_per(10000)
+        
+        accumulators = {s.id: FlowAccumulator(s.started_at) for s in sessions}
+        next_index = 0
+        active = []
+        for timestamp, flow_rate in readings:
+            while next_index < len(sessions) and sessions[next_index].started_at <= timestamp:
+                active.append(sessions[next_index])
+                next_index += 1
+            active = [s for s in active if s.ended_at is None or s.ended_at >= timestamp]
+            for session in active:
+                accumulators[session.id].add(flow_rate, timestamp)
+        
+        for session in sessions:
+            accumulator = accumulators[session.id]
+            session.flow_volume_liters = accumulator.volume
+            session.last_flow_rate = accumulator.last_rate
+            session.last_flow_at = accumulator.last_at
+            if session.ended_at is not None:
+                session.estimated_volume_liters = round(accumulator.total(session.ended_at), 1)
+        
+        # Re-total the ledger days the closed sessions fall on
+        closed = [s for s in sessions if s.ended_at is not None]
+        if closed:
+            timezone_name = farm_timezone(self.db)
+            zone = get_zone(timezone_name)
+            self.db.flush()
+            WaterLedgerService(self.db).rebuild(
+                timezone_name, since=local_day(closed[0].started_at, zone), until=local_day(closed[-1].started_at, zone)
+            )
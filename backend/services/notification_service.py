@@ -0,0 +1,316 @@
+import abc
+import asyncio
+import json
+import os
+import random
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import object_session
+from models.database import SessionLocal
+from models.sensor import Alert
+from services.rate_limit import TokenBucket
+from services.settings_service import get_rules
+
+# Channel configuration (all optional; no channel means notifications stay in the alerts table)
+NOTIFY_FILE = os.getenv("NOTIFY_FILE")  # JSON-lines file, stands in for push in dev/tests
+NOTIFY_PUSH_WEBHOOK = os.getenv("NOTIFY_PUSH_WEBHOOK")
+NOTIFY_SMS_WEBHOOK = os.getenv("NOTIFY_SMS_WEBHOOK")
+
+COALESCE_SECONDS = 2.0  # Alerts arriving within this window go out as one message
+QUEUE_SIZE = 1000
+MAX_ATTEMPTS = 5
+STOP_TIMEOUT_SECONDS = 10  # To flush queued notifications on shutdown
+
+
+@dataclass
+class Notification:
+    alert_id: int
+    alert_type: str
+    key: str
+    params: Dict
+    created_at: str
+
+    @classmethod
+    def from_alert(cls, alert: Alert) -> "Notification":
+        # Read loaded values only: this runs inside the flush, where
+        # touching an expired attribute would issue SQL
+        values = inspect(alert).dict
+        created_at = values.get("created_at") or datetime.utcnow()
+        return cls(values.get("id"), values.get("alert_type"), values.get("alert_key"),
+                   values.get("params") or {}, created_at.isoformat())
+
+
+class NotificationChannel(abc.ABC):
+    """Base class for delivery backends
+
+    `gate` names the settings flag that enables the channel ('push' or
+    'sms'). Subclasses implement `send`, which raises on failure.
+    """
+
+    name = "channel"
+
+    def __init__(self, gate: str = "push", rate_per_minute: float = 30, burst: int = 10,
+                 min_severity: str = "warning"):
+        self.gate = gate
+        self.bucket = TokenBucket(rate_per_minute, burst)
+        self.min_severity = min_severity
+        self.queue: asyncio.Queue = None
+
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.dropped = 0
+        self.rate_limited_seconds = 0.0
+
+    def accepts(self, notification: Notification) -> bool:
+        rules = get_rules()
+        if self.gate == "sms" and not rules.sms_alert:
+            return False
+        if self.gate == "push" and not rules.push_enabled:
+            return False
+        if notification.alert_type == "critical":
+            return rules.critical_alert
+        if notification.alert_type == "warning":
+            return rules.warning_alert and self.min_severity in ("warning", "info")
+        return self.min_severity == "info"
+
+    @abc.abstractmethod
+    async def send(self, batch: List[Notification]):
+        """Deliver one batch; raise on failure"""
+
+    def stats(self) -> Dict:
+        return {
+            "gate": self.gate,
+            "queued": self.queue.qsize() if self.queue else 0,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retries": self.retries,
+            "dropped": self.dropped,
+            "rate_limited_seconds": round(self.rate_limited_seconds, 1),
+        }
+
+
+class FileChannel(NotificationChannel):
+    """Appends each batch as a JSON line; a local stand-in for real gateways"""
+
+    name = "file"
+
+    def __init__(self, path: str, **kwargs):
+        super().__init__(**kwargs)
+        self.path = path
+
+    async def send(self, batch: List[Notification]):
+        line = json.dumps({"sent_at": datetime.utcnow().isoformat(), "alerts": [asdict(n) for n in batch]})
+        await asyncio.to_thread(self._append, line)
+
+    def _append(self, line: str):
+        with open(self.path, "a") as f:
+            f.write(line + "\n")
+
+
+class LoopbackChannel(NotificationChannel):
+    """Keeps sent batches in memory for tests and local tooling"""
+
+    name = "loopback"
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches: List[List[Notification]] = []
+
+    async def send(self, batch: List[Notification]):
+        self.batches.append(batch)
+
+
+class WebhookChannel(NotificationChannel):
+    """POSTs each batch as JSON to an SMS or push gateway"""
+
+    name = "webhook"
+
+    def __init__(self, url: str, timeout: float = 10, **kwargs):
+        super().__init__(**kwargs)
+        self.url = url
+        self.timeout = timeout
+
+    async def send(self, batch: List[Notification]):
+        body = json.dumps({"alerts": [asdict(n) for n in batch]}).encode()
+        await asyncio.to_thread(self._post, body)
+
+    def _post(self, body: bytes):
+        import urllib.request  # Pulls in http.client, email and ssl; only webhooks need it
+        request = urllib.request.Request(
+            self.url, data=body, headers={"Content-Type": "application/json"}, method="POST"
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+
+class NotificationDispatcher:
+    """Fans new alerts out to channels without ever blocking the caller
+
+    Alerts are captured when their session commits and handed to each
+    accepting channel's bounded queue. One sender task per channel
+    coalesces bursts into a single batch, waits for its rate limit and
+    retries failed sends with exponential backoff, so a slow gateway only
+    delays its own channel. Stopping lets each channel send what it has
+    queued before its task ends.
+    """
+
+    def __init__(self, channels: List[NotificationChannel]):
+        self.channels = channels
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        if self.running or not self.channels:
+            return
+        self._loop = asyncio.get_running_loop()
+        for channel in self.channels:
+            channel.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+            self._tasks.append(asyncio.create_task(
+                self._run_channel(channel), name=f"{channel.name}:{channel.gate}"
+            ))
+
+    async def stop(self, timeout: float = STOP_TIMEOUT_SECONDS):
+        """Send what is queued, then stop (channels still busy after `timeout` are cancelled)"""
+        if not self.running:
+            return
+        tasks, self._tasks = self._tasks, []  # notify() ignores alerts from here on
+        await asyncio.sleep(0)  # Alerts it handed over before that are queued first
+        # The stop marker queues behind waiting notifications
+        markers = [asyncio.create_task(channel.queue.put(None)) for channel in self.channels]
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            print(f"Notification channel {task.get_name()} did not finish in time; cancelled")
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+        for marker in markers:
+            marker.cancel()
+        for channel in self.channels:
+            # Whatever was still queued is not going out
+            while not channel.queue.empty():
+                if channel.queue.get_nowait() is not None:
+                    channel.dropped += 1
+
+    def notify(self, notifications: List[Notification]):
+        """Queue notifications for committed alerts; safe to call from any thread"""
+        if not self.running:
+            return
+        self._loop.call_soon_threadsafe(self._enqueue, notifications)
+
+    def _enqueue(self, notifications: List[Notification]):
+        for channel in self.channels:
+            for notification in notifications:
+                if not channel.accepts(notification):
+                    continue
+                try:
+                    channel.queue.put_nowait(notification)
+                except asyncio.QueueFull:
+                    channel.dropped += 1
+
+    async def _run_channel(self, channel: NotificationChannel):
+        batch: List[Notification] = []
+        stopping = False
+        try:
+            while not stopping:
+                first = await channel.queue.get()
+                if first is None:
+                    return
+                batch = [first]
+
+                # Coalesce the burst this alert belongs to
+                await asyncio.sleep(COALESCE_SECONDS)
+                stopping = self._take_queued(channel, batch)
+
+                wait = channel.bucket.wait_time()
+                while wait > 0:
+                    channel.rate_limited_seconds += wait
+                    await asyncio.sleep(wait)
+                    # Alerts that arrived while throttled join this batch
+                    stopping = self._take_queued(channel, batch) or stopping
+                    wait = channel.bucket.wait_time()
+
+                await self._send_with_retry(channel, batch)
+                batch = []
+        except asyncio.CancelledError:
+            channel.dropped += len(batch)  # Cancelled by stop() before these went out
+            raise
+
+    @staticmethod
+    def _take_queued(channel: NotificationChannel, batch: List[Notification]) -> bool:
+        """Move queued notifications into `batch`; True once the stop marker is reached"""
+        while not channel.queue.empty():
+            notification = channel.queue.get_nowait()
+            if notification is None:
+                return True
+            batch.append(notification)
+        return False
+
+    async def _send_with_retry(self, channel: NotificationChannel, batch: List[Notification]):
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                await channel.send(batch)
+                channel.sent += len(batch)
+                return
+            except Exception as e:
+                if attempt == MAX_ATTEMPTS - 1:
+                    print(f"Notification channel {channel.name} failed: {e}")
+                    channel.failed += len(batch)
+                    return
+                channel.retries += 1
+                await asyncio.sleep(min(2 ** attempt, 60) * random.uniform(0.5, 1.5))
+
+    def stats(self) -> Dict:
+        return {f"{channel.name}:{channel.gate}": channel.stats() for channel in self.channels}
+
+
+def _configured_channels() -> List[NotificationChannel]:
+    channels = []
+    if NOTIFY_FILE:
+        channels.append(FileChannel(NOTIFY_FILE, gate="push"))
+    if NOTIFY_PUSH_WEBHOOK:
+        channels.append(WebhookChannel(NOTIFY_PUSH_WEBHOOK, gate="push"))
+    if NOTIFY_SMS_WEBHOOK:
+        # SMS costs money per message: critical only, tighter limit
+        channels.append(WebhookChannel(NOTIFY_SMS_WEBHOOK, gate="sms", rate_per_minute=5, burst=2,
+                                       min_severity="critical"))
+    return channels
+
+
+_dispatcher: Optional[NotificationDispatcher] = None
+
+
+def get_notification_dispatcher() -> NotificationDispatcher:
+    """Return this process's dispatcher (channels come from NOTIFY_* settings)"""
+    global _dispatcher
+    if _dispatcher is None:
+        _dispatcher = NotificationDispatcher(_configured_channels())
+    return _dispatcher
+
+
+# Capture alerts from every code path that creates them and hand them over once committed
+
+@event.listens_for(Alert, "after_insert")
+def _collect_new_alert(mapper, connection, alert):
+    session = object_session(alert)
+    if session is not None and get_notification_dispatcher().running:
+        session.info.setdefault("new_alerts", []).append(Notification.from_alert(alert))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _dispatch_new_alerts(session):
+    notifications = session.info.pop("new_alerts", None)
+    if notifications:
+        get_notification_dispatcher().notify(notifications)
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_new_alerts(session):
+    session.info.pop("new_alerts", None)
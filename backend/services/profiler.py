@@ -0,0 +1,261 @@
+"""
+On-demand sampling profiler
+
+A sampler thread snapshots every thread's Python stack (sys._current_frames)
+at a fixed interval and counts identical stacks. It only exists while a
+profile is being taken; when idle, the hooks on requests and scheduled tasks
+cost one attribute check.
+
+A profile covers either a fixed number of seconds, or the next K requests
+to a route, or the next K runs of a scheduled task (e.g. sensor_tick). In
+the latter two cases samples are only kept while a watched request or run
+is in progress. Everything on the event loop thread is sampled during that
+time, so concurrent requests show up too; profile when it is quiet, or
+profile several requests and look at the widest stacks.
+
+Output is collapsed stacks ("thread;outer;...;inner count", for
+flamegraph.pl, speedscope or inferno) or a speedscope JSON file. Optionally
+tracemalloc's top allocation sites over the same window are returned.
+"""
+
+import asyncio
+import contextlib
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+MIN_INTERVAL_MS = 1.0
+TRACEMALLOC_FRAMES = 10
+
+# Leaf frames of threads that are only waiting for work
+IDLE_LEAVES = {
+    ("selectors.py", "select"),  # Event loop with nothing to do
+    ("threading.py", "wait"),
+    ("thread.py", "_worker"),  # Thread pool worker waiting for a job
+    ("queue.py", "get"),
+}
+
+_NOT_WATCHED = contextlib.nullcontext()
+
+
+class ProfilerBusy(Exception):
+    """Another profile is already running in this process"""
+
+
+def _frame_name(code) -> str:
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileSession:
+    """One profiling window: what to watch, the samples taken, when it is done"""
+
+    def __init__(self, interval: float, route: Optional[str] = None, task: Optional[str] = None,
+                 count: int = 0):
+        self.interval = interval
+        self.route = route
+        self.task = task
+        self.count = count  # Requests or task runs to cover; 0 for a timed profile
+        self.gated = bool(route or task)
+
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started = 0  # Watched windows entered
+        self.finished = 0
+        self.active = 0  # Watched windows in progress
+        self.done = asyncio.Event()
+        self.started_at = time.monotonic()
+        self.stopped_at: Optional[float] = None
+
+    def watches(self, kind: str, name: str) -> bool:
+        target = self.route if kind == "route" else self.task
+        return target == name and self.started < self.count
+
+    @contextlib.asynccontextmanager
+    async def window(self):
+        self.started += 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.finished += 1
+            if self.finished >= self.count:
+                self.done.set()
+
+    def sample(self, own_thread: int, names: Dict[int, str]):
+        if self.gated and not self.active:
+            return
+        self.samples += 1
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_thread:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in IDLE_LEAVES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, f"thread-{thread_id}"))
+            self.stacks[tuple(reversed(stack))] += 1
+
+
+class SamplingProfiler:
+    """Runs at most one ProfileSession at a time in this process"""
+
+    def __init__(self):
+        self.session: Optional[ProfileSession] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        # Metrics
+        self.profiles = 0
+        self.last_samples = 0
+
+    @property
+    def running(self) -> bool:
+        return self.session is not None
+
+    def watch(self, kind: str, name: str):
+        """Async context around one request ("route", path template) or task run ("task", name)"""
+        session = self.session
+        if session is None or not session.watches(kind, name):
+            return _NOT_WATCHED
+        return session.window()
+
+    async def profile(self, seconds: Optional[float] = None, route: Optional[str] = None,
+                      task: Optional[str] = None, count: int = 1, interval_ms: float = 5.0,
+                      timeout: float = 120.0, allocations_top: int = 0, fmt: str = "collapsed") -> Dict:
+        """Profile for `seconds`, or around the next `count` requests to `route` / runs of `task`"""
+        if self.session is not None:
+            raise ProfilerBusy("A profile is already running in this process")
+        if sum(x is not None for x in (seconds, route, task)) != 1:
+            raise ValueError("Give exactly one of seconds, route or task")
+
+        session = ProfileSession(max(interval_ms, MIN_INTERVAL_MS) / 1000, route, task,
+                                 count if seconds is None else 0)
+        import tracemalloc  # Only profiles load it
+        started_tracing = allocations_top > 0 and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start(TRACEMALLOC_FRAMES)
+        self.session = session
+        self._start_sampler(session)
+        try:
+            try:
+                await asyncio.wait_for(session.done.wait(), seconds if seconds is not None else timeout)
+            except asyncio.TimeoutError:
+                pass  # A timed profile always ends here; a watched one returns what it has
+            allocations = self._top_allocations(allocations_top) if allocations_top > 0 else None
+        finally:
+            self.session = None
+            self._stop.set()
+            await asyncio.to_thread(self._thread.join)
+            session.stopped_at = time.monotonic()
+            if started_tracing:
+                tracemalloc.stop()
+
+        self.profiles += 1
+        self.last_samples = session.samples
+        result = {
+            "format": fmt,
+            "samples": session.samples,
+            "interval_ms": session.interval * 1000,
+            "duration_s": round(session.stopped_at - session.started_at, 3),
+            "watched": session.finished if session.gated else None,
+            "profile": to_speedscope(session) if fmt == "speedscope" else to_collapsed(session),
+        }
+        if allocations is not None:
+            result["allocations"] = allocations
+        return result
+
+    def stats(self) -> Dict:
+        return {"running": self.running, "profiles": self.profiles, "last_samples": self.last_samples}
+
+    def _start_sampler(self, session: ProfileSession):
+        self._stop = threading.Event()
+
+        def run():
+            own_thread = threading.get_ident()
+            while not self._stop.wait(session.interval):
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                session.sample(own_thread, names)
+
+        self._thread = threading.Thread(target=run, name="profiler", daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _top_allocations(limit: int) -> List[Dict]:
+        """Largest live allocation sites traced during the window"""
+        import tracemalloc
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ))
+        return [
+            {
+                "file": stat.traceback[0].filename,
+                "line": stat.traceback[0].lineno,
+                "size_kib": round(stat.size / 1024, 1),
+                "count": stat.count,
+            }
+            for stat in snapshot.statistics("lineno")[:limit]
+        ]
+
+
+def to_collapsed(session: ProfileSession) -> str:
+    """Brendan Gregg's folded format: one "frame;frame;... count" line per stack"""
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in session.stacks.most_common())
+
+
+def to_speedscope(session: ProfileSession) -> Dict:
+    """speedscope's file format: one sampled profile per thread"""
+    frames: List[Dict] = []
+    frame_index: Dict[str, int] = {}
+    profiles: Dict[str, Tuple[List, List]] = {}
+    for stack, count in session.stacks.most_common():
+        thread, calls = stack[0], stack[1:]
+        indexes = []
+        for name in calls:
+            if name not in frame_index:
+                frame_index[name] = len(frames)
+                function, _, location = name.rpartition(" (")
+                file, _, line = location.rstrip(")").rpartition(":")
+                frames.append({"name": function, "file": file, "line": int(line)})
+            indexes.append(frame_index[name])
+        samples, weights = profiles.setdefault(thread, ([], []))
+        samples.append(indexes)
+        weights.append(count * session.interval)
+
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "exporter": "rootguard-profiler",
+        "name": session.route or session.task or "profile",
+        "activeProfileIndex": 0,
+        "shared": {"frames": frames},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": thread,
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }
+            for thread, (samples, weights) in profiles.items()
+        ],
+    }
+
+
+_profiler: Optional[SamplingProfiler] = None
+
+
+def get_profiler() -> SamplingProfiler:
+    """Return this process's profiler (idle until a profile is requested)"""
+    global _profiler
+    if _profiler is None:
+        _profiler = SamplingProfiler()
+    return _profiler
@@ -0,0 +1,302 @@
+"""
+Rate limiting and load shedding for the HTTP API
+
+Each route class (ingest, control, analytics) has a token bucket per client
+address and one shared by all clients, so neither one noisy client nor many
+together can flood the control queue or the ingest buffer, which share the
+single SQLite writer with the sensor tick. A rejected request gets
+RateLimited (429) with the seconds until a token is available.
+
+Part of every control bucket (RATE_LIMIT_CONTROL_RESERVED) is kept for
+commands that stop the pump: ordinary commands are refused while only the
+reserve is left, a stop may use it, so a flood of mode changes can never
+lock out switching irrigation off.
+
+Expensive analytics also go through a ConcurrencyLimiter: a few run at
+once, the rest wait in FIFO order, and a request that would wait longer
+than the latency budget is refused up front with Overloaded (503) instead
+of piling up behind the others.
+"""
+
+import asyncio
+import contextlib
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Deque, Dict, Optional, Tuple
+
+
+def _limit(name: str, default: str) -> Tuple[float, int]:
+    """"per_minute:burst" from RATE_LIMIT_<NAME>; 0 per minute turns the limit off"""
+    rate, _, burst = os.getenv(f"RATE_LIMIT_{name}", default).partition(":")
+    return float(rate), int(burst or 1)
+
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"  # 0: off (e.g. load tests from one address)
+RATE_LIMIT_MAX_CLIENTS = int(os.getenv("RATE_LIMIT_MAX_CLIENTS", "10000"))  # Least recently seen are forgotten
+# Behind a reverse proxy, name the header carrying the client address (e.g. X-Forwarded-For)
+RATE_LIMIT_CLIENT_HEADER = os.getenv("RATE_LIMIT_CLIENT_HEADER", "")
+
+CLIENT_LIMITS = {
+    "ingest": _limit("INGEST", "600:200"),
+    "control": _limit("CONTROL", "30:10"),
+    "analytics": _limit("ANALYTICS", "60:20"),
+}
+CLASS_LIMITS = {  # All clients together
+    "ingest": _limit("INGEST_TOTAL", "3000:500"),
+    "control": _limit("CONTROL_TOTAL", "120:40"),
+    "analytics": _limit("ANALYTICS_TOTAL", "300:60"),
+}
+RESERVED = {  # Share of each bucket only requests marked reserved may use
+    "control": float(os.getenv("RATE_LIMIT_CONTROL_RESERVED", "0.25")),
+}
+
+ANALYTICS_MAX_CONCURRENT = int(os.getenv("ANALYTICS_MAX_CONCURRENT", "4"))
+ANALYTICS_MAX_QUEUE = int(os.getenv("ANALYTICS_MAX_QUEUE", "32"))
+ANALYTICS_QUEUE_BUDGET_SECONDS = float(os.getenv("ANALYTICS_QUEUE_BUDGET_SECONDS", "2"))
+
+
+class RateLimited(Exception):
+    """A client or route class is over its rate limit"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class Overloaded(Exception):
+    """Too much work is already waiting; try again later"""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def retry_after_header(seconds: float) -> Dict[str, str]:
+    return {"Retry-After": str(max(1, math.ceil(seconds)))}
+
+
+class TokenBucket:
+    """Allows `rate_per_minute` sends on average with bursts up to `burst`"""
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60
+        self.capacity = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def wait_time(self, reserve: float = 0.0) -> float:
+        """Take a token if available; otherwise return seconds until one is
+
+        With `reserve`, that many tokens must be left over after taking one.
+        """
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1 + reserve:
+            self.tokens -= 1
+            return 0.0
+        return (1 + reserve - self.tokens) / self.rate
+
+    def refund(self):
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+
+class _ClassStats:
+    __slots__ = ("allowed", "limited_client", "limited_total", "reserved")
+
+    def __init__(self):
+        self.allowed = 0
+        self.limited_client = 0
+        self.limited_total = 0
+        self.reserved = 0  # Allowed requests that were marked reserved
+
+
+class RateLimiter:
+    """Token buckets per (route class, client) and per route class"""
+
+    def __init__(self, client_limits: Dict[str, Tuple[float, int]] = CLIENT_LIMITS,
+                 class_limits: Dict[str, Tuple[float, int]] = CLASS_LIMITS,
+                 reserved: Dict[str, float] = RESERVED, max_clients: int = RATE_LIMIT_MAX_CLIENTS,
+                 enabled: bool = RATE_LIMIT_ENABLED):
+        self.client_limits = client_limits
+        self.reserved = reserved
+        self.max_clients = max_clients
+        self.enabled = enabled
+        self._clients: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+        self._classes = {
+            route_class: TokenBucket(rate, burst)
+            for route_class, (rate, burst) in class_limits.items() if rate > 0
+        }
+        self._stats = {route_class: _ClassStats() for route_class in set(client_limits) | set(class_limits)}
+
+    def check(self, route_class: str, client: str, reserved: bool = False):
+        """Take a token for one request, or raise RateLimited
+
+        `reserved` requests (pump stops) may use the share of the buckets
+        others are kept out of.
+        """
+        if not self.enabled:
+            return
+        stats = self._stats[route_class]
+        share = 0.0 if reserved else self.reserved.get(route_class, 0.0)
+        client_bucket = self._client_bucket(route_class, client)
+        if client_bucket is not None:
+            wait = client_bucket.wait_time(self._reserve(client_bucket, share))
+            if wait:
+                stats.limited_client += 1
+                raise RateLimited(f"Too many {route_class} requests from {client}", wait)
+        class_bucket = self._classes.get(route_class)
+        if class_bucket is not None:
+            wait = class_bucket.wait_time(self._reserve(class_bucket, share))
+            if wait:
+                if client_bucket is not None:
+                    client_bucket.refund()
+                stats.limited_total += 1
+                raise RateLimited(f"Too many {route_class} requests", wait)
+        stats.allowed += 1
+        if reserved:
+            stats.reserved += 1
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "clients": len(self._clients),
+            "classes": {
+                route_class: {
+                    "allowed": stats.allowed,
+                    "limited_client": stats.limited_client,
+                    "limited_total": stats.limited_total,
+                    "reserved": stats.reserved,
+                    "tokens": round(self._classes[route_class].tokens, 1) if route_class in self._classes else None,
+                }
+                for route_class, stats in self._stats.items()
+            },
+        }
+
+    @staticmethod
+    def _reserve(bucket: TokenBucket, share: float) -> float:
+        # At least one token stays usable by everyone, however small the burst
+        return min(bucket.capacity * share, bucket.capacity - 1)
+
+    def _client_bucket(self, route_class: str, client: str) -> Optional[TokenBucket]:
+        rate, burst = self.client_limits.get(route_class, (0, 0))
+        if rate <= 0:
+            return None
+        key = (route_class, client)
+        bucket = self._clients.get(key)
+        if bucket is None:
+            bucket = self._clients[key] = TokenBucket(rate, burst)
+            if len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+        else:
+            self._clients.move_to_end(key)
+        return bucket
+
+
+class ConcurrencyLimiter:
+    """At most `limit` at once; sheds callers that would queue past `budget` seconds"""
+
+    def __init__(self, name: str, limit: int, max_queue: int, budget: float):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.budget = budget
+        self._active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._avg_seconds = 0.0  # Moving average time in a slot
+
+        # Metrics
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+        self.max_wait_ms = 0.0
+
+    def estimated_wait(self) -> float:
+        """Seconds a caller arriving now would wait for a slot"""
+        return (len(self._waiters) + 1) * self._avg_seconds / self.limit
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        if self._active < self.limit and not self._waiters:
+            self._active += 1
+        else:
+            await self._wait()
+        self.admitted += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            self._avg_seconds = elapsed if not self._avg_seconds else 0.8 * self._avg_seconds + 0.2 * elapsed
+            self._release()
+
+    def stats(self) -> Dict:
+        return {
+            "limit": self.limit,
+            "active": self._active,
+            "waiting": len(self._waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "avg_ms": round(self._avg_seconds * 1000, 2),
+            "max_wait_ms": round(self.max_wait_ms, 2),
+        }
+
+    async def _wait(self):
+        estimate = self.estimated_wait()
+        if len(self._waiters) >= self.max_queue or estimate > self.budget:
+            self.shed += 1
+            raise Overloaded(f"{self.name} is busy ({len(self._waiters)} waiting)", estimate or self.budget)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        self.queued += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self.budget)
+        except BaseException as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up: pass it on
+                self._release()
+            else:
+                waiter.cancel()
+                with contextlib.suppress(ValueError):
+                    self._waiters.remove(waiter)
+            if isinstance(e, asyncio.TimeoutError):
+                self.shed += 1
+                raise Overloaded(f"{self.name} is busy (waited {self.budget:g}s)", self.estimated_wait() or self.budget)
+            raise
+        finally:
+            self.max_wait_ms = max(self.max_wait_ms, (time.perf_counter() - started) * 1000)
+
+    def _release(self):
+        # Hand the slot straight to the next waiter, so late arrivals cannot overtake
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self._active -= 1
+
+
+_rate_limiter: Optional[RateLimiter] = None
+_analytics_limiter: Optional[ConcurrencyLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Return this process's rate limiter"""
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = RateLimiter()
+    return _rate_limiter
+
+
+def get_analytics_limiter() -> ConcurrencyLimiter:
+    """Return this process's concurrency limiter for analytics requests"""
+    global _analytics_limiter
+    if _analytics_limiter is None:
+        _analytics_limiter = ConcurrencyLimiter("Analytics", ANALYTICS_MAX_CONCURRENT,
+                                                ANALYTICS_MAX_QUEUE, ANALYTICS_QUEUE_BUDGET_SECONDS)
+    return _analytics_limiter
@@ -0,0 +1,128 @@
+"""
+Committed readings, in commit order, for the event bus
+
+Readings reach the database from the sensor tick and from every API
+process's ingest buffer (JSON, binary frames, UDP). The worker leader
+follows them by change_seq, one indexed range query per poll, and publishes
+each as ReadingStored. Auto-irrigation, alerts and anomaly detection
+therefore see device uploads as well as the tick's readings, whichever
+process stored them. Commits take the change counter's lock (see
+ChangeSequence), so change_seq order is commit order and nothing is
+skipped.
+
+A reading is published with latest=False when a newer one of its device
+was already published or comes in the same poll (a late reading, or a
+backlog catching up). Anomaly detection takes every reading. Decisions
+about the current state only act on the latest.
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import func, or_, text
+from models.database import SessionLocal
+from models.sensor import SensorReading
+from services.event_bus import EventBus, ReadingStored, get_event_bus
+
+FEED_BATCH = 500  # Readings per query
+
+
+class ReadingFeed:
+    """Publishes every reading committed after start() exactly once, in commit order"""
+
+    def __init__(self, bus: Optional[EventBus] = None, session_factory=SessionLocal, batch: int = FEED_BATCH):
+        self.bus = bus
+        self.session_factory = session_factory
+        self.batch = batch
+        self.last_seq: Optional[int] = None
+        self._newest: Dict[str, Optional[datetime]] = {}  # Per device, among published readings
+        self._lock = asyncio.Lock()  # The tick and the scheduled poll may overlap
+
+        # Metrics
+        self.published = 0
+        self.superseded = 0  # Published with latest=False
+        self.polls = 0
+
+    @property
+    def started(self) -> bool:
+        return self.last_seq is not None
+
+    def start(self):
+        """Begin after everything committed so far (history is not replayed)"""
+        db = self.session_factory()
+        try:
+            self.last_seq = db.execute(text("SELECT value FROM change_sequence WHERE id = 1")).scalar() or 0
+        finally:
+            db.close()
+        self._newest = {}
+
+    async def poll(self) -> int:
+        """Publish readings committed since the last poll; returns how many"""
+        async with self._lock:
+            if not self.started:
+                self.start()
+            bus = self.bus or get_event_bus()
+            self.polls += 1
+            published = 0
+            while True:
+                readings = self._next_batch()
+                for reading, latest in readings:
+                    await bus.publish(ReadingStored(reading, latest=latest))
+                    self.last_seq = reading.change_seq
+                    published += 1
+                    self.published += 1
+                if len(readings) < self.batch:
+                    return published
+
+    def stats(self) -> Dict:
+        return {
+            "last_seq": self.last_seq,
+            "published": self.published,
+            "superseded": self.superseded,
+            "polls": self.polls,
+        }
+
+    def _next_batch(self) -> List:
+        db = self.session_factory()
+        try:
+            readings = db.query(SensorReading).filter(
+                SensorReading.change_seq > self.last_seq
+            ).order_by(SensorReading.change_seq).limit(self.batch).all()
+            for device_id in {r.device_id for r in readings} - set(self._newest):
+                self._newest[device_id] = db.query(func.max(SensorReading.timestamp)).filter(
+                    SensorReading.device_id == device_id,
+                    # Bulk-seeded rows carry no change_seq
+                    or_(SensorReading.change_seq <= self.last_seq, SensorReading.change_seq.is_(None))
+                ).scalar()
+        finally:
+            db.close()
+
+        # The last of each device's newest readings in this batch
+        last_index: Dict[str, int] = {}
+        for index, reading in enumerate(readings):
+            current = last_index.get(reading.device_id)
+            if current is None or reading.timestamp >= readings[current].timestamp:
+                last_index[reading.device_id] = index
+
+        batch = []
+        for index, reading in enumerate(readings):
+            newest = self._newest[reading.device_id]
+            latest = last_index[reading.device_id] == index and (newest is None or reading.timestamp >= newest)
+            if latest:
+                self._newest[reading.device_id] = reading.timestamp
+            else:
+                self.superseded += 1
+            batch.append((reading, latest))
+        return batch
+
+
+_reading_feed: Optional[ReadingFeed] = None
+
+
+def get_reading_feed() -> ReadingFeed:
+    """Return this process's reading feed (polled by the worker leader)"""
+    global _reading_feed
+    if _reading_feed is None:
+        _reading_feed = ReadingFeed()
+    return _reading_feed
@@ -0,0 +1,262 @@
+import os
+from array import array
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import text
+from models.database import SessionLocal
+from models.sensor import SensorReading
+from models.types import from_epoch_ms, to_epoch_ms
+
+RECENT_WINDOW_HOURS = float(os.getenv("RECENT_WINDOW_HOURS", "48"))
+RECENT_READINGS_PER_DEVICE = int(os.getenv("RECENT_READINGS_PER_DEVICE", "50000"))  # ~2.5 MB per device
+MAX_REORDER = 64  # Late readings moved into place; further back, the ring is rebuilt
+
+METRICS = ("water_level", "flow_rate", "turbidity", "soil_moisture")
+
+
+class DeviceRing:
+    """Fixed-capacity, column-oriented ring of one device's readings in time order
+
+    Columns are preallocated typed arrays that are never resized, so window
+    queries hand out memoryview slices of them without copying. A window is
+    at most two slices (before and after the wrap point).
+    """
+
+    def __init__(self, capacity: int, complete_since: int):
+        self.capacity = capacity
+        self.ids = array("q", bytes(8 * capacity))
+        self.times = array("q", bytes(8 * capacity))  # Milliseconds since the epoch (UTC), as stored
+        self.columns = {name: array("d", bytes(8 * capacity)) for name in METRICS}
+        self.vibration = array("B", bytes(capacity))  # 1 = high
+        self.start = 0  # Physical index of the oldest reading
+        self.size = 0
+        # Every reading of this device at or after this time is in the ring
+        self.complete_since = complete_since
+
+    def _at(self, index: int) -> int:
+        return (self.start + index) % self.capacity
+
+    def append(self, reading_id: int, at: int, values: Tuple[float, ...], vibration: int) -> bool:
+        """Add a reading; False if it is too far out of order to move into place"""
+        if at < self.complete_since:
+            return True  # Older than the range the ring answers for
+        late = 0
+        while late < self.size and self.times[self._at(self.size - 1 - late)] > at:
+            late += 1
+            if late > MAX_REORDER:
+                return False
+
+        if self.size == self.capacity:
+            position = self.start
+            self.start = (self.start + 1) % self.capacity
+        else:
+            position = self._at(self.size)
+            self.size += 1
+        self._write(position, reading_id, at, values, vibration)
+
+        # Shift later readings up by one so time order holds
+        for index in range(self.size - 1, self.size - 1 - late, -1):
+            self._swap(self._at(index), self._at(index - 1))
+        if self.size == self.capacity:
+            self.complete_since = max(self.complete_since, self.times[self.start])
+        return True
+
+    def _write(self, position: int, reading_id: int, at: int, values: Tuple[float, ...], vibration: int):
+        self.ids[position] = reading_id
+        self.times[position] = at
+        for name, value in zip(METRICS, values):
+            self.columns[name][position] = value
+        self.vibration[position] = vibration
+
+    def _swap(self, a: int, b: int):
+        for column in (self.ids, self.times, self.vibration, *self.columns.values()):
+            column[a], column[b] = column[b], column[a]
+
+    def lower_bound(self, at: int) -> int:
+        """Index (0 = oldest) of the first reading at or after `at`"""
+        low, high = 0, self.size
+        while low < high:
+            middle = (low + high) // 2
+            if self.times[self._at(middle)] < at:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def slices(self, column: array, first: int, last: int) -> List[memoryview]:
+        """Zero-copy views of readings first..last-1 of a column"""
+        if first >= last:
+            return []
+        begin, end = self._at(first), self._at(last - 1) + 1
+        view = memoryview(column)
+        if begin < end:
+            return [view[begin:end]]
+        return [view[begin:], view[:end]]
+
+    def row(self, index: int, device_id: str) -> Dict:
+        position = self._at(index)
+        row = {name: self.columns[name][position] for name in METRICS}
+        row["id"] = self.ids[position]
+        row["device_id"] = device_id
+        row["vibration_status"] = "high" if self.vibration[position] else "low"
+        row["timestamp"] = from_epoch_ms(self.times[position])
+        return row
+
+
+class RecentReadings:
+    """Per-device rings of the last RECENT_WINDOW_HOURS of readings
+
+    Warmed from the database at startup and filled by the ingest buffer as
+    it commits. Readings committed by other processes are picked up by
+    change_seq (one indexed lookup, normally empty) before each answer.
+    Queries the rings cannot fully answer return None and the caller falls
+    back to the database.
+    """
+
+    def __init__(self, window_hours: float = RECENT_WINDOW_HOURS, capacity: int = RECENT_READINGS_PER_DEVICE,
+                 session_factory=SessionLocal):
+        self.window = timedelta(hours=window_hours)
+        self.capacity = capacity
+        self.session_factory = session_factory
+        self.rings: Dict[str, DeviceRing] = {}
+        self.ready = False
+        self.stale = False
+        self.complete_since = 0
+        self.last_seq = 0
+        self._unsynced: Dict[int, int] = {}  # id -> change_seq of rows added ahead of last_seq
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.rebuilds = 0
+
+    def warm(self, db=None):
+        """Load the window from the database"""
+        own_session = db is None
+        db = db or self.session_factory()
+        try:
+            last_seq = db.execute(text("SELECT value FROM change_sequence WHERE id = 1")).scalar() or 0
+            since = datetime.utcnow() - self.window
+            rows = db.query(
+                SensorReading.id, SensorReading.device_id, SensorReading.timestamp,
+                *(getattr(SensorReading, name) for name in METRICS),
+                SensorReading.vibration_status, SensorReading.change_seq
+            ).filter(SensorReading.timestamp >= since).order_by(SensorReading.timestamp).all()
+        finally:
+            if own_session:
+                db.close()
+
+        self.complete_since = to_epoch_ms(since)
+        self.rings = {}
+        self.last_seq = last_seq
+        self._unsynced = {}
+        self.stale = False
+        self.ready = True
+        self._add_rows(rows)
+
+    def add(self, rows: List[Dict], ids: List[int], seqs: List[Optional[int]]):
+        """Readings this process just committed"""
+        if not self.ready:
+            return
+        self._add_rows(
+            (reading_id, row["device_id"], row["timestamp"], *(row[name] for name in METRICS),
+             row["vibration_status"], seq)
+            for row, reading_id, seq in zip(rows, ids, seqs)
+            # A query may have caught up with the commit already
+            if seq is None or seq > self.last_seq
+        )
+
+    def latest(self, db, limit: int) -> Optional[List[Dict]]:
+        """Newest `limit` readings across devices, newest first"""
+        if not self._refresh(db):
+            return None
+        candidates = []
+        for device_id, ring in self.rings.items():
+            for index in range(ring.size - 1, max(ring.size - limit, 0) - 1, -1):
+                candidates.append((ring.times[ring._at(index)], device_id, index))
+        candidates.sort(reverse=True)
+        candidates = candidates[:limit]
+
+        # Anything older than the window may still be in the database
+        oldest = candidates[-1][0] if len(candidates) == limit else None
+        if oldest is None or any(ring.complete_since > oldest for ring in self.rings.values()):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return [self.rings[device_id].row(index, device_id) for _, device_id, index in candidates]
+
+    def window_slices(self, db, since: datetime) -> Optional[Dict[str, List[memoryview]]]:
+        """Zero-copy column slices of every reading at or after `since`, across devices"""
+        if not self._refresh(db):
+            return None
+        at = to_epoch_ms(since)
+        if at < self.complete_since or any(ring.complete_since > at for ring in self.rings.values()):
+            self.misses += 1
+            return None
+        self.hits += 1
+        slices: Dict[str, List[memoryview]] = {name: [] for name in (*METRICS, "vibration")}
+        for ring in self.rings.values():
+            first = ring.lower_bound(at)
+            for name in METRICS:
+                slices[name].extend(ring.slices(ring.columns[name], first, ring.size))
+            slices["vibration"].extend(ring.slices(ring.vibration, first, ring.size))
+        return slices
+
+    def stats(self) -> Dict:
+        return {
+            "ready": self.ready,
+            "devices": len(self.rings),
+            "readings": sum(ring.size for ring in self.rings.values()),
+            "capacity_per_device": self.capacity,
+            "complete_since": from_epoch_ms(max(
+                [self.complete_since, *(ring.complete_since for ring in self.rings.values())]
+            )).isoformat() if self.ready else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rebuilds": self.rebuilds,
+        }
+
+    def _refresh(self, db) -> bool:
+        """Catch up with readings other processes committed; False if the rings are not usable"""
+        if not self.ready:
+            self.misses += 1
+            return False
+        if self.stale:
+            self.rebuilds += 1
+            self.warm(db)
+            return True
+
+        rows = db.query(
+            SensorReading.id, SensorReading.device_id, SensorReading.timestamp,
+            *(getattr(SensorReading, name) for name in METRICS),
+            SensorReading.vibration_status, SensorReading.change_seq
+        ).filter(SensorReading.change_seq > self.last_seq).order_by(SensorReading.change_seq).all()
+        if rows:
+            self._add_rows(row for row in rows if row[0] not in self._unsynced)
+            # Sequences commit in order, so nothing at or below the highest seen is still pending
+            self.last_seq = rows[-1][-1]
+            self._unsynced = {i: seq for i, seq in self._unsynced.items() if seq > self.last_seq}
+        return True
+
+    def _add_rows(self, rows: Iterable[Tuple]):
+        for reading_id, device_id, timestamp, *values, vibration_status, seq in rows:
+            ring = self.rings.get(device_id)
+            if ring is None:
+                ring = self.rings[device_id] = DeviceRing(self.capacity, self.complete_since)
+            if not ring.append(reading_id, to_epoch_ms(timestamp), tuple(values), 1 if vibration_status == "high" else 0):
+                # A backfill far into the past: rebuild from the database on the next query
+                self.stale = True
+            if seq is not None and seq > self.last_seq:
+                self._unsynced[reading_id] = seq
+
+
+_recent_readings: Optional[RecentReadings] = None
+
+
+def get_recent_readings() -> RecentReadings:
+    """Return this process's recent-readings rings (empty until warmed)"""
+    global _recent_readings
+    if _recent_readings is None:
+        _recent_readings = RecentReadings()
+    return _recent_readings
@@ -0,0 +1,186 @@
+import asyncio
+import inspect
+import random
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Union
+
+from services.profiler import get_profiler
+from services.tracing import get_tracer
+
+MAX_BACKOFF_SECONDS = 300
+
+
+class PeriodicTask:
+    """One named job run at a fixed rate, with its own timing and failure state"""
+
+    def __init__(self, name: str, func: Callable[[], Union[Awaitable, None]], interval: float,
+                 jitter: float = 0.0, initial_delay: float = 0.0, max_backoff: float = MAX_BACKOFF_SECONDS):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.jitter = jitter
+        self.initial_delay = initial_delay
+        self.max_backoff = max_backoff
+
+        # Metrics
+        self.runs = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.skipped = 0  # Deadlines dropped because a run overran
+        self.last_error: Optional[str] = None
+        self.last_started_at: Optional[float] = None  # time.time()
+        self.last_duration_ms = 0.0
+        self.max_duration_ms = 0.0
+        self.last_lag_ms = 0.0  # How late the last run started
+        self.next_run_at: Optional[float] = None  # time.monotonic()
+        self._total_duration_ms = 0.0
+
+    async def run_once(self):
+        result = self.func()
+        if inspect.isawaitable(result):
+            await result
+
+    def record(self, started: float, error: Optional[BaseException]):
+        duration_ms = (time.monotonic() - started) * 1000
+        self.runs += 1
+        self.last_duration_ms = duration_ms
+        self.max_duration_ms = max(self.max_duration_ms, duration_ms)
+        self._total_duration_ms += duration_ms
+        if error is None:
+            self.consecutive_failures = 0
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+
+    def backoff(self) -> float:
+        """Extra delay after consecutive failures: one interval, doubling, capped"""
+        if not self.consecutive_failures:
+            return 0.0
+        return min(self.interval * 2 ** (self.consecutive_failures - 1), self.max_backoff)
+
+    def stats(self) -> Dict:
+        return {
+            "interval_s": self.interval,
+            "runs": self.runs,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "skipped": self.skipped,
+            "last_error": self.last_error,
+            "last_started_at": self.last_started_at,
+            "last_duration_ms": round(self.last_duration_ms, 2),
+            "avg_duration_ms": round(self._total_duration_ms / self.runs, 2) if self.runs else 0,
+            "max_duration_ms": round(self.max_duration_ms, 2),
+            "last_lag_ms": round(self.last_lag_ms, 2),
+            "next_run_in_s": round(max(self.next_run_at - time.monotonic(), 0), 2) if self.next_run_at else None,
+        }
+
+
+class Scheduler:
+    """Runs periodic tasks on fixed-rate deadlines
+
+    Each task has its own loop, so a slow or failing task never delays the
+    others. Deadlines are start + n * interval, so the time a run takes does
+    not push later runs back; jitter is added per run and never accumulates.
+    A run that overruns one or more deadlines skips them instead of running
+    back to back to catch up. A failing task is retried after an exponential
+    backoff on top of its schedule. stop() lets running jobs finish.
+    """
+
+    def __init__(self):
+        self.tasks: Dict[str, PeriodicTask] = {}
+        self._loops: List[asyncio.Task] = []
+        self._stop: Optional[asyncio.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return any(not loop.done() for loop in self._loops)
+
+    def add(self, name: str, func: Callable[[], Union[Awaitable, None]], interval: float,
+            jitter: float = 0.0, initial_delay: float = 0.0) -> PeriodicTask:
+        """Register `func` (sync or async, no arguments) to run every `interval` seconds"""
+        if name in self.tasks:
+            raise ValueError(f"Task {name} is already scheduled")
+        if interval <= 0:
+            raise ValueError("interval must be positive")
+        task = PeriodicTask(name, func, interval, jitter, initial_delay)
+        self.tasks[name] = task
+        if self._stop is not None and not self._stop.is_set():
+            self._loops.append(asyncio.create_task(self._run(task)))
+        return task
+
+    async def start(self):
+        if self.running:
+            return
+        self._stop = asyncio.Event()
+        self._loops = [asyncio.create_task(self._run(task)) for task in self.tasks.values()]
+
+    async def stop(self, timeout: Optional[float] = None):
+        """Stop scheduling; wait for running jobs (cancelled after `timeout`)"""
+        if self._stop is None:
+            return
+        self._stop.set()
+        if self._loops:
+            _, pending = await asyncio.wait(self._loops, timeout=timeout)
+            for loop in pending:
+                print(f"Scheduled task {loop.get_name()} did not finish in time; cancelled")
+                loop.cancel()
+            if pending:
+                await asyncio.wait(pending)
+        self._loops = []
+
+    def stats(self) -> Dict:
+        return {name: task.stats() for name, task in self.tasks.items()}
+
+    async def _run(self, task: PeriodicTask):
+        asyncio.current_task().set_name(task.name)
+        deadline = time.monotonic() + task.initial_delay
+        while not self._stop.is_set():
+            run_at = deadline + (random.uniform(0, task.jitter) if task.jitter else 0.0)
+            task.next_run_at = run_at
+            if await self._sleep_until(run_at):
+                break
+
+            started = time.monotonic()
+            task.last_lag_ms = (started - run_at) * 1000
+            task.last_started_at = time.time()
+            error = None
+            try:
+                with get_tracer().trace(f"task {task.name}", attributes={"rootguard.task": task.name}):
+                    async with get_profiler().watch("task", task.name):
+                        await task.run_once()
+            except Exception as e:
+                error = e
+                print(f"Scheduled task {task.name} failed: {e}")
+            task.record(started, error)
+
+            # Next fixed-rate deadline, skipping any this run overran
+            deadline += task.interval
+            now = time.monotonic()
+            if now > deadline:
+                missed = int((now - deadline) // task.interval) + 1
+                task.skipped += missed
+                deadline += missed * task.interval
+            # A failing task waits out its backoff before the next deadline
+            while deadline < now + task.backoff():
+                deadline += task.interval
+        task.next_run_at = None
+
+    async def _sleep_until(self, when: float) -> bool:
+        """Sleep until the monotonic time `when`; return True if stopped first"""
+        try:
+            await asyncio.wait_for(self._stop.wait(), max(when - time.monotonic(), 0))
+            return True
+        except asyncio.TimeoutError:
+            return self._stop.is_set()
+
+
+_scheduler: Optional[Scheduler] = None
+
+
+def get_scheduler() -> Scheduler:
+    """Return this process's scheduler"""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler()
+    return _scheduler
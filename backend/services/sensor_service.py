@@ -1,14 +1,20 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import desc, and_
 from models.database import SessionLocal
-from models.sensor import SensorReading, SensorData, Alert
-from schemas.sensor_schemas import SensorDataResponse, HealthScoreResponse, AlertResponse, AlertCreate
-from datetime import datetime, timedelta
+from models.sensor import SensorReading, SensorData, Alert, DEFAULT_DEVICE_ID
+from schemas.sensor_schemas import SensorDataResponse, HealthScoreResponse, AlertCreate, SensorReadingIngest
+from services.alert_service import AlertService
+from services.ingest_buffer import get_ingest_buffer
+from services.binary_ingest import decode_frames
+from services.recent_readings import get_recent_readings
+from services.settings_service import get_rules
+from services.tracing import get_tracer, traced_methods
+from datetime import datetime, timedelta, timezone
 import random
 import math
-import json
-from typing import Optional, List
+from typing import Dict, Optional, List
 
+@traced_methods
 class SensorService:
     def __init__(self, db: Session):
         self.db = db
@@ -17,7 +23,9 @@ class SensorService:
         """Generate realistic sensor data with variations"""
         
         # Get last reading for smooth transitions
-        last_reading = self.db.query(SensorReading).order_by(desc(SensorReading.timestamp)).first()
+        last_reading = self.db.query(SensorReading).filter(
+            SensorReading.device_id == DEFAULT_DEVICE_ID
+        ).order_by(desc(SensorReading.timestamp)).first()
         
         if last_reading:
             # Create realistic variations based on previous reading
@@ -36,24 +44,70 @@ class SensorService:
         vibration_status = "high" if random.random() < 0.05 else "low"
         
         # Create new reading
-        new_reading = SensorReading(
-            water_level=round(water_level, 1),
-            flow_rate=round(flow_rate, 1),
-            turbidity=round(turbidity, 1),
-            vibration_status=vibration_status,
-            soil_moisture=round(soil_moisture, 1),
-            timestamp=datetime.utcnow()
-        )
-        
-        self.db.add(new_reading)
-        self.db.commit()
-        self.db.refresh(new_reading)
+        row = {
+            "device_id": DEFAULT_DEVICE_ID,
+            "water_level": round(water_level, 1),
+            "flow_rate": round(flow_rate, 1),
+            "turbidity": round(turbidity, 1),
+            "vibration_status": vibration_status,
+            "soil_moisture": round(soil_moisture, 1),
+            "timestamp": datetime.utcnow()
+        }
+        
+        # Group-committed with other buffered readings
+        with get_tracer().span("ingest_buffer.submit"):
+            reading_id = await get_ingest_buffer().submit(row)
+        new_reading = SensorReading(id=reading_id, **row)
         
         # Update health score
-        await self._update_health_score(new_reading)
+        with get_tracer().span("tick.health_score"):
+            await self._update_health_score(new_reading)
         
         return new_reading
     
+    async def ingest_readings(self, readings: List[SensorReadingIngest]) -> int:
+        """Queue readings reported by field devices for the next group commit"""
+        now = datetime.utcnow()
+        rows = [
+            {
+                "device_id": r.device_id or DEFAULT_DEVICE_ID,
+                "water_level": round(r.water_level, 1),
+                "flow_rate": round(r.flow_rate, 1),
+                "turbidity": round(r.turbidity, 1),
+                "vibration_status": r.vibration_status,
+                "soil_moisture": round(r.soil_moisture, 1),
+                "timestamp": self._to_naive_utc(r.timestamp) if r.timestamp else now,
+                "device_seq": r.device_seq
+            }
+            for r in readings
+        ]
+        get_ingest_buffer().submit_many(rows)
+        return len(rows)
+    
+    async def ingest_binary(self, payload: bytes) -> int:
+        """Queue readings sent as binary frames (see services.binary_ingest)"""
+        rows = decode_frames(payload)
+        get_ingest_buffer().submit_many(rows)
+        return len(rows)
+    
+    @staticmethod
+    def _response(row: Dict) -> SensorDataResponse:
+        return SensorDataResponse(
+            water_level=row["water_level"],
+            flow_rate=row["flow_rate"],
+            turbidity=row["turbidity"],
+            vibration_status=row["vibration_status"],
+            soil_moisture=row["soil_moisture"],
+            timestamp=row["timestamp"]
+        )
+    
+    @staticmethod
+    def _to_naive_utc(value: datetime) -> datetime:
+        """Timestamps are stored as naive UTC like datetime.utcnow()"""
+        if value.tzinfo is None:
+            return value
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    
     def _vary_value(self, current: float, max_change: float, min_val: float, max_val: float) -> float:
         """Create realistic value variations"""
         change = random.uniform(-max_change, max_change)
@@ -103,6 +157,9 @@ class SensorService:
     
     async def get_latest_reading(self) -> Optional[SensorDataResponse]:
         """Get the most recent sensor reading"""
+        recent = get_recent_readings().latest(self.db, 1)
+        if recent:
+            return self._response(recent[0])
         reading = self.db.query(SensorReading).order_by(desc(SensorReading.timestamp)).first()
         if reading:
             return SensorDataResponse(
@@ -117,6 +174,10 @@ class SensorService:
     
     async def get_reading_history(self, limit: int = 100) -> List[SensorDataResponse]:
         """Get historical sensor readings"""
+        # Served from the in-memory rings when they cover the request
+        recent = get_recent_readings().latest(self.db, limit)
+        if recent is not None:
+            return [self._response(row) for row in recent]
         readings = self.db.query(SensorReading).order_by(desc(SensorReading.timestamp)).limit(limit).all()
         return [
             SensorDataResponse(
@@ -144,87 +205,39 @@ class SensorService:
         """Check sensor reading and create alerts if needed"""
         alerts_to_create = []
         
-        # Critical water level
-        if reading.water_level < 20:
-            alerts_to_create.append(AlertCreate(
-                alert_type="critical",
-                message=json.dumps({"key": "alert_critical_water", "params": {"level": reading.water_level}}),
-                sensor_reading_id=reading.id
-            ))
-        elif reading.water_level < 35:
+        # Thresholds come from the cached rule table compiled from settings
+        fired = list(get_rules().matching_alerts(reading))
+        # Earlier alerts for rules this reading no longer triggers are resolved
+        AlertService(self.db).resolve_cleared(rule.key for rule, _ in fired)
+        for rule, value in fired:
+            params = {rule.param: value} if rule.param else {}
             alerts_to_create.append(AlertCreate(
-                alert_type="warning",
-                message=json.dumps({"key": "alert_low_water", "params": {"level": reading.water_level}}),
-                sensor_reading_id=reading.id
-            ))
-        
-        # Turbidity issues
-        if reading.turbidity < 50:
-            alerts_to_create.append(AlertCreate(
-                alert_type="warning",
-                message=json.dumps({"key": "alert_poor_water", "params": {"turbidity": reading.turbidity}}),
-                sensor_reading_id=reading.id
-            ))
-        
-        # High vibration
-        if reading.vibration_status == "high":
-            alerts_to_create.append(AlertCreate(
-                alert_type="critical",
-                message=json.dumps({"key": "alert_high_vibration", "params": {}}),
-                sensor_reading_id=reading.id
-            ))
-        
-        # Low soil moisture
-        if reading.soil_moisture < 25:
-            alerts_to_create.append(AlertCreate(
-                alert_type="info",
-                message=json.dumps({"key": "alert_low_moisture", "params": {"moisture": reading.soil_moisture}}),
+                alert_type=rule.alert_type,
+                alert_key=rule.key,
+                params=params,
                 sensor_reading_id=reading.id
             ))
         
         # Create alerts
         for alert_data in alerts_to_create:
-            # Check if similar alert exists in last 10 minutes
-            recent_similar = self.db.query(Alert).filter(
+            # Check if similar alert exists in last 10 minutes (params compare as canonical JSON)
+            recent_similar = self.db.query(Alert.id).filter(
                 and_(
-                    Alert.message == alert_data.message,
+                    Alert.alert_key == alert_data.alert_key,
                     Alert.created_at > datetime.utcnow() - timedelta(minutes=10),
-                    Alert.is_dismissed == False
+                    Alert.params == alert_data.params,
+                    Alert.is_dismissed == False,
+                    Alert.resolved_at.is_(None)
                 )
             ).first()
             
             if not recent_similar:
                 new_alert = Alert(
                     alert_type=alert_data.alert_type,
-                    message=alert_data.message,
+                    alert_key=alert_data.alert_key,
+                    params=alert_data.params,
                     sensor_reading_id=alert_data.sensor_reading_id
                 )
                 self.db.add(new_alert)
         
         self.db.commit()
-    
-    async def get_active_alerts(self, limit: int = 10) -> List[AlertResponse]:
-        """Get active (non-dismissed) alerts"""
-        alerts = self.db.query(Alert).filter(
-            Alert.is_dismissed == False
-        ).order_by(desc(Alert.created_at)).limit(limit).all()
-        
-        return [
-            AlertResponse(
-                id=alert.id,
-                alert_type=alert.alert_type,
-                message=alert.message,
-                created_at=alert.created_at,
-                is_dismissed=alert.is_dismissed
-            ) for alert in alerts
-        ]
-    
-    async def dismiss_alert(self, alert_id: int) -> bool:
-        """Dismiss a specific alert"""
-        alert = self.db.query(Alert).filter(Alert.id == alert_id).first()
-        if alert:
-            alert.is_dismissed = True
-            alert.dismissed_at = datetime.utcnow()
-            self.db.commit()
-            return True
-        return False
\ No newline at end of file
@@ -0,0 +1,201 @@
+from sqlalchemy.orm import Session
+from models.sensor import Settings
+from schemas.sensor_schemas import SettingsUpdateRequest, SettingsResponse
+from services.water_ledger import WaterLedgerService, get_zone
+from services.tracing import traced_methods
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Optional, Tuple
+import threading
+
+
+@dataclass(frozen=True)
+class AlertRule:
+    """Raise an alert when a reading metric crosses a threshold"""
+    group: str  # Only the first matching rule per group fires
+    metric: str
+    threshold: float
+    alert_type: str
+    key: str
+    param: Optional[str] = None  # Name of the metric value in the alert params
+    below: bool = True
+
+
+@dataclass(frozen=True)
+class IrrigationRule:
+    """Auto-irrigation behaviour for one mode"""
+    start_below: float  # Start when soil moisture drops below this
+    stop_above: float  # Stop when soil moisture rises above this
+    min_water_level: float  # Only start if the water level is above this
+    reason: str
+    reason_key: str
+    stop_alert_key: str
+    stop_reason_key: str
+
+
+@dataclass(frozen=True)
+class ThresholdRules:
+    """Immutable rule table compiled from the settings row
+
+    Built once per settings change and swapped in atomically, so the sensor
+    tick evaluates rules without ever querying the settings table.
+    """
+    version: int = 0
+    alert_rules: Tuple[AlertRule, ...] = ()
+    irrigation_rules: Dict[str, IrrigationRule] = field(default_factory=dict)
+    pump_cutoff_water_level: float = 25.0
+    survival_switch_water_level: float = 30.0
+    critical_alert: bool = True
+    warning_alert: bool = True
+    sms_alert: bool = False
+    push_enabled: bool = True
+
+    @classmethod
+    def compile(cls, settings: Settings) -> "ThresholdRules":
+        alert_rules = (
+            AlertRule("water_level", "water_level", settings.critical_water_level, "critical", "alert_critical_water", "level"),
+            AlertRule("water_level", "water_level", settings.low_water_level, "warning", "alert_low_water", "level"),
+            AlertRule("turbidity", "turbidity", settings.poor_turbidity_level, "warning", "alert_poor_water", "turbidity"),
+            AlertRule("vibration", "vibration_high", 0.5, "critical", "alert_high_vibration", below=False),
+            AlertRule("soil_moisture", "soil_moisture", settings.low_moisture_alert_level, "info", "alert_low_moisture", "moisture"),
+        )
+        irrigation_rules = {
+            "normal": IrrigationRule(
+                start_below=settings.dry_level,
+                stop_above=settings.optimal_level,
+                min_water_level=settings.normal_min_water_level,
+                reason="Low soil moisture: {moisture}%",
+                reason_key="reason_low_moisture",
+                stop_alert_key="alert_auto_irrigation_stopped",
+                stop_reason_key="reason_moisture_sufficient",
+            ),
+            "survival": IrrigationRule(
+                start_below=settings.survival_dry_level,
+                stop_above=settings.survival_target_level,
+                min_water_level=settings.survival_min_water_level,
+                reason="Critical soil moisture in survival mode: {moisture}%",
+                reason_key="reason_critical_moisture_survival",
+                stop_alert_key="alert_survival_irrigation_stopped",
+                stop_reason_key="reason_target_reached",
+            ),
+        }
+        return cls(
+            version=settings.version,
+            alert_rules=alert_rules,
+            irrigation_rules=irrigation_rules,
+            pump_cutoff_water_level=settings.pump_cutoff_water_level,
+            survival_switch_water_level=settings.survival_switch_water_level,
+            critical_alert=settings.critical_alert,
+            warning_alert=settings.warning_alert,
+            sms_alert=settings.sms_alert,
+            push_enabled=settings.push_enabled,
+        )
+
+    def matching_alerts(self, reading):
+        """Yield the alert rules a reading triggers, first match per group"""
+        fired_groups = set()
+        for rule in self.alert_rules:
+            if rule.group in fired_groups:
+                continue
+            value = metric_value(reading, rule.metric)
+            if (value < rule.threshold) if rule.below else (value > rule.threshold):
+                fired_groups.add(rule.group)
+                yield rule, value
+
+
+def metric_value(reading, metric: str) -> float:
+    """Numeric value of a reading metric (vibration maps to 0/1)"""
+    if metric == "vibration_high":
+        return 1.0 if reading.vibration_status == "high" else 0.0
+    return getattr(reading, metric)
+
+
+def _default_settings() -> Settings:
+    """A transient settings row carrying the column defaults"""
+    settings = Settings()
+    for column in Settings.__table__.columns:
+        if getattr(settings, column.key) is None and column.default is not None and column.default.is_scalar:
+            setattr(settings, column.key, column.default.arg)
+    # Older than any stored row so the first refresh always loads the real settings
+    settings.version = 0
+    return settings
+
+
+_rules = ThresholdRules.compile(_default_settings())
+_rules_lock = threading.Lock()
+
+
+def get_rules() -> ThresholdRules:
+    """Return the active rule table (never touches the database)"""
+    return _rules
+
+
+def _swap_rules(settings: Settings) -> ThresholdRules:
+    global _rules
+    with _rules_lock:
+        if settings.version >= _rules.version:
+            _rules = ThresholdRules.compile(settings)
+        return _rules
+
+
+def refresh_rules(db: Session) -> ThresholdRules:
+    """Recompile the rule table if the settings version moved on
+
+    Costs one primary-key lookup of a single integer when nothing changed;
+    used by processes that did not make the update themselves (e.g. the
+    tick worker).
+    """
+    version = db.query(Settings.version).order_by(Settings.id).limit(1).scalar()
+    if version is None or version == _rules.version:
+        return _rules
+    return _swap_rules(db.query(Settings).order_by(Settings.id).first())
+
+
+@traced_methods
+class SettingsService:
+    def __init__(self, db: Session):
+        self.db = db
+
+    def _get_or_create(self) -> Settings:
+        settings = self.db.query(Settings).order_by(Settings.id).first()
+        if not settings:
+            settings = Settings()
+            self.db.add(settings)
+            self.db.commit()
+            self.db.refresh(settings)
+        return settings
+
+    async def get_settings(self) -> SettingsResponse:
+        """Get farm settings and thresholds"""
+        settings = self._get_or_create()
+        _swap_rules(settings)
+        return SettingsResponse.model_validate(settings)
+
+    async def update_settings(self, request: SettingsUpdateRequest) -> SettingsResponse:
+        """Update settings and atomically swap in the recompiled rule table"""
+        settings = self._get_or_create()
+        previous_timezone = settings.timezone
+
+        for name, value in request.model_dump(exclude_unset=True).items():
+            if value is not None:
+                setattr(settings, name, value)
+
+        if settings.dry_level >= settings.optimal_level:
+            raise ValueError("dry_level must be below optimal_level")
+        if settings.survival_dry_level >= settings.survival_target_level:
+            raise ValueError("survival_dry_level must be below survival_target_level")
+        if settings.critical_water_level > settings.low_water_level:
+            raise ValueError("critical_water_level must not exceed low_water_level")
+        if settings.timezone != previous_timezone:
+            get_zone(settings.timezone)  # ValueError for unknown zones
+            # Calendar days moved: re-bucket the water ledger
+            WaterLedgerService(self.db).rebuild(settings.timezone)
+
+        # Incremented in SQL so concurrent updates never reuse a version
+        settings.version = Settings.version + 1
+        settings.updated_at = datetime.utcnow()
+        self.db.commit()
+        self.db.refresh(settings)
+
+        _swap_rules(settings)
+        return SettingsResponse.model_validate(settings)
@@ -0,0 +1,91 @@
+from typing import List, Optional
+
+from sqlalchemy import desc, text
+from sqlalchemy.orm import Session
+from models.sensor import SensorReading, Alert, AlertArchive, IrrigationSession
+from schemas.sensor_schemas import SensorReadingResponse, AlertResponse, IrrigationSessionResponse, SyncResponse
+from services.tracing import traced_methods
+
+# What a client without a usable token starts from (matches the dashboard's own lists)
+SNAPSHOT_READINGS = 100
+SNAPSHOT_ALERTS = 50
+SNAPSHOT_SESSIONS = 50
+
+MAX_SYNC_LIMIT = 5000
+
+
+@traced_methods
+class SyncService:
+    """Delta sync for offline-first clients, driven by change_seq
+
+    Every inserted or changed reading, alert and session is stamped with the
+    next value of the change counter (see ChangeSequence). A client sends
+    back the token it last received and gets only rows stamped after it.
+    Alerts are read from alerts and alerts_archive together.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    async def get_changes(self, since: Optional[int] = None, limit: int = 500) -> SyncResponse:
+        """Rows changed after `since`, or a snapshot when there is no usable token"""
+        limit = min(max(limit, 1), MAX_SYNC_LIMIT)
+        # Everything up to the counter is committed; later changes wait for the next sync
+        current = self.db.execute(text("SELECT value FROM change_sequence WHERE id = 1")).scalar() or 0
+
+        if since is None or since < 0 or since > current:
+            # First sync, or a token from another database
+            return self._snapshot(current)
+
+        changes = {
+            model: self._changed_rows(model, since, current, limit + 1)
+            for model in (SensorReading, Alert, IrrigationSession)
+        }
+        truncated = [rows for rows in changes.values() if len(rows) > limit]
+        token = current
+        if truncated:
+            # Stop where the shortest full page ends, so no change is skipped
+            token = min(rows[limit - 1].change_seq for rows in truncated)
+            changes = {model: [r for r in rows if r.change_seq <= token] for model, rows in changes.items()}
+
+        return SyncResponse(
+            token=token,
+            full=False,
+            has_more=bool(truncated),
+            readings=[SensorReadingResponse.model_validate(r) for r in changes[SensorReading]],
+            alerts=[AlertResponse.model_validate(a) for a in changes[Alert]],
+            sessions=[IrrigationSessionResponse.model_validate(s) for s in changes[IrrigationSession]],
+        )
+
+    def _changed_rows(self, model, since: int, upto: int, limit: int) -> List:
+        if model is Alert:
+            # Archiving keeps change_seq, so a dismissal is found wherever the alert is now
+            rows = self._query_changed(Alert, since, upto, limit) + self._query_changed(AlertArchive, since, upto, limit)
+            return sorted(rows, key=lambda row: row.change_seq)[:limit]
+        return self._query_changed(model, since, upto, limit)
+
+    def _query_changed(self, model, since: int, upto: int, limit: int) -> List:
+        return self.db.query(model).filter(
+            model.change_seq > since,
+            model.change_seq <= upto
+        ).order_by(model.change_seq).limit(limit).all()
+
+    def _snapshot(self, token: int) -> SyncResponse:
+        readings = self.db.query(SensorReading).order_by(
+            desc(SensorReading.timestamp)
+        ).limit(SNAPSHOT_READINGS).all()
+        alerts = self.db.query(Alert).filter(
+            Alert.is_dismissed == False,
+            Alert.resolved_at.is_(None)
+        ).order_by(desc(Alert.created_at)).limit(SNAPSHOT_ALERTS).all()
+        sessions = self.db.query(IrrigationSession).order_by(
+            desc(IrrigationSession.started_at)
+        ).limit(SNAPSHOT_SESSIONS).all()
+
+        return SyncResponse(
+            token=token,
+            full=True,
+            readings=[SensorReadingResponse.model_validate(r) for r in reversed(readings)],
+            alerts=[AlertResponse.model_validate(a) for a in alerts],
+            sessions=[IrrigationSessionResponse.model_validate(s) for s in sessions],
+        )
@@ -0,0 +1,504 @@
+"""
+Request and tick tracing
+
+Spans cover HTTP requests (GzipRoute), scheduled task runs and the sensor
+tick's stages, service methods (@traced_methods) and SQL statements and
+commits (SQLAlchemy events). Whether a trace is recorded is decided once,
+when its root span starts (head sampling): TRACE_SAMPLE_RATIO of roots,
+plus requests whose W3C traceparent header is marked sampled, capped at
+TRACE_MAX_PER_SECOND. Unsampled traces create no spans at all; their cost
+is one context variable lookup per hook.
+
+A finished trace goes to a writer thread (or is dropped if its queue is
+full), which appends traces as OTLP/JSON lines (ExportTraceServiceRequest,
+as written by the OpenTelemetry Collector's file exporter) to TRACE_PATH
+and rotates the file at TRACE_FILE_MAX_BYTES. The collector's
+otlpjsonfile receiver, or any tool that reads OTLP/JSON, can load it.
+"""
+
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from models.database import SessionLocal
+
+TRACE_SAMPLE_RATIO = float(os.getenv("TRACE_SAMPLE_RATIO", "0"))  # 0: tracing off
+TRACE_MAX_PER_SECOND = float(os.getenv("TRACE_MAX_PER_SECOND", "10"))
+TRACE_PATH = os.getenv("TRACE_PATH", "./traces.otlp.jsonl")
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(20 * 1024 * 1024)))
+TRACE_FILE_BACKUPS = int(os.getenv("TRACE_FILE_BACKUPS", "3"))
+MAX_SPANS_PER_TRACE = 2000
+EXPORT_QUEUE_SIZE = 1000  # Traces waiting for the writer
+EXPORT_BATCH = 100  # Traces per line
+MAX_STATEMENT_CHARS = 1000
+SERVICE_NAME = "rootguard-backend"
+
+# OTLP span kinds and status codes
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+STATUS_ERROR = 2
+
+_current: contextvars.ContextVar = contextvars.ContextVar("rootguard_span", default=None)
+_NOT_TRACED = contextlib.nullcontext()
+
+
+def _random_id(bits: int) -> int:
+    return random.getrandbits(bits) or 1
+
+
+class Trace:
+    """Spans of one sampled trace; exported when its root span ends"""
+
+    __slots__ = ("trace_id", "root", "spans", "dropped", "closed")
+
+    def __init__(self, trace_id: int):
+        self.trace_id = trace_id
+        self.root: Optional["Span"] = None
+        self.spans: List["Span"] = []
+        self.dropped = 0
+        self.closed = False
+
+
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: Trace, parent_id: Optional[int], name: str, kind: int,
+                 attributes: Optional[Dict[str, Any]]):
+        self.trace = trace
+        self.span_id = _random_id(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes) if attributes else {}
+        self.error: Optional[str] = None
+        self.end_ns = 0
+        self.start_ns = time.time_ns()
+
+    def set(self, key: str, value: Any):
+        self.attributes[key] = value
+
+
+class _ActiveSpan:
+    """Makes a span current for a with block and ends it afterwards"""
+
+    __slots__ = ("tracer", "span", "token")
+
+    def __init__(self, tracer: "Tracer", span: Span):
+        self.tracer = tracer
+        self.span = span
+
+    def __enter__(self) -> Span:
+        self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self.token)
+        self.tracer.end_span(self.span, exc)
+        return False
+
+
+def current_span() -> Optional[Span]:
+    """The span this code runs under, if its trace is sampled"""
+    return _current.get()
+
+
+@contextlib.contextmanager
+def use_span(span: Optional[Span]):
+    """Continue `span`'s trace in code that does not inherit its context (e.g. a queue's worker task)"""
+    if span is None or span.trace.closed:
+        yield
+        return
+    token = _current.set(span)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+
+
+class Tracer:
+    """Creates spans for sampled traces and hands finished traces to the exporter"""
+
+    def __init__(self, ratio: float = TRACE_SAMPLE_RATIO, max_per_second: float = TRACE_MAX_PER_SECOND,
+                 exporter: Optional["FileSpanExporter"] = None):
+        self.ratio = ratio
+        self.max_per_second = max_per_second
+        self.exporter = exporter or FileSpanExporter()
+        self._tokens = max(max_per_second, 1.0)
+        self._refilled = time.monotonic()
+
+        # Metrics
+        self.roots = 0
+        self.sampled = 0
+        self.rate_limited = 0
+        self.spans = 0
+        self.spans_dropped = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ratio > 0
+
+    def trace(self, name: str, kind: int = KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None,
+              traceparent: Optional[str] = None):
+        """Context manager for a root span, sampled or not (a child span inside a sampled trace)
+
+        Yields the Span, or None when the trace is not sampled.
+        """
+        parent = _current.get()
+        if parent is not None:
+            return self._child(parent, name, kind, attributes)
+        if not self.enabled:
+            return _NOT_TRACED
+        self.roots += 1
+        remote = _parse_traceparent(traceparent) if traceparent else None
+        if not self._sample(remote):
+            return _NOT_TRACED
+        trace = Trace(remote[0] if remote else _random_id(128))
+        span = self._new_span(trace, remote[1] if remote else None, name, kind, attributes)
+        trace.root = span
+        return _ActiveSpan(self, span)
+
+    def span(self, name: str, attributes: Optional[Dict[str, Any]] = None, kind: int = KIND_INTERNAL):
+        """Context manager for a child of the current span; a no-op outside sampled traces"""
+        parent = _current.get()
+        if parent is None:
+            return _NOT_TRACED
+        return self._child(parent, name, kind, attributes)
+
+    def start_span(self, name: str, kind: int = KIND_INTERNAL,
+                   attributes: Optional[Dict[str, Any]] = None) -> Optional[Span]:
+        """Start a child of the current span without making it current (end it with end_span)"""
+        parent = _current.get()
+        if parent is None or parent.trace.closed:
+            return None
+        return self._new_span(parent.trace, parent.span_id, name, kind, attributes)
+
+    def end_span(self, span: Span, error: Optional[BaseException] = None):
+        span.end_ns = time.time_ns()
+        if error is not None:
+            span.error = f"{type(error).__name__}: {error}"
+        trace = span.trace
+        if span is trace.root:
+            trace.closed = True
+            self.exporter.export(trace)
+
+    def stats(self) -> Dict:
+        return {
+            "enabled": self.enabled,
+            "sample_ratio": self.ratio,
+            "max_per_second": self.max_per_second,
+            "roots": self.roots,
+            "sampled": self.sampled,
+            "rate_limited": self.rate_limited,
+            "spans": self.spans,
+            "spans_dropped": self.spans_dropped,
+            "exporter": self.exporter.stats(),
+        }
+
+    def _child(self, parent: Span, name: str, kind: int, attributes: Optional[Dict[str, Any]]):
+        if parent.trace.closed:
+            return _NOT_TRACED
+        span = self._new_span(parent.trace, parent.span_id, name, kind, attributes)
+        return _ActiveSpan(self, span) if span is not None else _NOT_TRACED
+
+    def _new_span(self, trace: Trace, parent_id: Optional[int], name: str, kind: int,
+                  attributes: Optional[Dict[str, Any]]) -> Optional[Span]:
+        if len(trace.spans) >= MAX_SPANS_PER_TRACE:
+            trace.dropped += 1
+            self.spans_dropped += 1
+            return None
+        span = Span(trace, parent_id, name, kind, attributes)
+        trace.spans.append(span)
+        self.spans += 1
+        return span
+
+    def _sample(self, remote: Optional[Tuple[int, int, bool]]) -> bool:
+        """Head sampling: the ratio (or the caller's sampled flag), then the per-second cap"""
+        wanted = remote[2] if remote else random.random() < self.ratio
+        if not wanted:
+            return False
+        now = time.monotonic()
+        burst = max(self.max_per_second, 1.0)
+        self._tokens = min(burst, self._tokens + (now - self._refilled) * self.max_per_second)
+        self._refilled = now
+        if self._tokens < 1:
+            self.rate_limited += 1
+            return False
+        self._tokens -= 1
+        self.sampled += 1
+        return True
+
+
+def _parse_traceparent(header: str) -> Optional[Tuple[int, int, bool]]:
+    """W3C traceparent "00-<trace id>-<parent span id>-<flags>"; None if malformed"""
+    parts = header.strip().split("-")
+    if len(parts) < 4 or len(parts[1]) != 32 or len(parts[2]) != 16 or len(parts[3]) != 2:
+        return None
+    try:
+        trace_id, parent_id, flags = int(parts[1], 16), int(parts[2], 16), int(parts[3], 16)
+    except ValueError:
+        return None
+    if not trace_id or not parent_id:
+        return None
+    return trace_id, parent_id, bool(flags & 1)
+
+
+def traced_methods(cls):
+    """Class decorator: a span ("Class.method") around each method defined on the class"""
+    for attr, value in list(vars(cls).items()):
+        if inspect.isfunction(value) and not attr.startswith("__"):
+            setattr(cls, attr, _traced(value, f"{cls.__name__}.{attr}"))
+    return cls
+
+
+def _traced(func, name: str):
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return await func(*args, **kwargs)
+            with get_tracer().span(name):
+                return await func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if _current.get() is None:
+            return func(*args, **kwargs)
+        with get_tracer().span(name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+# SQL statements: a client span per cursor execution
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is None:
+        return
+    span = get_tracer().start_span(statement.split(None, 1)[0].upper() if statement else "SQL", KIND_CLIENT, {
+        "db.system": conn.dialect.name,
+        "db.statement": statement[:MAX_STATEMENT_CHARS],
+    })
+    if span is not None:
+        if executemany:
+            span.set("db.executemany", True)
+        conn.info.setdefault("trace_spans", []).append(span)
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    spans = conn.info.get("trace_spans")
+    if spans:
+        span = spans.pop()
+        if cursor.rowcount >= 0:
+            span.set("db.rows_affected", cursor.rowcount)
+        get_tracer().end_span(span)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    connection = exception_context.connection
+    spans = connection.info.get("trace_spans") if connection is not None else None
+    if spans:
+        get_tracer().end_span(spans.pop(), exception_context.original_exception)
+
+
+# Commits (and savepoint releases), with the flush they trigger nested inside
+@event.listens_for(SessionLocal, "before_commit")
+def _before_commit(session):
+    tracer = get_tracer()
+    nested = session.get_nested_transaction()
+    span = tracer.start_span("savepoint release" if nested else "commit")
+    if span is not None:
+        transaction = nested or session.get_transaction()
+        session.info.setdefault("trace_commits", []).append((span, _current.set(span), transaction))
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _after_commit(session):
+    commits = session.info.get("trace_commits")
+    if commits:
+        _end_commit(*commits.pop(), None)
+
+
+@event.listens_for(SessionLocal, "after_transaction_end")
+def _after_transaction_end(session, transaction):
+    # A commit that failed part-way: its transaction ends without after_commit
+    commits = session.info.get("trace_commits")
+    if commits and commits[-1][2] is transaction:
+        _end_commit(*commits.pop(), RuntimeError("commit did not complete"))
+
+
+def _end_commit(span: Span, token, transaction, error: Optional[BaseException]):
+    try:
+        _current.reset(token)
+    except ValueError:
+        pass  # Ended from another context; that context's own value is unaffected
+    get_tracer().end_span(span, error)
+
+
+class FileSpanExporter:
+    """Appends finished traces to a rotating file as OTLP/JSON lines, from a background thread"""
+
+    def __init__(self, path: str = TRACE_PATH, max_bytes: int = TRACE_FILE_MAX_BYTES,
+                 backups: int = TRACE_FILE_BACKUPS, queue_size: int = EXPORT_QUEUE_SIZE):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._resource = _attributes({"service.name": SERVICE_NAME, "process.pid": os.getpid()})
+
+        # Metrics
+        self.exported = 0
+        self.dropped = 0
+        self.rotations = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+
+    def export(self, trace: Trace):
+        """Queue a finished trace; dropped if the writer is too far behind"""
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(trace)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 2.0):
+        """Write what is queued and stop the writer"""
+        if self._thread is None:
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self._thread = None
+
+    def stats(self) -> Dict:
+        return {
+            "path": self.path,
+            "queued": self._queue.qsize(),
+            "exported": self.exported,
+            "dropped": self.dropped,
+            "rotations": self.rotations,
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        file = None
+        stopping = False
+        try:
+            while not stopping:
+                batch = [self._queue.get()]
+                while len(batch) < EXPORT_BATCH and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                if None in batch:
+                    stopping = True
+                    batch = [trace for trace in batch if trace is not None]
+                if not batch:
+                    continue
+                line = json.dumps(self._encode(batch), separators=(",", ":")) + "\n"
+                try:
+                    if file is None:
+                        file = open(self.path, "a", encoding="utf-8")
+                    if file.tell() and file.tell() + len(line) > self.max_bytes:
+                        file.close()
+                        file = None
+                        self._rotate()
+                        file = open(self.path, "a", encoding="utf-8")
+                    file.write(line)
+                    file.flush()
+                    self.exported += len(batch)
+                except OSError as e:
+                    self.errors += 1
+                    self.last_error = str(e)
+                    self.dropped += len(batch)
+        finally:
+            if file is not None:
+                file.close()
+
+    def _rotate(self):
+        """traces.otlp.jsonl -> .1 -> .2 ... up to `backups` old files"""
+        if self.backups <= 0:
+            os.remove(self.path)
+        else:
+            for n in range(self.backups - 1, 0, -1):
+                if os.path.exists(f"{self.path}.{n}"):
+                    os.replace(f"{self.path}.{n}", f"{self.path}.{n + 1}")
+            os.replace(self.path, f"{self.path}.1")
+        self.rotations += 1
+
+    def _encode(self, traces: List[Trace]) -> Dict:
+        """An OTLP ExportTraceServiceRequest in its JSON mapping"""
+        spans = []
+        for trace in traces:
+            trace_id = f"{trace.trace_id:032x}"
+            if trace.dropped:
+                trace.root.set("rootguard.spans_dropped", trace.dropped)
+            for span in trace.spans:
+                if not span.end_ns:
+                    continue  # Still running when the root ended (e.g. a task it spawned)
+                encoded = {
+                    "traceId": trace_id,
+                    "spanId": f"{span.span_id:016x}",
+                    "name": span.name,
+                    "kind": span.kind,
+                    "startTimeUnixNano": str(span.start_ns),
+                    "endTimeUnixNano": str(span.end_ns),
+                    "attributes": _attributes(span.attributes),
+                }
+                if span.parent_id is not None:
+                    encoded["parentSpanId"] = f"{span.parent_id:016x}"
+                if span.error is not None:
+                    encoded["status"] = {"code": STATUS_ERROR, "message": span.error}
+                spans.append(encoded)
+        return {"resourceSpans": [{
+            "resource": {"attributes": self._resource},
+            "scopeSpans": [{"scope": {"name": "rootguard"}, "spans": spans}],
+        }]}
+
+
+def _attributes(values: Dict[str, Any]) -> List[Dict]:
+    encoded = []
+    for key, value in values.items():
+        if isinstance(value, bool):
+            typed = {"boolValue": value}
+        elif isinstance(value, int):
+            typed = {"intValue": str(value)}  # int64 is a string in OTLP/JSON
+        elif isinstance(value, float):
+            typed = {"doubleValue": value}
+        else:
+            typed = {"stringValue": str(value)}
+        encoded.append({"key": key, "value": typed})
+    return encoded
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """Return this process's tracer (off unless TRACE_SAMPLE_RATIO is set)"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
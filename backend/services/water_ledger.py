@@ -0,0 +1,114 @@
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Dict, List, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from sqlalchemy.orm import Session
+from models.sensor import DailyWaterUsage, IrrigationSession, Settings, DEFAULT_TIMEZONE
+from services.tracing import traced_methods
+
+
+@lru_cache(maxsize=16)
+def get_zone(name: Optional[str]) -> ZoneInfo:
+    """ZoneInfo for an IANA name; ValueError if it is unknown"""
+    try:
+        return ZoneInfo(name or DEFAULT_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise ValueError(f"Unknown timezone: {name}")
+
+
+def farm_timezone(db: Session) -> str:
+    """The farm's configured timezone (one small lookup)"""
+    name = db.query(Settings.timezone).order_by(Settings.id).limit(1).scalar()
+    return name or DEFAULT_TIMEZONE
+
+
+def local_day(moment: datetime, zone: ZoneInfo) -> date:
+    """Farm-local calendar day of a stored timestamp (naive values are UTC)"""
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(zone).date()
+
+
+def local_today(zone: ZoneInfo) -> date:
+    return datetime.now(zone).date()
+
+
+def day_start_utc(day: date, zone: ZoneInfo) -> datetime:
+    """Naive UTC instant at which a farm-local day begins"""
+    return datetime.combine(day, time(), tzinfo=zone).astimezone(timezone.utc).replace(tzinfo=None)
+
+
+@traced_methods
+class WaterLedgerService:
+    """Per-day water totals, maintained as sessions close
+
+    Analytics read one row per day instead of scanning every session in the
+    window. A session counts towards the farm-local day it started on, in
+    the timezone configured in settings. Callers commit.
+    """
+
+    def __init__(self, db: Session):
+        self.db = db
+
+    def record_session(self, session: IrrigationSession, timezone_name: Optional[str] = None):
+        """Add a just-closed session to its day's totals"""
+        zone = get_zone(timezone_name or farm_timezone(self.db))
+        day = local_day(session.started_at, zone)
+        row = self.db.get(DailyWaterUsage, day)
+        if row is None:
+            row = DailyWaterUsage(day=day, water_liters=0.0, sessions=0, duration_minutes=0, by_mode={})
+            self.db.add(row)
+
+        self._add(row, session.mode, session.estimated_volume_liters or 0.0, session.duration_minutes or 0)
+
+    def rebuild(self, timezone_name: Optional[str] = None, since: Optional[date] = None,
+                until: Optional[date] = None) -> int:
+        """Recompute the ledger from closed sessions, for every day or from `since` to `until`; return rows written"""
+        zone = get_zone(timezone_name or farm_timezone(self.db))
+        ledger = self.db.query(DailyWaterUsage)
+        sessions = self.db.query(
+            IrrigationSession.started_at,
+            IrrigationSession.mode,
+            IrrigationSession.estimated_volume_liters,
+            IrrigationSession.duration_minutes,
+        ).filter(IrrigationSession.ended_at.isnot(None))
+        if since:
+            ledger = ledger.filter(DailyWaterUsage.day >= since)
+            sessions = sessions.filter(IrrigationSession.started_at >= day_start_utc(since, zone))
+        if until:
+            ledger = ledger.filter(DailyWaterUsage.day <= until)
+            sessions = sessions.filter(IrrigationSession.started_at < day_start_utc(until + timedelta(days=1), zone))
+        ledger.delete(synchronize_session=False)
+
+        rows: Dict[date, DailyWaterUsage] = {}
+        for started_at, mode, volume, minutes in sessions.yield_per(10000):
+            day = local_day(started_at, zone)
+            row = rows.get(day)
+            if row is None:
+                row = rows[day] = DailyWaterUsage(day=day, water_liters=0.0, sessions=0, duration_minutes=0, by_mode={})
+            self._add(row, mode, volume or 0.0, minutes or 0)
+
+        self.db.add_all(rows.values())
+        return len(rows)
+
+    def get_days(self, start: date, end: date) -> List[DailyWaterUsage]:
+        """Ledger rows from `start` to `end` inclusive; days without irrigation have none"""
+        return self.db.query(DailyWaterUsage).filter(
+            DailyWaterUsage.day >= start,
+            DailyWaterUsage.day <= end
+        ).order_by(DailyWaterUsage.day).all()
+
+    @staticmethod
+    def _add(row: DailyWaterUsage, mode: str, liters: float, minutes: int):
+        row.water_liters += liters
+        row.sessions += 1
+        row.duration_minutes += minutes
+        # Replace rather than mutate so the JSON column is marked dirty
+        by_mode = dict(row.by_mode or {})
+        totals = dict(by_mode.get(mode) or {"water_liters": 0.0, "sessions": 0, "duration_minutes": 0})
+        totals["water_liters"] = round(totals["water_liters"] + liters, 1)
+        totals["sessions"] += 1
+        totals["duration_minutes"] += minutes
+        by_mode[mode] = totals
+        row.by_mode = by_mode
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Long-range analytics isolation test for RootGuard Bot
+
+Seeds a year of readings, starts the API (uvicorn, embedded tick worker)
+and polls /api/sensors/latest: first on its own, then while several
+identical year-long /api/analytics/efficiency requests run. The scans run
+in the analytics pool's worker processes, so latest-reading latency must
+stay close to its baseline; the identical requests must share one scan.
+
+Run with --workers 0 to see the thread fallback for comparison.
+
+Usage: python stress_analytics.py [--days 365] [--scale 10] [--concurrent 4] [--workers 2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from load_test import HttpConnection, percentile, start_local_server
+
+LATEST = "/api/sensors/latest"
+ALLOWED_P95_MS = 50.0  # Extra latency tolerated over the baseline p95
+
+
+async def poll_latest(host: str, port: int, stop: asyncio.Event, interval: float = 0.02):
+    """Latencies (s) of back-to-back latest-reading requests until `stop`"""
+    connection = HttpConnection(host, port)
+    latencies = []
+    try:
+        while not stop.is_set():
+            started = time.perf_counter()
+            status = await connection.get(LATEST)
+            latencies.append(time.perf_counter() - started)
+            if status != 200:
+                raise RuntimeError(f"{LATEST} returned {status}")
+            await asyncio.sleep(interval)
+    finally:
+        connection.close()
+    return latencies
+
+
+async def timed_get(host: str, port: int, path: str):
+    connection = HttpConnection(host, port)
+    started = time.perf_counter()
+    try:
+        status = await connection.get(path)
+    finally:
+        connection.close()
+    return status, time.perf_counter() - started
+
+
+async def measure(host: str, port: int, days: int, concurrent: int, baseline_seconds: float):
+    stop = asyncio.Event()
+    poller = asyncio.create_task(poll_latest(host, port, stop))
+    await asyncio.sleep(baseline_seconds)
+    stop.set()
+    baseline = await poller
+
+    stop = asyncio.Event()
+    poller = asyncio.create_task(poll_latest(host, port, stop))
+    path = f"/api/analytics/efficiency?days={days}"
+    results = await asyncio.gather(*(timed_get(host, port, path) for _ in range(concurrent)))
+    stop.set()
+    during = await poller
+    return baseline, during, results
+
+
+def summary(latencies):
+    return (f"n={len(latencies)} p50 {percentile(latencies, 50) * 1000:.1f} ms, "
+            f"p95 {percentile(latencies, 95) * 1000:.1f} ms, max {max(latencies) * 1000:.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that year-long analytics do not stall other requests")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--scale", type=float, default=10, help="Seed reading rate multiplier (1 = every 5 min)")
+    parser.add_argument("--concurrent", type=int, default=4, help="Identical analytics requests at once")
+    parser.add_argument("--workers", type=int, default=2, help="ANALYTICS_WORKERS for the server")
+    parser.add_argument("--baseline", type=float, default=3.0, help="Seconds of baseline polling")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["ANALYTICS_WORKERS"] = str(args.workers)
+        os.environ["ANALYTICS_TIMEOUT_SECONDS"] = "300"
+        database = os.path.join(tmp, "load_test.db")
+        # start_local_server seeds with the default rate; reseed at --scale first
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{database}", INGEST_LOG_PATH=os.path.join(tmp, "seed.log"))
+        print(f"Seeding {args.days} days at scale {args.scale:g}...")
+        subprocess.run([sys.executable, "seed_database.py", "--days", str(args.days), "--scale", str(args.scale)],
+                       cwd=os.path.dirname(os.path.abspath(__file__)), env=env, check=True,
+                       stdout=subprocess.DEVNULL)
+        server, port = start_local_server(tmp, 0)
+        try:
+            baseline, during, results = asyncio.run(
+                measure("127.0.0.1", port, args.days, args.concurrent, args.baseline)
+            )
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/api/metrics") as response:
+                pool = json.load(response)["analytics_pool"]
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    problems = []
+    print(f"{LATEST} alone:            {summary(baseline)}")
+    print(f"{LATEST} during analytics: {summary(during)}")
+    for status, seconds in results:
+        print(f"  efficiency days={args.days}: HTTP {status} in {seconds:.2f}s")
+        if status != 200:
+            problems.append(f"analytics request returned {status}")
+    print(f"analytics pool: {pool}")
+
+    allowed = percentile(baseline, 95) * 1000 + ALLOWED_P95_MS
+    if percentile(during, 95) * 1000 > allowed:
+        problems.append(f"{LATEST} p95 rose above {allowed:.1f} ms while analytics ran")
+    if pool["started"] != 1 or pool["shared"] != args.concurrent - 1:
+        problems.append(f"{args.concurrent} identical requests started {pool['started']} scans (expected 1)")
+
+    for problem in problems:
+        print(f"✗ {problem}")
+    if not problems:
+        print("✓ latest-reading latency unaffected; identical requests shared one scan")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
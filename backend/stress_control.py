@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Irrigation control stress test for RootGuard Bot
+
+Starts several processes against one fresh database, as several API workers
+would. Each runs its own control queue and fires hundreds of concurrent
+control commands (start/stop, mode and auto-mode changes, some with an
+expected_version) while the first process also runs sensor ticks. Afterwards
+irrigation is started once more and the history must be consistent: one
+control row, exactly one open session, and no overlapping sessions.
+
+Exits non-zero if the history is inconsistent, a command failed outright,
+or the p99 command latency exceeds its budget.
+
+Usage: python stress_control.py [--processes 3] [--calls 300] [--p99-budget 1.0]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+
+def percentile(values, pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def _fire(index: int, calls: int, concurrency: int, ticks: int, tick_ms: int) -> dict:
+    from models.database import SessionLocal
+    from schemas.sensor_schemas import IrrigationControlRequest
+    from services.control_queue import ControlConflict, get_control_queue
+    from services.ingest_buffer import get_ingest_buffer
+    from services.irrigation_service import IrrigationService
+    from worker import run_tick
+
+    buffer = get_ingest_buffer()
+    await buffer.start()
+    queue = get_control_queue()
+    await queue.start()
+
+    rng = random.Random(index)
+    latencies, conflicts, errors = [], 0, []
+    limiter = asyncio.Semaphore(concurrency)
+
+    def random_request() -> IrrigationControlRequest:
+        choice = rng.random()
+        if choice < 0.5:
+            return IrrigationControlRequest(is_irrigating=rng.random() < 0.5)
+        if choice < 0.8:
+            return IrrigationControlRequest(mode=rng.choice(["normal", "survival", "manual", "off"]))
+        return IrrigationControlRequest(auto_mode=rng.random() < 0.5)
+
+    async def one_call():
+        nonlocal conflicts
+        async with limiter:
+            request = random_request()
+            if rng.random() < 0.2:
+                # Optimistic write from a status read, as a UI would do
+                db = SessionLocal()
+                try:
+                    status = await IrrigationService(db).get_current_status()
+                finally:
+                    db.close()
+                request.expected_version = status.version
+            started = time.perf_counter()
+            try:
+                await queue.submit(lambda db: IrrigationService(db).update_control(request))
+            except ControlConflict:
+                conflicts += 1
+            except Exception as e:
+                errors.append(repr(e))
+            latencies.append(time.perf_counter() - started)
+
+    async def tick_loop():
+        for _ in range(ticks):
+            try:
+                await run_tick()
+            except Exception as e:
+                errors.append(f"tick: {e!r}")
+            await asyncio.sleep(tick_ms / 1000)
+
+    jobs = [one_call() for _ in range(calls)]
+    if ticks:
+        jobs.append(tick_loop())
+    await asyncio.gather(*jobs)
+
+    await queue.stop()
+    await buffer.stop()
+    return {"latencies": latencies, "conflicts": conflicts, "errors": errors, "queue": queue.stats()}
+
+
+def worker_process(index: int, calls: int, concurrency: int, ticks: int, tick_ms: int, results):
+    results.put((index, asyncio.run(_fire(index, calls, concurrency, ticks, tick_ms))))
+
+
+def check_history() -> list:
+    """Start irrigation once more, then return consistency problems in the history"""
+    from models.database import SessionLocal
+    from models.sensor import IrrigationControl, IrrigationSession
+    from schemas.sensor_schemas import IrrigationControlRequest
+    from services.control_queue import get_control_queue
+    from services.irrigation_service import IrrigationService
+
+    # Leaves exactly one session open, whatever state the stress run ended in
+    request = IrrigationControlRequest(mode="manual", is_irrigating=True)
+    asyncio.run(get_control_queue().submit(lambda db: IrrigationService(db).update_control(request)))
+
+    problems = []
+    db = SessionLocal()
+    try:
+        controls = db.query(IrrigationControl).all()
+        sessions = db.query(IrrigationSession).order_by(IrrigationSession.started_at, IrrigationSession.id).all()
+    finally:
+        db.close()
+
+    if len(controls) != 1:
+        problems.append(f"{len(controls)} control rows (expected 1)")
+    open_sessions = [s for s in sessions if s.ended_at is None]
+    if len(open_sessions) != 1:
+        problems.append(f"{len(open_sessions)} open sessions (expected 1)")
+    for earlier, later in zip(sessions, sessions[1:]):
+        if earlier.ended_at is None or earlier.ended_at > later.started_at:
+            problems.append(f"sessions {earlier.id} and {later.id} overlap")
+
+    print(f"sessions: {len(sessions)} total, {len(open_sessions)} open; "
+          f"control version {controls[0].version if controls else '-'}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fire concurrent irrigation control commands during ticks")
+    parser.add_argument("--processes", type=int, default=3, help="Concurrent API-like processes")
+    parser.add_argument("--calls", type=int, default=300, help="Control commands per process")
+    parser.add_argument("--concurrency", type=int, default=50, help="Commands in flight per process")
+    parser.add_argument("--ticks", type=int, default=100, help="Sensor ticks run by the first process")
+    parser.add_argument("--tick-ms", type=int, default=20, help="Pause between ticks")
+    parser.add_argument("--p99-budget", type=float, default=1.0, help="Seconds allowed for p99 command latency")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Children inherit the environment, so every process shares this database
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'stress_control.db')}"
+        os.environ["INGEST_LOG_PATH"] = os.path.join(tmp, "ingest_buffer.log")
+        os.environ["CONTROL_LOCK_PATH"] = os.path.join(tmp, "irrigation_control.lock")
+
+        from models.migrations import init_db
+        init_db()
+
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        processes = [
+            context.Process(target=worker_process, args=(
+                index, args.calls, args.concurrency, args.ticks if index == 0 else 0, args.tick_ms, results
+            ))
+            for index in range(args.processes)
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        outcomes = dict(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        problems = check_history()
+
+    latencies = []
+    for index in sorted(outcomes):
+        outcome = outcomes[index]
+        latencies.extend(outcome["latencies"])
+        queue = outcome["queue"]
+        print(f"process {index}: p50 {percentile(outcome['latencies'], 50) * 1000:.1f} ms, "
+              f"p99 {percentile(outcome['latencies'], 99) * 1000:.1f} ms, "
+              f"409s {outcome['conflicts']}, retries {queue['retries']}, errors {len(outcome['errors'])}, "
+              f"batches {queue['batches']} (max {queue['max_batch_ms']:.0f} ms)")
+        problems.extend(outcome["errors"][:5])
+
+    p99 = percentile(latencies, 99)
+    print(f"{len(latencies)} commands in {elapsed:.1f}s: "
+          f"p50 {percentile(latencies, 50) * 1000:.1f} ms, p95 {percentile(latencies, 95) * 1000:.1f} ms, "
+          f"p99 {p99 * 1000:.1f} ms, max {max(latencies, default=0) * 1000:.1f} ms")
+    if p99 > args.p99_budget:
+        problems.append(f"p99 latency {p99 * 1000:.0f} ms exceeds {args.p99_budget * 1000:.0f} ms")
+
+    for problem in problems:
+        print(f"✗ {problem}")
+    if not problems:
+        print("✓ control state consistent")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
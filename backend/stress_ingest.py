@@ -0,0 +1,250 @@
+#!/usr/bin/env python3
+"""
+Duplicate and reorder ingest stress test for RootGuard Bot
+
+Starts several processes against one fresh database, as several API workers
+would, and has them upload the same per-device reading streams (each
+reading with its device_seq) the way devices on a flaky link do: batches
+are re-sent to more than one process, arrive in shuffled order, and are
+shuffled within themselves. The on-site unit's newest reading and a closed
+irrigation session are stored first, so every on-site reading arrives late
+and must correct that session. With --in-order one process uploads every
+stream in order instead, so no reading is late, and the session must come
+out the same.
+
+Afterwards every (device, device_seq) must be stored exactly once, reads
+ordered by timestamp must come back in sequence order, and the session's
+volume and ledger day must equal a full recompute.
+
+Usage: python stress_ingest.py [--processes 3] [--devices 4] [--readings 2000] [--resend 0.5] [--in-order]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+STREAM_START = datetime(2026, 1, 1)
+STEP = timedelta(seconds=30)
+
+
+def device_ids(devices: int):
+    # The on-site unit first: its late readings touch irrigation sessions
+    return ["borewell-1"] + [f"borewell-{n + 1}" for n in range(1, devices)]
+
+
+def reading(device_id: str, seq: int) -> dict:
+    rng = random.Random(f"{device_id}:{seq}")
+    return {
+        "device_id": device_id,
+        "water_level": round(rng.uniform(30, 90), 1),
+        "flow_rate": round(rng.uniform(5, 15), 1),
+        "turbidity": round(rng.uniform(60, 100), 1),
+        "vibration_status": "high" if rng.random() < 0.05 else "low",
+        "soil_moisture": round(rng.uniform(20, 70), 1),
+        "timestamp": STREAM_START + STEP * seq,
+        "device_seq": seq,
+    }
+
+
+def plan(devices: int, readings: int, batch: int, processes: int, resend: float, seed: int,
+         in_order: bool = False):
+    """Per process, the batches it will upload, in the order it uploads them"""
+    if in_order:
+        return [[
+            [reading(device_id, seq) for seq in range(start, min(start + batch, readings))]
+            for start in range(0, readings, batch) for device_id in device_ids(devices)
+        ]]
+    rng = random.Random(seed)
+    uploads = [[] for _ in range(processes)]
+    for device_id in device_ids(devices):
+        for start in range(0, readings, batch):
+            rows = [reading(device_id, seq) for seq in range(start, min(start + batch, readings))]
+            senders = {rng.randrange(processes)}
+            while rng.random() < resend:
+                senders.add(rng.randrange(processes))
+                if len(senders) == processes:
+                    break
+            for sender in senders:
+                shuffled = rows[:]
+                rng.shuffle(shuffled)
+                uploads[sender].append(shuffled)
+    for batches in uploads:
+        rng.shuffle(batches)
+    return uploads
+
+
+async def _upload(batches: list, concurrency: int) -> dict:
+    from services.control_queue import get_control_queue
+    from services.ingest_buffer import get_ingest_buffer
+
+    buffer = get_ingest_buffer()
+    await buffer.start()
+    queue = get_control_queue()
+    await queue.start()
+
+    limiter = asyncio.Semaphore(concurrency)
+    errors = []
+
+    async def send(rows):
+        async with limiter:
+            try:
+                await asyncio.gather(*buffer.submit_many(rows))
+            except Exception as e:
+                errors.append(repr(e))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(rows) for rows in batches))
+    elapsed = time.perf_counter() - started
+
+    await buffer.stop()
+    await queue.stop()
+    return {
+        "submitted": sum(len(rows) for rows in batches),
+        "elapsed": elapsed,
+        "errors": errors,
+        "buffer": buffer.stats(),
+    }
+
+
+def upload_process(index: int, batches: list, concurrency: int, results):
+    results.put((index, asyncio.run(_upload(batches, concurrency))))
+
+
+def prepare(readings: int, in_order: bool = False) -> int:
+    """Store a closed session over the stream's middle (and, unless in order, the on-site unit's newest reading)"""
+    from models.database import SessionLocal
+    from models.sensor import IrrigationSession
+    from services.ingest_buffer import IngestBuffer
+    from services.water_ledger import WaterLedgerService
+
+    if not in_order:
+        IngestBuffer(log_path=os.devnull)._write_batch([reading("borewell-1", readings - 1)])
+    db = SessionLocal()
+    try:
+        started_at = STREAM_START + STEP * (readings // 4)
+        ended_at = STREAM_START + STEP * (readings // 2)
+        session = IrrigationSession(
+            mode="normal", started_at=started_at, ended_at=ended_at,
+            duration_minutes=int((ended_at - started_at).total_seconds() / 60),
+            estimated_volume_liters=0.0, flow_volume_liters=0.0
+        )
+        db.add(session)
+        db.flush()
+        WaterLedgerService(db).record_session(session)
+        db.commit()
+        return session.id
+    finally:
+        db.close()
+
+
+def check(devices: int, readings: int, session_id: int) -> list:
+    from sqlalchemy import func
+    from models.database import SessionLocal
+    from models.sensor import DailyWaterUsage, IrrigationSession, SensorReading
+    from services.irrigation_service import IrrigationService
+
+    problems = []
+    db = SessionLocal()
+    try:
+        for device_id in device_ids(devices):
+            count, distinct = db.query(
+                func.count(SensorReading.id), func.count(func.distinct(SensorReading.device_seq))
+            ).filter(SensorReading.device_id == device_id).one()
+            if count != readings or distinct != readings:
+                problems.append(f"{device_id}: {count} rows, {distinct} distinct seqs (expected {readings})")
+            seqs = [seq for seq, in db.query(SensorReading.device_seq).filter(
+                SensorReading.device_id == device_id
+            ).order_by(SensorReading.timestamp)]
+            if seqs != sorted(seqs):
+                problems.append(f"{device_id}: timestamp order differs from sequence order")
+
+        session = db.get(IrrigationSession, session_id)
+        corrected = (session.estimated_volume_liters, session.flow_volume_liters)
+        ledger = db.query(DailyWaterUsage.water_liters).scalar()
+        asyncio.run(IrrigationService(db).recompute_session_volumes())
+        db.refresh(session)
+        expected = (session.estimated_volume_liters, session.flow_volume_liters)
+        expected_ledger = db.query(DailyWaterUsage.water_liters).scalar()
+        print(f"session volume after ingest {corrected[0]} L, full recompute {expected[0]} L; "
+              f"ledger {ledger} L vs {expected_ledger} L")
+        if corrected != expected or ledger != expected_ledger:
+            problems.append("ingested readings did not correct the irrigation session and its ledger day")
+    finally:
+        db.close()
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upload duplicated, reordered reading batches from several processes")
+    parser.add_argument("--processes", type=int, default=3, help="Concurrent API-like processes")
+    parser.add_argument("--devices", type=int, default=4)
+    parser.add_argument("--readings", type=int, default=2000, help="Readings per device")
+    parser.add_argument("--batch", type=int, default=50, help="Readings per upload")
+    parser.add_argument("--resend", type=float, default=0.5, help="Chance each batch goes to one more process")
+    parser.add_argument("--concurrency", type=int, default=20, help="Uploads in flight per process")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--in-order", action="store_true",
+                        help="One process uploads every stream in order (no late readings)")
+    args = parser.parse_args()
+    if args.in_order:
+        args.processes = 1
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Children inherit the environment, so every process shares this database
+        os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'stress_ingest.db')}"
+        os.environ["INGEST_LOG_PATH"] = os.path.join(tmp, "ingest_buffer.log")
+        os.environ["CONTROL_LOCK_PATH"] = os.path.join(tmp, "irrigation_control.lock")
+
+        from models.migrations import init_db
+        init_db()
+        session_id = prepare(args.readings, args.in_order)
+
+        uploads = plan(args.devices, args.readings, args.batch, args.processes, args.resend, args.seed,
+                       args.in_order)
+        context = multiprocessing.get_context("spawn")
+        results = context.Queue()
+        processes = [
+            context.Process(target=upload_process, args=(index, batches, args.concurrency, results))
+            for index, batches in enumerate(uploads)
+        ]
+        started = time.perf_counter()
+        for process in processes:
+            process.start()
+        outcomes = dict(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+        elapsed = time.perf_counter() - started
+
+        problems = check(args.devices, args.readings, session_id)
+
+    submitted = stored = 0
+    for index in sorted(outcomes):
+        outcome = outcomes[index]
+        stats = outcome["buffer"]
+        submitted += outcome["submitted"]
+        stored += stats["flushed_rows"]
+        print(f"process {index}: {outcome['submitted']} submitted in {outcome['elapsed']:.1f}s, "
+              f"{stats['flushed_rows']} stored, {stats['duplicate_rows']} duplicates, {stats['late_rows']} late, "
+              f"{stats['session_reintegrations']} session reintegrations, {stats['write_retries']} write retries")
+        problems.extend(outcome["errors"][:5])
+
+    expected = args.devices * args.readings - (0 if args.in_order else 1)  # One was stored up front
+    print(f"{submitted} readings ({submitted - expected} duplicates) in {elapsed:.1f}s, "
+          f"{submitted / elapsed:,.0f} readings/s")
+    if stored != expected:
+        problems.append(f"{stored} readings stored (expected {expected})")
+
+    for problem in problems:
+        print(f"✗ {problem}")
+    if not problems:
+        print("✓ every reading stored once, in order, with sessions corrected")
+    sys.exit(1 if problems else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Sensor tick worker for RootGuard Bot
+
+Runs the tick pipeline and the other periodic jobs on the scheduler. The tick
+generates a reading (and its health score). The reading feed publishes it,
+and every reading devices uploaded to any API process, on the event bus,
+where auto-irrigation, alerts and anomaly detection consume them
+concurrently, each with its own session. Auto-irrigation is critical: the
+tick waits for it, and it goes through the same control queue as the API's
+control commands, so the two never interleave. Only one process may run it
+at a time: the worker holds an OS file lock for as long as it is alive, so
+API processes started with several uvicorn/gunicorn workers stay pure
+readers.
+
+Embedded mode (default, SENSOR_WORKER=embedded): every API worker competes for
+the lock and the winner runs the tick loop; the others retry periodically and
+take over if the leader dies.
+
+External mode (SENSOR_WORKER=external): API workers never tick; run this
+module as its own process instead:
+
+    python worker.py
+"""
+import asyncio
+import os
+import signal
+
+from models.database import SessionLocal
+from models.sensor import DEFAULT_DEVICE_ID
+from services.sensor_service import SensorService
+from services.alert_service import ARCHIVE_BATCH, AlertService
+from services.irrigation_service import IrrigationService
+from services.process_lock import ProcessLock
+from services.ingest_buffer import get_ingest_buffer
+from services.settings_service import refresh_rules
+from services.anomaly_service import AnomalyService, get_anomaly_detector
+from services.notification_service import get_notification_dispatcher
+from services.control_queue import get_control_queue
+from services.scheduler import Scheduler, get_scheduler
+from services.event_bus import EventBus, ReadingStored, get_event_bus
+from services.reading_feed import get_reading_feed
+from services.tracing import get_tracer
+
+TICK_INTERVAL_SECONDS = 5
+READING_FEED_SECONDS = 1  # Uploaded readings reach the bus within this
+LEADER_RETRY_SECONDS = 15
+RULES_REFRESH_SECONDS = 30
+ALERT_ARCHIVE_SECONDS = 300
+TASK_SHUTDOWN_SECONDS = 6  # These two within the API's SHUTDOWN_TIMEOUT_SECONDS
+BUS_SHUTDOWN_SECONDS = 3
+LOCK_PATH = os.getenv("SENSOR_WORKER_LOCK", "./sensor_worker.lock")
+
+
+def get_worker_mode() -> str:
+    """Return 'embedded' or 'external' from the SENSOR_WORKER environment variable"""
+    mode = os.getenv("SENSOR_WORKER", "embedded").lower()
+    return mode if mode in ("embedded", "external") else "embedded"
+
+
+async def run_tick():
+    """Run one iteration of the sensor pipeline"""
+    # Create a new session for each iteration to ensure proper cleanup
+    db = SessionLocal()
+    try:
+        # Generate and store sensor data (and the health score)
+        with get_tracer().span("tick.generate"):
+            await SensorService(db).generate_sensor_reading()
+    finally:
+        # Always close the session
+        db.close()
+
+    # Publishes it (after any uploads committed before it); returns once
+    # auto-irrigation has run, alerts and anomalies follow concurrently
+    await get_reading_feed().poll()
+
+
+async def publish_readings():
+    """Publish readings uploaded since the last tick or poll"""
+    await get_reading_feed().poll()
+
+
+def _current_on_site(event: ReadingStored) -> bool:
+    """Pump control and farm alerts follow the on-site unit's newest reading only"""
+    return event.latest and event.reading.device_id == DEFAULT_DEVICE_ID
+
+
+async def check_auto_irrigation(event: ReadingStored):
+    if not _current_on_site(event):
+        return
+    # Serialized with control commands from the API
+    with get_tracer().span("tick.auto_irrigation"):
+        await get_control_queue().submit(
+            lambda control_db: IrrigationService(control_db).check_auto_irrigation(event.reading)
+        )
+
+
+async def check_alerts(event: ReadingStored):
+    if not _current_on_site(event):
+        return
+    db = SessionLocal()
+    try:
+        with get_tracer().span("tick.alerts"):
+            await SensorService(db).check_and_create_alerts(event.reading)
+    finally:
+        db.close()
+
+
+async def detect_anomalies(event: ReadingStored):
+    # Streaming detectors (per device) see readings in commit order on this subscriber's task
+    db = SessionLocal()
+    try:
+        with get_tracer().span("tick.anomalies"):
+            await AnomalyService(db).process_reading(event.reading)
+    finally:
+        db.close()
+
+
+def subscribe_tick_consumers(bus: EventBus):
+    """Register the tick's reading consumers (once per process)"""
+    if bus.subscribers.get(ReadingStored):
+        return
+    bus.subscribe(ReadingStored, "auto_irrigation", check_auto_irrigation, priority=0, critical=True)
+    bus.subscribe(ReadingStored, "alerts", check_alerts, priority=10)
+    # A detector that falls behind skips readings rather than holding up the tick
+    bus.subscribe(ReadingStored, "anomalies", detect_anomalies, priority=20, overflow="drop_oldest")
+
+
+def reload_rules():
+    """Pick up threshold changes made through the settings API"""
+    db = SessionLocal()
+    try:
+        refresh_rules(db)
+    finally:
+        db.close()
+
+
+async def archive_alerts():
+    """Move dismissed and resolved alerts out of the active alerts table"""
+    db = SessionLocal()
+    try:
+        service = AlertService(db)
+        # One short transaction per batch, letting the tick in between
+        while service.archive() == ARCHIVE_BATCH:
+            await asyncio.sleep(0)
+    finally:
+        db.close()
+
+
+def checkpoint_detectors():
+    """Save anomaly detector state so a restart resumes where it left off"""
+    db = SessionLocal()
+    try:
+        detector = get_anomaly_detector()
+        if detector.loaded:
+            detector.checkpoint(db)
+            db.commit()
+    except Exception as e:
+        print(f"Anomaly checkpoint error: {e}")
+    finally:
+        db.close()
+
+
+def schedule_worker_tasks(scheduler: Scheduler):
+    """Register the leader's periodic jobs (once per process)"""
+    if "sensor_tick" in scheduler.tasks:
+        return
+    scheduler.add("sensor_tick", run_tick, TICK_INTERVAL_SECONDS)
+    scheduler.add("reading_feed", publish_readings, READING_FEED_SECONDS)
+    # Rules are cached in memory; only check the settings version now and then
+    scheduler.add("rules_refresh", reload_rules, RULES_REFRESH_SECONDS, jitter=1.0,
+                  initial_delay=RULES_REFRESH_SECONDS)
+    scheduler.add("alert_archive", archive_alerts, ALERT_ARCHIVE_SECONDS, jitter=5.0, initial_delay=30)
+
+
+async def run_as_leader(lock: ProcessLock, stop: asyncio.Event):
+    """Wait until this process holds the worker lock, then run the scheduled jobs"""
+    while not lock.acquire():
+        if await _wait(stop, LEADER_RETRY_SECONDS):
+            return
+
+    print(f"Sensor worker leader elected (pid {os.getpid()})")
+    scheduler = get_scheduler()
+    bus = get_event_bus()
+    try:
+        reload_rules()
+        subscribe_tick_consumers(bus)
+        await bus.start()
+        get_reading_feed().start()
+        schedule_worker_tasks(scheduler)
+        await scheduler.start()
+        await stop.wait()
+    finally:
+        # Running jobs finish; nothing new starts, then consumers handle what is queued
+        await scheduler.stop(TASK_SHUTDOWN_SECONDS)
+        await bus.stop(BUS_SHUTDOWN_SECONDS)
+        checkpoint_detectors()
+        lock.release()
+
+
+async def _wait(stop: asyncio.Event, timeout: float) -> bool:
+    """Sleep up to `timeout` seconds; return True if `stop` was set"""
+    try:
+        await asyncio.wait_for(stop.wait(), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
+
+
+async def main():
+    from models.migrations import init_db
+    init_db()
+
+    buffer = get_ingest_buffer()
+    await buffer.start()
+    dispatcher = get_notification_dispatcher()
+    await dispatcher.start()
+    control_queue = get_control_queue()
+    await control_queue.start()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except NotImplementedError:
+            pass  # Windows: Ctrl+C raises KeyboardInterrupt instead
+
+    lock = ProcessLock(LOCK_PATH)
+    if not lock.acquire():
+        print(f"Another sensor worker holds {lock.path}; waiting to take over")
+    try:
+        await run_as_leader(lock, stop)
+    finally:
+        # Drain buffered readings before exiting
+        await control_queue.stop()
+        await buffer.stop()
+        await dispatcher.stop()
+        get_tracer().exporter.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\n👋 Sensor worker stopped")
@@ -117,6 +117,12 @@ const resources = {
         alert_auto_irrigation_stopped: "Auto-irrigation stopped: {{reason}}",
         alert_survival_irrigation_stopped: "Survival irrigation stopped: {{reason}}",
         alert_survival_mode_switch: "Automatically switched to SURVIVAL mode - Low water resources detected",
+        alert_anomaly_flow_drop: "Pump flow drifting down: {{value}} L/min (usually ~{{expected}}) - Check pump and pipes",
+        alert_anomaly_flow_rise: "Unusual rise in flow: {{value}} L/min (usually ~{{expected}}) - Check for leaks",
+        alert_anomaly_water_drop: "Borewell water level falling faster than usual: {{value}}% (usually ~{{expected}}%)",
+        alert_anomaly_water_rise: "Unusual rise in water level: {{value}}% (usually ~{{expected}}%)",
+        alert_anomaly_vibration: "Pump vibration spiking more often than usual (normally {{rate}}% of readings) - Check pump motor",
+        alert_legacy: "{{text}}",
         reason_low_moisture: "Low soil moisture: {{moisture}}%",
         reason_critical_moisture_survival: "Critical soil moisture in survival mode: {{moisture}}%",
         reason_moisture_sufficient: "Soil moisture sufficient ({{moisture}}%)",
@@ -274,6 +280,12 @@ const resources = {
         alert_auto_irrigation_stopped: "தானியங்கி பாசனம் நின்றது: {{reason}}",
         alert_survival_irrigation_stopped: "சிக்கன பாசனம் நின்றது: {{reason}}",
         alert_survival_mode_switch: "தானாகவே சிக்கன முறைக்கு மாறியது - குறைந்த நீர் வளம்",
+        alert_anomaly_flow_drop: "பம்ப் நீரோட்டம் படிப்படியாக குறைகிறது: {{value}} L/min (வழக்கமாக ~{{expected}}) - பம்ப் மற்றும் குழாய்களை பார்க்கவும்",
+        alert_anomaly_flow_rise: "நீரோட்டத்தில் அசாதாரண உயர்வு: {{value}} L/min (வழக்கமாக ~{{expected}}) - கசிவை பார்க்கவும்",
+        alert_anomaly_water_drop: "கிணற்று நீர் மட்டம் வழக்கத்தை விட வேகமாக குறைகிறது: {{value}}% (வழக்கமாக ~{{expected}}%)",
+        alert_anomaly_water_rise: "நீர் மட்டத்தில் அசாதாரண உயர்வு: {{value}}% (வழக்கமாக ~{{expected}}%)",
+        alert_anomaly_vibration: "பம்ப் அதிர்வு வழக்கத்தை விட அடிக்கடி அதிகரிக்கிறது (வழக்கமாக {{rate}}%) - மோட்டாரை பார்க்கவும்",
+        alert_legacy: "{{text}}",
         reason_low_moisture: "குறைந்த மண் ஈரம்: {{moisture}}%",
         reason_critical_moisture_survival: "ஆபத்தான மண் ஈரம்: {{moisture}}%",
         reason_moisture_sufficient: "மண் ஈரம் போதுமானது ({{moisture}}%)",
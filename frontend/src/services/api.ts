@@ -21,14 +21,19 @@ export interface IrrigationStatus {
   is_irrigating: boolean;
   auto_mode: boolean;
   last_updated: string;
+  version: number;
 }
 
 export interface Alert {
   id: number;
   alert_type: 'critical' | 'warning' | 'info';
+  alert_key: string;
+  params: Record<string, unknown>;
   message: string;
   created_at: string;
   is_dismissed: boolean;
+  dismissed_at?: string;
+  resolved_at?: string;
   irrigation_session_id?: number;
 }
 
@@ -42,6 +47,21 @@ export interface IrrigationSession {
   trigger_reason?: string;
 }
 
+export interface SensorReading extends SensorData {
+  id: number;
+  device_id: string;
+  device_seq: number | null;
+}
+
+export interface SyncResult {
+  token: number;
+  full: boolean; // Snapshot: replace cached lists instead of merging
+  has_more: boolean;
+  readings: SensorReading[];
+  alerts: Alert[];
+  sessions: IrrigationSession[];
+}
+
 class ApiService {
   private baseUrl: string;
 
@@ -103,6 +123,7 @@ class ApiService {
     mode?: 'normal' | 'survival' | 'manual' | 'off';
     is_irrigating?: boolean;
     auto_mode?: boolean;
+    expected_version?: number;
   }) {
     return this.request<IrrigationStatus>('/api/irrigation/control', {
       method: 'POST',
@@ -121,11 +142,25 @@ class ApiService {
     });
   }
 
+  // Every active alert matching all given filters, in one request
+  dismissAlerts(filter: { ids?: number[]; alert_key?: string; alert_type?: Alert['alert_type']; since?: string; until?: string }) {
+    return this.request<{ dismissed: number }>('/api/alerts/dismiss', {
+      method: 'POST',
+      body: JSON.stringify(filter),
+    });
+  }
+
   // Irrigation history
   getIrrigationHistory(limit: number = 10) {
     return this.request<IrrigationSession[]>(`/api/irrigation/history?limit=${limit}`);
   }
 
+  // Delta sync: pass the token from the previous result, none on first load
+  sync(since?: number, limit: number = 500) {
+    const query = since === undefined ? `limit=${limit}` : `since=${since}&limit=${limit}`;
+    return this.request<SyncResult>(`/api/sync?${query}`);
+  }
+
   // Analytics endpoints
   getWaterUsageStats(days: number = 7) {
     return this.request<any>(`/api/analytics/water-usage?days=${days}`);